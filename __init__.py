@@ -4,6 +4,91 @@ import logging
 logger = logging.getLogger(__name__)
 
 
+def parse_mikrotik_config(mikrotik_config):
+    """Parse one router's settings from its config section, applying defaults."""
+    from utils import str_to_bool
+
+    return {
+        "router_ip": mikrotik_config.get("router_ip"),
+        "username": mikrotik_config.get("username"),
+        "password": mikrotik_config.get("password"),
+        "use_ssl": str_to_bool(mikrotik_config.get("use_ssl", "True")),
+        "ssl_verify": str_to_bool(mikrotik_config.get("ssl_verify", "True")),
+        "transport": mikrotik_config.get("transport", "rest").lower(),
+        "api_port": int(mikrotik_config["api_port"]) if mikrotik_config.get("api_port") else None,
+        "pipeline_window": int(mikrotik_config.get("pipeline_window", "100")),
+        "remove_batch_size": int(mikrotik_config.get("remove_batch_size", "500")),
+        "script_threshold": int(mikrotik_config.get("script_threshold", "1000")),
+        "script_chunk_size": int(mikrotik_config.get("script_chunk_size", "500")),
+        "concurrency_min": int(mikrotik_config.get("concurrency_min", "2")),
+        "concurrency_max": int(mikrotik_config.get("concurrency_max", "32")),
+        "concurrency_initial": int(mikrotik_config.get("concurrency_initial", "10")),
+        "latency_target": int(mikrotik_config.get("latency_target_ms", "500")) / 1000,
+        "max_retries": int(mikrotik_config.get("max_retries", "3")),
+        "retry_backoff": int(mikrotik_config.get("retry_backoff_ms", "500")) / 1000,
+        "sites": [site.strip() for site in mikrotik_config.get("sites", "").split(",") if site.strip()] or None,
+        "aggregate_lists": [
+            list_name.strip() for list_name in mikrotik_config.get("aggregate_lists", "").split(",") if list_name.strip()
+        ],
+    }
+
+
+def parse_mikrotik_routers(parser):
+    """Parse the routers to sync, keyed by name.
+
+    Each `[MIKROTIK <name>]` section is a router, taking any setting it does not set from `[MIKROTIK]`.
+    Without named sections, `[MIKROTIK]` itself is the only router, named "default".
+    """
+    mikrotik_config = dict(parser["MIKROTIK"])
+    routers = {}
+    for section in parser.sections():
+        if section.startswith("MIKROTIK "):
+            routers[section[len("MIKROTIK ") :].strip()] = parse_mikrotik_config({**mikrotik_config, **dict(parser[section])})
+    return routers or {"default": parse_mikrotik_config(mikrotik_config)}
+
+
+def parse_managed_lists(parser, all_list_statuses=None):
+    """Parse the address lists to manage and the service statuses that place a client on each.
+
+    Each `[LIST <name>]` section is a list. `statuses` names the service statuses that put a client on
+    it, or `*` for every status. Lists with `move = True` move a client's entry in place when its status
+    changes from one to another, so no two of them may share a status. Without list sections, the lists
+    in `constants` are used, with `all_list_statuses` for the all clients list.
+    Returns:
+        tuple: Mapping of list name to status names, or None for every status, and the move list names.
+    """
+    from constants import list_statuses, all_list_name, move_list_names, service_status_map_reverse
+    from utils import str_to_bool
+
+    managed_lists = {}
+    move_lists = []
+    for section in parser.sections():
+        if not section.startswith("LIST "):
+            continue
+        list_name = section[len("LIST ") :].strip()
+        list_config = dict(parser[section])
+        statuses = [status.strip() for status in list_config.get("statuses", "").split(",") if status.strip()]
+        if not statuses:
+            raise Exception(f"List '{list_name}' has no statuses, use '*' for every status")
+        if statuses == ["*"]:
+            statuses = None
+        for status in statuses or []:
+            if status not in service_status_map_reverse:
+                raise Exception(f"Unknown service status '{status}' for list '{list_name}'")
+        managed_lists[list_name] = statuses
+        if str_to_bool(list_config.get("move", "False")):
+            # A client is on at most one move list, so a status change is one unambiguous move
+            for other_name in move_lists:
+                other_statuses = managed_lists[other_name]
+                if statuses is None or other_statuses is None or set(statuses) & set(other_statuses):
+                    raise Exception(f"Move lists '{other_name}' and '{list_name}' share statuses, move lists must not overlap")
+            move_lists.append(list_name)
+
+    if not managed_lists:
+        return {**list_statuses, all_list_name: all_list_statuses}, tuple(move_list_names)
+    return managed_lists, tuple(move_lists)
+
+
 class UISPMikroTikSyncConfig:
     """configuration for uisp-mikrotik-sync module"""
 
@@ -25,12 +110,45 @@ class UISPMikroTikSyncConfig:
         uisp_crm_token = uisp_config.get("crm_token")
         uisp_fqdn = uisp_config.get("server_fqdn")
         uisp_use_ssl = str_to_bool(uisp_config.get("use_ssl", "True"))
+        ucrm_page_size = int(uisp_config.get("page_size", "0"))
+        all_list_statuses = [
+            status.strip() for status in uisp_config.get("all_list_statuses", "").split(",") if status.strip()
+        ] or None
+        managed_list_statuses, move_list_names = parse_managed_lists(parser, all_list_statuses)
+        fallback_pool = uisp_config.get("fallback_pool", "192.0.0.0/24")
+        fallback_file = uisp_config.get("fallback_file", "./data/fallback_ips.json")
+        exclude_fallback_ips = str_to_bool(uisp_config.get("exclude_fallback_ips", "False"))
+        device_roles = [role.strip() for role in uisp_config.get("device_roles", "").split(",") if role.strip()]
         ssl_verify = str_to_bool(mikrotik_config.get("ssl_verify"))
         mt_use_ssl = str_to_bool(mikrotik_config.get("use_ssl"))
         disable_ssl_warning = str_to_bool(mikrotik_config.get("disable_ssl_warning"))
         mt_ip = mikrotik_config.get("router_ip")
         mt_username = mikrotik_config.get("username")
         mt_password = mikrotik_config.get("password")
+        mikrotik_routers = parse_mikrotik_routers(parser)
+
+        http_config = dict(parser["HTTP"]) if parser.has_section("HTTP") else {}
+        http_pool_size = int(http_config.get("pool_size", "10"))
+        http_keep_alive = str_to_bool(http_config.get("keep_alive", "True"))
+        http_connect_timeout = float(http_config.get("connect_timeout", "10"))
+        http_read_timeout = float(http_config.get("read_timeout", "120"))
+
+        cache_config = dict(parser["CACHE"]) if parser.has_section("CACHE") else {}
+        cache_enabled = str_to_bool(cache_config.get("enabled", "False"))
+        cache_directory = cache_config.get("directory", "./cache")
+        cache_max_size = int(cache_config.get("max_size_mb", "100")) * 1024 * 1024
+        cache_ttls = {key[len("ttl_") :]: int(value) for key, value in cache_config.items() if key.startswith("ttl_")}
+
+        snapshot_config = dict(parser["SNAPSHOT"]) if parser.has_section("SNAPSHOT") else {}
+        snapshot_enabled = str_to_bool(snapshot_config.get("enabled", "False"))
+        snapshot_directory = snapshot_config.get("directory", "./data/snapshots")
+        snapshot_full_sync_every = int(snapshot_config.get("full_sync_every", "96"))
+
+        webhook_config = dict(parser["WEBHOOK"]) if parser.has_section("WEBHOOK") else {}
+        webhook_enabled = str_to_bool(webhook_config.get("enabled", "False"))
+        webhook_listen_address = webhook_config.get("listen_address", "0.0.0.0")
+        webhook_port = int(webhook_config.get("port", "8080"))
+        webhook_token = webhook_config.get("token") or None
     except Exception as err:
         logger.error(
             f"Error loading config from uisp.ini, ensure this file exists and has the proper variables. {err}"
@@ -13,10 +13,36 @@ class UISPClientAddress(ClientAddress):
     client_id: int
     service_id: int
     service_status: str
+    site_id: str
 
-    def __init__(self, ip_address, client_name, client_id, service_id, service_status):
+    def __init__(self, ip_address, client_name, client_id, service_id, service_status, site_id=None):
         super().__init__(ip_address)
         self.client_name = client_name
         self.client_id = client_id
         self.service_id = service_id
         self.service_status = service_status
+        self.site_id = site_id
+
+    @property
+    def comment(self):
+        """Comment for this service's address-list entries."""
+        return f"{self.client_name} - {self.client_id}_{self.service_id}"
+
+
+class UISPAddressBlock(ClientAddress):
+    """A prefix covering the addresses of several UISP services, stored as one address-list entry."""
+
+    members: list
+    service_status: str
+
+    def __init__(self, ip_address, members):
+        super().__init__(ip_address)
+        self.members = members
+        statuses = {member.service_status for member in members}
+        # Blocks are built per list, so members normally share a status
+        self.service_status = statuses.pop() if len(statuses) == 1 else None
+
+    @property
+    def comment(self):
+        """Comment for the block's address-list entry."""
+        return f"Aggregate of {len(self.members)} services"
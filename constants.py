@@ -31,3 +31,13 @@ ucrm_api_version = "v1.0"
 active_list_name = "clients_active"
 suspended_list_name = "clients_suspended"
 all_list_name = "clients_all"
+
+# Service statuses that place a client on each managed list. None means every status.
+list_statuses = {
+    active_list_name: ["active"],
+    suspended_list_name: ["suspended"],
+    all_list_name: None,
+}
+
+# Lists whose entries move in place when a service changes between them
+move_list_names = (active_list_name, suspended_list_name)
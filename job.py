@@ -3,7 +3,7 @@ import configparser
 import schedule
 import time
 import logging
-from uisp_mikrotik_address_list_sync import sync_addresses
+from uisp_mikrotik_address_list_sync import module_config, start_webhook_receiver, sync_addresses
 
 config = configparser.ConfigParser()
 config.read("uisp.ini")
@@ -17,6 +17,10 @@ logging.basicConfig(
 logging.info("UISP to Mikrotik Address List Sync app started successfully...")
 print("UISP to Mikrotik Address List Sync app started successfully...")
 
+# Apply UCRM webhook events as they arrive, full syncs remain the safety net
+if module_config.webhook_enabled:
+    start_webhook_receiver()
+
 # Schedule the job every 5 minutes
 schedule.every(interval).minutes.do(sync_addresses)
 
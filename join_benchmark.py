@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Benchmark for joining UCRM clients and services with NMS devices.
+
+Compares the indexed join used by `load_uisp_addresses` against the
+per-client linear lookups it replaced, from 1k up to 100k clients.
+"""
+
+import time
+import logging
+from utils import (
+    lookup_client_ip,
+    lookup_service_id,
+    lookup_service_status,
+    join_client_addresses,
+)
+
+# Keep per-client warnings out of the timings
+logging.basicConfig(level=logging.ERROR)
+logger = logging.getLogger(__name__)
+
+# The linear lookups are O(clients x (services + devices)); beyond this they take minutes
+LINEAR_MAX_CLIENTS = 5000
+
+
+def create_mock_dataset(count, services_per_client=1):
+    """Create matching clients, services and devices for `count` clients, each service at its own site."""
+    clients = []
+    services = []
+    devices = []
+    for i in range(count):
+        clients.append({"id": i, "firstName": "Client", "lastName": str(i)})
+        for j in range(services_per_client):
+            n = i * services_per_client + j
+            services.append({"id": n, "clientId": i, "status": 1, "unmsClientSiteId": f"site-{n}"})
+            devices.append(
+                {
+                    "id": f"device-{n}",
+                    "identification": {"name": f"Device-{n}", "site": {"id": f"site-{n}"}},
+                    "ipAddress": f"10.{(n >> 16) & 255}.{(n >> 8) & 255}.{n & 255}/32",
+                }
+            )
+    return clients, services, devices
+
+
+def linear_join(clients, services, devices):
+    """Resolve every client with the list-scanning lookups."""
+    resolved = 0
+    for client in clients:
+        ip = lookup_client_ip(devices=devices, services=services, client_id=client["id"])
+        service_id = lookup_service_id(services=services, client_id=client["id"])
+        status = lookup_service_status(services=services, client_id=client["id"])
+        if ip is not None and service_id is not None and status is not None:
+            resolved += 1
+    return resolved
+
+
+def indexed_join(clients, services, devices):
+    """Resolve every service of every client with the indexed join."""
+    return len(join_client_addresses(clients=clients, services=services, devices=devices))
+
+
+def time_call(func, *args):
+    """Return the result and elapsed seconds for a call."""
+    start_time = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start_time
+
+
+def main():
+    """Main join benchmark function."""
+    print("=" * 60)
+    print("UISP Client Join Benchmark")
+    print("=" * 60)
+
+    test_sizes = [1000, 5000, 10000, 50000, 100000]
+
+    for size in test_sizes:
+        print(f"\nTesting with {size} clients:")
+        print("-" * 40)
+
+        clients, services, devices = create_mock_dataset(size)
+
+        resolved, indexed_time = time_call(indexed_join, clients, services, devices)
+        print(f"Indexed join: {indexed_time:.4f} seconds ({resolved} services resolved)")
+
+        if size <= LINEAR_MAX_CLIENTS:
+            resolved, linear_time = time_call(linear_join, clients, services, devices)
+            print(f"Linear lookups: {linear_time:.4f} seconds ({resolved} clients resolved)")
+            print(f"Speedup: {linear_time / indexed_time:.1f}x")
+        else:
+            print(f"Linear lookups: skipped (quadratic, over {LINEAR_MAX_CLIENTS} clients)")
+
+    # Business customers with several services each
+    size = 100000
+    services_per_client = 3
+    print(f"\nTesting with {size} clients x {services_per_client} services:")
+    print("-" * 40)
+    clients, services, devices = create_mock_dataset(size, services_per_client=services_per_client)
+    resolved, indexed_time = time_call(indexed_join, clients, services, devices)
+    print(f"Indexed join: {indexed_time:.4f} seconds ({resolved} services resolved)")
+
+
+if __name__ == "__main__":
+    main()
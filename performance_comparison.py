@@ -47,7 +47,7 @@ def simulate_individual_operations(api, addresses_to_add, addresses_to_remove):
     start_time = time.time()
     
     # Mock the individual operations to avoid real network calls
-    with patch('utils.base.requests.request') as mock_request:
+    with patch('utils.base.requests.Session.request') as mock_request:
         mock_response = Mock()
         mock_response.status_code = 200
         mock_response.json.return_value = []
@@ -121,7 +121,7 @@ def main():
         addresses_to_remove = create_mock_remove_addresses(size)
         
         # Mock the API calls to avoid actual network requests
-        with patch('utils.base.requests.request') as mock_request:
+        with patch('utils.base.requests.Session.request') as mock_request:
             mock_response = Mock()
             mock_response.status_code = 200
             mock_response.json.return_value = []
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Benchmark for the plan and apply phases of a sync cycle.
+
+Times computing the change plan for a synthetic UISP dataset against a router
+that already holds most of it, writes the plan file, then replays the loaded
+plan against a local fake router over the RouterOS API, so plan computation
+and router I/O are measured separately.
+"""
+
+import os
+import tempfile
+import time
+import logging
+from classes.uisp import UISPClientAddress
+from constants import list_statuses, all_list_name, move_list_names
+from tests.fake_routeros import FakeRouterOS
+from utils.routeros import MikroTikRouterOSApi
+from utils.sync import (
+    index_desired_entries,
+    index_router_entries,
+    plan_sync,
+    apply_sync_plan,
+    summarize_plan,
+    save_plans,
+    load_plans,
+)
+
+# Keep per-batch info logs out of the timings
+logging.basicConfig(level=logging.ERROR)
+logger = logging.getLogger(__name__)
+
+MANAGED_LISTS = {**list_statuses, all_list_name: None}
+
+# Share of clients that change between cycles: new, removed, or between active and suspended
+CHURN = 0.02
+
+
+def create_mock_addresses(count, offset=0):
+    """Create `count` services, every tenth one suspended."""
+    return [
+        UISPClientAddress(
+            ip_address=f"10.{(i >> 16) & 255}.{(i >> 8) & 255}.{i & 255}",
+            client_name=f"Client {i}",
+            client_id=i,
+            service_id=100000 + i,
+            service_status="suspended" if i % 10 == 0 else "active",
+        )
+        for i in range(offset, offset + count)
+    ]
+
+
+def load_router(router, addresses):
+    """Put the entries for `addresses` straight into the fake router's table."""
+    for (list_name, ip_address), comment in index_desired_entries(addresses, MANAGED_LISTS).items():
+        router.add_entry(list_name, ip_address, comment)
+
+
+def run(count):
+    """Plan and apply one cycle with `count` clients. Returns plan, save, load and apply seconds and the summary."""
+    churned = int(count * CHURN)
+    router = FakeRouterOS().start()
+    host, port = router.address
+    api = MikroTikRouterOSApi(base_url=host, port=port, username="admin", password="password", use_ssl=False)
+    # The router holds last cycle's clients; this cycle drops and adds `churned` of them and flips the status of others
+    load_router(router, create_mock_addresses(count))
+    addresses = create_mock_addresses(count - churned, offset=churned) + create_mock_addresses(churned, offset=count)
+    for address in addresses[:churned]:
+        address.service_status = "active" if address.service_status == "suspended" else "suspended"
+    router_lists = api.get_address_lists(list(MANAGED_LISTS))
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "plan.json")
+        try:
+            start_time = time.perf_counter()
+            desired = index_desired_entries(addresses, MANAGED_LISTS)
+            plan = plan_sync(desired, index_router_entries(router_lists), MANAGED_LISTS, move_list_names)
+            plan_time = time.perf_counter() - start_time
+
+            start_time = time.perf_counter()
+            save_plans(path, {"default": plan}, {"default": plan_time})
+            save_time = time.perf_counter() - start_time
+
+            start_time = time.perf_counter()
+            loaded = load_plans(path)["default"]
+            load_time = time.perf_counter() - start_time
+
+            start_time = time.perf_counter()
+            apply_sync_plan(api, loaded)
+            apply_time = time.perf_counter() - start_time
+        finally:
+            api.client.close()
+            router.stop()
+        plan_size = os.path.getsize(path)
+    return plan_time, save_time, load_time, apply_time, plan_size, summarize_plan(plan)
+
+
+def main():
+    """Main plan/apply benchmark function."""
+    print("=" * 60)
+    print("Sync Plan and Apply Benchmark")
+    print(f"Churn per cycle: {CHURN:.0%} of clients")
+    print("=" * 60)
+
+    test_sizes = [1000, 5000, 10000]
+
+    for size in test_sizes:
+        print(f"\nTesting with {size} clients:")
+        print("-" * 40)
+
+        plan_time, save_time, load_time, apply_time, plan_size, summary = run(size)
+        for list_name, counts in summary.items():
+            print(f"{list_name}: +{counts['add']} -{counts['remove']} moved in {counts['move']}")
+        print(f"Plan: {plan_time:.4f}s")
+        print(f"Plan file: {plan_size / 1024:.1f} KiB, save {save_time:.4f}s, load {load_time:.4f}s")
+        print(f"Apply (replayed from file): {apply_time:.4f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Benchmark for the RouterOS API transport.
+
+Adds and removes address-list entries on a local fake router that delays every
+round trip, comparing pipelined commands against one command per round trip
+(the pattern each REST request follows).
+"""
+
+import time
+import logging
+from tests.fake_routeros import FakeRouterOS
+from utils.routeros import MikroTikRouterOSApi
+
+# Keep per-batch info logs out of the timings
+logging.basicConfig(level=logging.ERROR)
+logger = logging.getLogger(__name__)
+
+# Simulated network round trip to the router, in seconds
+ROUND_TRIP = 0.002
+
+
+def create_mock_addresses(count):
+    """Create address-list entries for `count` clients."""
+    return [
+        {"ip_address": f"10.{(i >> 16) & 255}.{(i >> 8) & 255}.{i & 255}", "list_name": "clients_all", "comment": f"Client {i}"}
+        for i in range(count)
+    ]
+
+
+def run(count, pipeline_window):
+    """Add then remove `count` entries. Returns elapsed seconds for the add and the remove."""
+    router = FakeRouterOS(rtt=ROUND_TRIP).start()
+    host, port = router.address
+    api = MikroTikRouterOSApi(
+        base_url=host, port=port, username="admin", password="password", use_ssl=False, pipeline_window=pipeline_window
+    )
+    addresses = create_mock_addresses(count)
+    try:
+        start_time = time.perf_counter()
+        api.bulk_add_addresses_to_list(addresses)
+        add_time = time.perf_counter() - start_time
+
+        start_time = time.perf_counter()
+        to_remove = [{"entry_id": entry[".id"]} for entry in api.get_address_list(list_name="clients_all")]
+        api.bulk_remove_addresses_from_list(to_remove)
+        remove_time = time.perf_counter() - start_time
+    finally:
+        api.client.close()
+        router.stop()
+    return add_time, remove_time
+
+
+def main():
+    """Main RouterOS API benchmark function."""
+    print("=" * 60)
+    print("RouterOS API Pipelining Benchmark")
+    print(f"Simulated round trip: {ROUND_TRIP * 1000:.0f} ms")
+    print("=" * 60)
+
+    test_sizes = [100, 500, 1000]
+
+    for size in test_sizes:
+        print(f"\nTesting with {size} addresses:")
+        print("-" * 40)
+
+        serial_add, serial_remove = run(size, pipeline_window=1)
+        print(f"One per round trip: add {serial_add:.4f}s, remove {serial_remove:.4f}s")
+
+        pipelined_add, pipelined_remove = run(size, pipeline_window=100)
+        print(f"Pipelined (window 100): add {pipelined_add:.4f}s, remove {pipelined_remove:.4f}s")
+        print(f"Speedup: {(serial_add + serial_remove) / (pipelined_add + pipelined_remove):.1f}x")
+
+
+if __name__ == "__main__":
+    main()
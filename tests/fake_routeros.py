@@ -0,0 +1,177 @@
+"""Local stand-in for the RouterOS API, for tests and benchmarks.
+
+Speaks the binary RouterOS API protocol with tagged replies and keeps an in-memory
+/ip/firewall/address-list table. `rtt` adds a delay each time the server waits on the
+network, modelling the round trip a real router link adds to every request/response.
+"""
+import socketserver
+import threading
+import time
+
+from utils.routeros import encode_sentence, read_sentence
+
+
+class FakeRouterOS:
+    """In-memory RouterOS API server with an address-list table."""
+
+    def __init__(self, username="admin", password="password", rtt=0.0):
+        self.username = username
+        self.password = password
+        self.rtt = rtt
+        self.entries = {}
+        self.commands = []
+        self._next_id = 1
+        self._lock = threading.Lock()
+        self.server = None
+
+    @property
+    def address(self):
+        """Return the (host, port) the server is listening on."""
+        return self.server.server_address
+
+    def start(self):
+        """Start serving on a free local port."""
+        fake = self
+
+        class Handler(socketserver.BaseRequestHandler):
+            def handle(self):
+                fake.serve_connection(self.request)
+
+        socketserver.ThreadingTCPServer.allow_reuse_address = True
+        self.server = socketserver.ThreadingTCPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True).start()
+        return self
+
+    def stop(self):
+        """Stop serving."""
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+
+    def add_entry(self, list_name, address, comment=""):
+        """Add an entry directly to the table. Returns the entry."""
+        with self._lock:
+            entry_id = f"*{self._next_id:X}"
+            self._next_id += 1
+            entry = {
+                ".id": entry_id,
+                "list": list_name,
+                "address": address,
+                "comment": comment,
+                "creation-time": "2024-01-01 00:00:00",
+                "dynamic": "false",
+                "disabled": "false",
+            }
+            self.entries[entry_id] = entry
+            return entry
+
+    def serve_connection(self, sock):
+        """Read sentences from a client and answer them until it disconnects."""
+        buffer = bytearray()
+        logged_in = False
+
+        def read(length):
+            while len(buffer) < length:
+                chunk = sock.recv(65536)
+                if not chunk:
+                    raise ConnectionError("client closed")
+                if self.rtt:
+                    time.sleep(self.rtt)
+                buffer.extend(chunk)
+            data = bytes(buffer[:length])
+            del buffer[:length]
+            return data
+
+        try:
+            while True:
+                words = read_sentence(read)
+                if not words:
+                    continue
+                command = words[0]
+                attributes = {}
+                queries = []
+                tag = None
+                for word in words[1:]:
+                    if word.startswith(".tag="):
+                        tag = word[len(".tag=") :]
+                    elif word.startswith("="):
+                        key, _, value = word[1:].partition("=")
+                        attributes[key] = value
+                    elif word.startswith("?"):
+                        queries.append(word[1:])
+                self.commands.append(command)
+
+                if command == "/login":
+                    if attributes.get("name") == self.username and attributes.get("password") == self.password:
+                        logged_in = True
+                        replies = [["!done"]]
+                    else:
+                        replies = [["!trap", "=message=invalid user name or password (6)"], ["!done"]]
+                elif not logged_in:
+                    replies = [["!fatal", "not logged in"]]
+                else:
+                    replies = self.run(command, attributes, queries)
+
+                sock.sendall(b"".join(encode_sentence(reply + ([f".tag={tag}"] if tag else [])) for reply in replies))
+                if replies and replies[0][0] == "!fatal":
+                    return
+        except (ConnectionError, OSError):
+            return
+
+    def match(self, entry, queries):
+        """Evaluate RouterOS API query words against an entry."""
+        stack = []
+        for query in queries:
+            if query.startswith("#"):
+                for operator in query[1:]:
+                    if operator == "|":
+                        right, left = stack.pop(), stack.pop()
+                        stack.append(left or right)
+                    elif operator == "&":
+                        right, left = stack.pop(), stack.pop()
+                        stack.append(left and right)
+                    elif operator == "!":
+                        stack.append(not stack.pop())
+                continue
+            key, has_value, value = query.partition("=")
+            stack.append(entry.get(key) == value if has_value else key in entry)
+        return all(stack)
+
+    def run(self, command, attributes, queries):
+        """Run an address-list command against the table. Returns the reply sentences."""
+        base = "/ip/firewall/address-list"
+        with self._lock:
+            if command == f"{base}/print":
+                proplist = attributes.get(".proplist")
+                matches = [entry for entry in self.entries.values() if self.match(entry, queries)]
+                if "count-only" in attributes:
+                    return [["!done", f"=ret={len(matches)}"]]
+                replies = []
+                for entry in matches:
+                    fields = {key: value for key, value in entry.items() if not proplist or key in proplist.split(",")}
+                    replies.append(["!re"] + [f"={key}={value}" for key, value in fields.items()])
+                return replies + [["!done"]]
+
+            if command == f"{base}/add":
+                for entry in self.entries.values():
+                    if entry["list"] == attributes.get("list") and entry["address"] == attributes.get("address"):
+                        return [["!trap", "=message=failure: already have such entry"], ["!done"]]
+            if command == f"{base}/remove":
+                entry_ids = attributes.get(".id", "").split(",")
+                if any(entry_id not in self.entries for entry_id in entry_ids):
+                    return [["!trap", "=message=no such item"], ["!done"]]
+                for entry_id in entry_ids:
+                    del self.entries[entry_id]
+                return [["!done"]]
+            if command == f"{base}/set":
+                entry = self.entries.get(attributes.get(".id"))
+                if entry is None:
+                    return [["!trap", "=message=no such item"], ["!done"]]
+                entry.update({key: value for key, value in attributes.items() if key != ".id"})
+                return [["!done"]]
+
+        if command == f"{base}/add":
+            entry = self.add_entry(attributes.get("list"), attributes.get("address"), attributes.get("comment", ""))
+            return [["!done", f"=ret={entry['.id']}"]]
+        return [["!trap", f"=message=no such command ({command})"], ["!done"]]
@@ -0,0 +1,138 @@
+"""Tests for the on-disk API response cache."""
+import pytest
+import sys
+import os
+import time
+from unittest.mock import patch, Mock
+
+# Add the parent directory to the path so we can import modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.cache import ResponseCache
+from utils.uisp import UISPApi
+
+
+def build_response(status_code=200, body=None, headers=None):
+    """Build a mock response carrying raw text and headers."""
+    response = Mock()
+    response.status_code = status_code
+    response.text = body or ""
+    response.headers = headers or {}
+    response.raise_for_status.return_value = None
+    return response
+
+
+@pytest.fixture
+def cache(tmp_path):
+    """Response cache caching only the devices endpoint."""
+    return ResponseCache(directory=str(tmp_path), ttls={"devices": 60})
+
+
+@pytest.fixture
+def uisp_api(cache):
+    """UISP API connection using the cache."""
+    api = UISPApi(base_url="test.uisp.com", api_version="v2.1", token="test-token")
+    api.cache = cache
+    return api
+
+
+class TestResponseCache:
+    """Test ResponseCache storage and eviction."""
+
+    def test_ttl_for(self, cache):
+        """Test only configured paths have a TTL, ignoring query strings."""
+        assert cache.ttl_for("devices") == 60
+        assert cache.ttl_for("devices?withInterfaces=false") == 60
+        assert cache.ttl_for("sites") is None
+
+    def test_key_depends_on_params(self, cache):
+        """Test different query parameters give different keys."""
+        url = "https://test.uisp.com/nms/api/v2.1/devices"
+        assert cache.key(url, {"role": "station"}) != cache.key(url, {"role": "router"})
+        assert cache.key(url, {"a": 1, "b": 2}) == cache.key(url, {"b": 2, "a": 1})
+
+    def test_put_and_get(self, cache):
+        """Test a stored response round-trips with its validators."""
+        cache.put("key", '[{"id": 1}]', etag='"abc"', last_modified="Mon, 01 Jan 2024 00:00:00 GMT")
+        entry = cache.get("key")
+
+        assert entry["etag"] == '"abc"'
+        assert cache.decoded_body("key", entry) == [{"id": 1}]
+
+    def test_evicts_least_recently_used(self, tmp_path):
+        """Test the oldest entries are removed once the size limit is exceeded."""
+        cache = ResponseCache(directory=str(tmp_path), ttls={}, max_size_bytes=250)
+        cache.put("old", "x" * 100)
+        os.utime(tmp_path / "old.json", (time.time() - 60, time.time() - 60))
+        cache.put("new", "y" * 100)
+
+        assert cache.get("old") is None
+        assert cache.get("new") is not None
+
+    def test_decoded_bodies_follow_disk_entries(self, tmp_path):
+        """Test a decoded body is dropped from memory when its entry is replaced or evicted."""
+        cache = ResponseCache(directory=str(tmp_path), ttls={}, max_size_bytes=250)
+        cache.decoded_body("old", cache.put("old", '["' + "x" * 90 + '"]'))
+        os.utime(tmp_path / "old.json", (time.time() - 60, time.time() - 60))
+        cache.decoded_body("new", cache.put("new", '["' + "y" * 90 + '"]'))
+
+        assert list(cache._decoded) == ["new"]
+
+        cache.put("new", '["z"]')
+        assert cache._decoded == {}
+
+    def test_refresh_keeps_decoded_body(self, cache):
+        """Test a revalidated entry is not decoded again."""
+        entry = cache.put("key", '[{"id": 1}]')
+        body = cache.decoded_body("key", entry)
+
+        with patch("utils.cache.json.loads") as mock_loads:
+            assert cache.decoded_body("key", cache.refresh("key", entry)) is body
+            mock_loads.assert_not_called()
+
+
+class TestApiCallCaching:
+    """Test ApiEndpoint.api_call serving and revalidating cached responses."""
+
+    def test_fresh_response_skips_request(self, uisp_api, mock_uisp_devices):
+        """Test a response within its TTL is served without a request."""
+        import json
+
+        first = build_response(body=json.dumps(mock_uisp_devices))
+        with patch('utils.base.requests.Session.request', return_value=first) as mock_request:
+            assert uisp_api.get_devices() == mock_uisp_devices
+            assert uisp_api.get_devices() == mock_uisp_devices
+
+            assert mock_request.call_count == 1
+
+    def test_uncached_path_always_requests(self, uisp_api, mock_api_response):
+        """Test endpoints without a TTL bypass the cache."""
+        mock_api_response.json.return_value = [{"id": "site-1"}]
+        with patch('utils.base.requests.Session.request', return_value=mock_api_response) as mock_request:
+            uisp_api.get_sites()
+            uisp_api.get_sites()
+
+            assert mock_request.call_count == 2
+
+    def test_expired_response_is_revalidated(self, uisp_api, cache, mock_uisp_devices):
+        """Test an expired response is revalidated with its ETag and reused on 304."""
+        import json
+
+        first = build_response(body=json.dumps(mock_uisp_devices), headers={"ETag": '"v1"'})
+        not_modified = build_response(status_code=304)
+        with patch('utils.base.requests.Session.request', side_effect=[first, not_modified]) as mock_request:
+            uisp_api.get_devices()
+            cache.ttls["devices"] = 0
+
+            assert uisp_api.get_devices() == mock_uisp_devices
+            assert mock_request.call_args.kwargs["headers"]["If-None-Match"] == '"v1"'
+
+    def test_changed_response_replaces_cache(self, uisp_api, cache):
+        """Test a 200 after expiry replaces the cached response."""
+        first = build_response(body='[{"id": "device-1"}]', headers={"ETag": '"v1"'})
+        changed = build_response(body='[{"id": "device-2"}]', headers={"ETag": '"v2"'})
+        with patch('utils.base.requests.Session.request', side_effect=[first, changed]):
+            uisp_api.get_devices()
+            cache.ttls["devices"] = 0
+
+            assert uisp_api.get_devices() == [{"id": "device-2"}]
@@ -6,7 +6,7 @@ import os
 # Add the parent directory to the path so we can import modules
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from classes.uisp import UISPClientAddress
+from classes.uisp import UISPClientAddress, UISPAddressBlock
 from classes.mikrotik import MikroTikClientAddress
 
 
@@ -29,6 +29,20 @@ class TestUISPClientAddress:
         assert client.service_id == 101
         assert client.service_status == "active"
 
+    def test_uisp_client_address_site_id(self):
+        """Test UISPClientAddress carries the service's site."""
+        client = UISPClientAddress(
+            ip_address="192.168.1.10",
+            client_name="John Doe",
+            client_id=1,
+            service_id=101,
+            service_status="active",
+            site_id="site-1"
+        )
+
+        assert client.site_id == "site-1"
+        assert UISPClientAddress("192.168.1.10", "John Doe", 1, 101, "active").site_id is None
+
     def test_uisp_client_address_with_none_ip(self):
         """Test UISPClientAddress with None IP address."""
         client = UISPClientAddress(
@@ -60,6 +74,31 @@ class TestUISPClientAddress:
         assert client.client_name == "John Doe"
 
 
+class TestUISPAddressBlock:
+    """Test UISPAddressBlock class."""
+
+    def test_block_status_and_comment(self):
+        """Test a block takes its members' shared status and counts them in its comment."""
+        members = [
+            UISPClientAddress("192.168.1.8", "John Doe", 1, 101, "active"),
+            UISPClientAddress("192.168.1.9", "Jane Smith", 2, 102, "active"),
+        ]
+        block = UISPAddressBlock("192.168.1.8/31", members)
+
+        assert block.service_status == "active"
+        assert block.comment == "Aggregate of 2 services"
+        assert members[0].comment == "John Doe - 1_101"
+
+    def test_block_mixed_status(self):
+        """Test a block of members in different statuses has no status."""
+        members = [
+            UISPClientAddress("192.168.1.8", "John Doe", 1, 101, "active"),
+            UISPClientAddress("192.168.1.9", "Jane Smith", 2, 102, "suspended"),
+        ]
+
+        assert UISPAddressBlock("192.168.1.8/31", members).service_status is None
+
+
 class TestMikroTikClientAddress:
     """Test MikroTikClientAddress class."""
 
@@ -0,0 +1,144 @@
+"""Tests for the adaptive concurrency limiter."""
+import pytest
+import sys
+import os
+import threading
+import time
+from unittest.mock import Mock, patch
+
+import requests
+
+# Add the parent directory to the path so we can import modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.concurrency import AdaptiveLimiter, is_overload_error
+from utils.mikrotik import MikroTikApi
+
+
+def http_error(status_code):
+    """Build an HTTPError carrying a response with `status_code`."""
+    response = Mock()
+    response.status_code = status_code
+    return requests.exceptions.HTTPError(f"{status_code} error", response=response)
+
+
+class TestAdaptiveLimiter:
+    """Test AIMD adjustments of the limit."""
+
+    def test_additive_increase(self):
+        """Test a window of fast requests widens the limit by one."""
+        limiter = AdaptiveLimiter(floor=1, ceiling=10, initial=4, latency_target=1.0)
+        for _ in range(5):
+            limiter.release(limiter.acquire(), latency=0.01)
+
+        assert limiter.stats()["limit"] == 5
+
+    def test_increase_stops_at_ceiling(self):
+        """Test the limit never grows past the ceiling."""
+        limiter = AdaptiveLimiter(floor=1, ceiling=3, initial=3, latency_target=1.0)
+        for _ in range(20):
+            limiter.release(limiter.acquire(), latency=0.01)
+
+        assert limiter.stats()["limit"] == 3
+
+    def test_multiplicative_decrease_once_per_window(self):
+        """Test overloads from requests already in flight only halve the limit once."""
+        limiter = AdaptiveLimiter(floor=1, ceiling=16, initial=8, latency_target=1.0)
+        tickets = [limiter.acquire() for _ in range(8)]
+        for ticket in tickets:
+            limiter.release(ticket, latency=0.01, overloaded=True)
+
+        stats = limiter.stats()
+        assert stats["limit"] == 4
+        assert stats["decreases"] == 1
+        assert stats["overload_errors"] == 8
+
+    def test_slow_requests_decrease_to_floor(self):
+        """Test repeated slow windows shrink the limit down to the floor."""
+        limiter = AdaptiveLimiter(floor=2, ceiling=16, initial=16, latency_target=0.1)
+        for _ in range(10):
+            limiter.release(limiter.acquire(), latency=0.5)
+
+        stats = limiter.stats()
+        assert stats["limit"] == 2
+        assert stats["slow_requests"] == 10
+
+    def test_in_flight_never_exceeds_limit(self):
+        """Test concurrent callers wait for a free slot."""
+        limiter = AdaptiveLimiter(floor=3, ceiling=3, latency_target=1.0)
+        peak = []
+        lock = threading.Lock()
+
+        def work():
+            with lock:
+                peak.append(limiter.in_flight)
+            time.sleep(0.01)
+
+        threads = [threading.Thread(target=limiter.call, args=(work,)) for _ in range(12)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert max(peak) == 3
+        assert limiter.stats()["completed"] == 12
+
+    def test_call_reraises_and_records_overload(self):
+        """Test an overload exception is re-raised and counted."""
+        limiter = AdaptiveLimiter(floor=1, ceiling=4, latency_target=1.0)
+
+        def fail():
+            raise http_error(503)
+
+        with pytest.raises(requests.exceptions.HTTPError):
+            limiter.call(fail)
+
+        assert limiter.stats()["overload_errors"] == 1
+        assert limiter.stats()["limit"] == 2
+
+    def test_is_overload_error(self):
+        """Test server errors and connection problems are overloads; client errors are not."""
+        assert is_overload_error(http_error(503))
+        assert is_overload_error(requests.exceptions.ConnectTimeout())
+        assert is_overload_error(requests.exceptions.ConnectionError())
+        assert not is_overload_error(http_error(400))
+        assert not is_overload_error(ValueError())
+
+
+class TestMikroTikApiConcurrency:
+    """Test MikroTikApi bulk operations feeding the limiter."""
+
+    def test_bulk_add_backs_off_on_server_errors(self, mock_api_response):
+        """Test 5xx responses from the router lower the concurrency limit."""
+        api = MikroTikApi(
+            base_url="192.168.1.1",
+            username="admin",
+            password="password",
+            concurrency_min=1,
+            concurrency_max=8,
+            concurrency_initial=8,
+        )
+        overloaded_response = Mock()
+        overloaded_response.raise_for_status.side_effect = http_error(503)
+        addresses = [
+            {"ip_address": f"192.168.1.{i}", "list_name": "clients_active", "comment": f"Client {i}"} for i in range(20)
+        ]
+
+        with patch('requests.Session') as mock_session_class:
+            mock_session_class.return_value.put.return_value = overloaded_response
+            api.bulk_add_addresses_to_list(addresses)
+
+        stats = api.limiter.stats()
+        assert stats["limit"] < 8
+        assert stats["overload_errors"] == 20
+
+    def test_pool_size_covers_ceiling(self):
+        """Test the HTTP pool is large enough for the concurrency ceiling."""
+        api = MikroTikApi(
+            base_url="192.168.1.1",
+            username="admin",
+            password="password",
+            concurrency_max=64,
+        )
+
+        assert api.pool_size == 64
@@ -0,0 +1,118 @@
+"""Tests for router configuration parsing."""
+import pytest
+import sys
+import os
+from configparser import ConfigParser
+
+# Add the parent directory to the path so we can import modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from __init__ import parse_mikrotik_routers, parse_managed_lists
+
+
+def build_parser(text):
+    """Parse an ini string the way uisp.ini is read."""
+    parser = ConfigParser(interpolation=None)
+    parser.read_string(text)
+    return parser
+
+
+class TestMikroTikRouters:
+    """Test parsing one or more routers from [MIKROTIK] sections."""
+
+    def test_single_router(self):
+        """Test [MIKROTIK] alone is the default router."""
+        parser = build_parser("[MIKROTIK]\nrouter_ip = 192.168.1.1\nusername = admin\npassword = admin\n")
+
+        routers = parse_mikrotik_routers(parser)
+
+        assert list(routers) == ["default"]
+        assert routers["default"]["router_ip"] == "192.168.1.1"
+        assert routers["default"]["transport"] == "rest"
+        assert routers["default"]["concurrency_max"] == 32
+
+    def test_named_routers_inherit_defaults(self):
+        """Test each [MIKROTIK <name>] section is a router that overrides [MIKROTIK]."""
+        parser = build_parser(
+            "[MIKROTIK]\nusername = admin\npassword = admin\nconcurrency_max = 16\n"
+            "[MIKROTIK core]\nrouter_ip = 10.0.0.1\nconcurrency_max = 64\n"
+            "[MIKROTIK edge-1]\nrouter_ip = 10.0.1.1\nlatency_target_ms = 250\n"
+        )
+
+        routers = parse_mikrotik_routers(parser)
+
+        assert list(routers) == ["core", "edge-1"]
+        assert routers["core"]["router_ip"] == "10.0.0.1"
+        assert routers["core"]["concurrency_max"] == 64
+        assert routers["edge-1"]["concurrency_max"] == 16
+        assert routers["edge-1"]["latency_target"] == 0.25
+        assert routers["edge-1"]["username"] == "admin"
+
+    def test_router_sites(self):
+        """Test a router's sites are parsed into a list, and left unset to serve every site."""
+        parser = build_parser(
+            "[MIKROTIK]\nusername = admin\npassword = admin\n"
+            "[MIKROTIK north]\nrouter_ip = 10.0.0.1\nsites = region-north, tower-7\n"
+            "[MIKROTIK core]\nrouter_ip = 10.0.1.1\n"
+        )
+
+        routers = parse_mikrotik_routers(parser)
+
+        assert routers["north"]["sites"] == ["region-north", "tower-7"]
+        assert routers["core"]["sites"] is None
+
+
+class TestManagedLists:
+    """Test parsing address list definitions from [LIST] sections."""
+
+    def test_default_lists(self):
+        """Test the built-in lists are used without [LIST] sections, with all_list_statuses for clients_all."""
+        managed_lists, move_lists = parse_managed_lists(build_parser("[UISP]\n"), ["active", "suspended"])
+
+        assert managed_lists == {
+            "clients_active": ["active"],
+            "clients_suspended": ["suspended"],
+            "clients_all": ["active", "suspended"],
+        }
+        assert move_lists == ("clients_active", "clients_suspended")
+
+    def test_list_sections(self):
+        """Test [LIST <name>] sections replace the built-in lists, in order, with their move setting."""
+        parser = build_parser(
+            "[LIST clients_active]\nstatuses = active\nmove = True\n"
+            "[LIST clients_suspended]\nstatuses = suspended\nmove = True\n"
+            "[LIST walled_garden]\nstatuses = prepared blocked, suspended\n"
+            "[LIST clients_all]\nstatuses = *\n"
+        )
+
+        managed_lists, move_lists = parse_managed_lists(parser, ["active"])
+
+        assert managed_lists == {
+            "clients_active": ["active"],
+            "clients_suspended": ["suspended"],
+            "walled_garden": ["prepared blocked", "suspended"],
+            "clients_all": None,
+        }
+        assert move_lists == ("clients_active", "clients_suspended")
+
+    @pytest.mark.parametrize(
+        "section, message",
+        [
+            ("[LIST walled_garden]\nstatuses = blocked\n", "Unknown service status 'blocked'"),
+            ("[LIST walled_garden]\nmove = True\n", "has no statuses"),
+            (
+                "[LIST clients_active]\nstatuses = active\nmove = True\n"
+                "[LIST walled_garden]\nstatuses = suspended, active\nmove = True\n",
+                "share statuses",
+            ),
+            (
+                "[LIST clients_active]\nstatuses = active\nmove = True\n"
+                "[LIST clients_all]\nstatuses = *\nmove = True\n",
+                "share statuses",
+            ),
+        ],
+    )
+    def test_invalid_list(self, section, message):
+        """Test unknown statuses, lists without statuses and overlapping move lists are rejected."""
+        with pytest.raises(Exception, match=message):
+            parse_managed_lists(build_parser(section))
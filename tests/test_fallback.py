@@ -0,0 +1,92 @@
+"""Tests for the fallback IP allocator."""
+import pytest
+import sys
+import os
+import json
+
+# Add the parent directory to the path so we can import modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.fallback import FallbackAllocator
+from utils import join_client_addresses
+
+
+@pytest.fixture
+def assignments_path(tmp_path):
+    """Path for persisted fallback assignments."""
+    return str(tmp_path / "data" / "fallback_ips.json")
+
+
+class TestFallbackAllocator:
+    """Test FallbackAllocator assignments."""
+
+    def test_allocate_is_stable(self, assignments_path):
+        """Test a key keeps its IP across calls."""
+        allocator = FallbackAllocator(path=assignments_path, pool="192.0.0.0/29")
+        first = allocator.allocate(1)
+
+        assert first.startswith("192.0.0.")
+        assert allocator.allocate(1) == first
+
+    def test_allocate_is_unique(self, assignments_path):
+        """Test different keys never share an IP."""
+        allocator = FallbackAllocator(path=assignments_path, pool="192.0.0.0/29")
+        ips = [allocator.allocate(key) for key in range(6)]
+
+        assert len(set(ips)) == 6
+
+    def test_pool_exhaustion(self, assignments_path):
+        """Test None is returned once every address in the pool is taken."""
+        allocator = FallbackAllocator(path=assignments_path, pool="192.0.0.0/30")
+        assert allocator.allocate(1) is not None
+        assert allocator.allocate(2) is not None
+        assert allocator.allocate(3) is None
+
+    def test_persisted_across_runs(self, assignments_path):
+        """Test assignments are reloaded by a new allocator."""
+        allocator = FallbackAllocator(path=assignments_path)
+        ip = allocator.allocate(42)
+        allocator.save()
+
+        assert FallbackAllocator(path=assignments_path).allocate(42) == ip
+
+    def test_prune_releases_unused(self, assignments_path):
+        """Test keys not allocated since the last prune are released."""
+        allocator = FallbackAllocator(path=assignments_path)
+        allocator.allocate(1)
+        allocator.allocate(2)
+        allocator.save(prune=True)
+
+        allocator.allocate(1)
+        allocator.save(prune=True)
+
+        with open(assignments_path) as assignments_file:
+            assert list(json.load(assignments_file)) == ["1"]
+
+    def test_load_drops_addresses_outside_pool(self, assignments_path):
+        """Test assignments from an old pool are discarded."""
+        os.makedirs(os.path.dirname(assignments_path))
+        with open(assignments_path, "w") as assignments_file:
+            json.dump({"1": "10.0.0.5"}, assignments_file)
+
+        allocator = FallbackAllocator(path=assignments_path, pool="192.0.0.0/24")
+        assert allocator.allocate(1).startswith("192.0.0.")
+
+    def test_join_uses_allocator(self, assignments_path, mock_uisp_clients, mock_uisp_services, mock_uisp_devices):
+        """Test the join gives a device without an IP the allocated fallback every cycle."""
+        mock_uisp_devices[0]["ipAddress"] = None
+        allocator = FallbackAllocator(path=assignments_path)
+
+        first = join_client_addresses(mock_uisp_clients, mock_uisp_services, mock_uisp_devices, fallback_allocator=allocator)
+        second = join_client_addresses(mock_uisp_clients, mock_uisp_services, mock_uisp_devices, fallback_allocator=allocator)
+
+        assert first[0].ip_address == allocator.assignments["1_101"]
+        assert first[0].ip_address == second[0].ip_address
+
+    def test_join_excludes_fallback(self, mock_uisp_clients, mock_uisp_services, mock_uisp_devices):
+        """Test clients without a device IP are left out when fallbacks are excluded."""
+        mock_uisp_devices[0]["ipAddress"] = None
+
+        result = join_client_addresses(mock_uisp_clients, mock_uisp_services, mock_uisp_devices, exclude_fallback=True)
+
+        assert [addr.client_id for addr in result] == [2, 3]
@@ -2,7 +2,7 @@
 import pytest
 import sys
 import os
-from unittest.mock import patch, Mock, MagicMock
+from unittest.mock import Mock, MagicMock
 
 # Add the parent directory to the path so we can import modules
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -83,14 +83,13 @@ class TestSyncIntegration:
         """Test device IP lookup functionality with mock data."""
         from utils import lookup_client_ip
         
-        with patch('utils.random.randint', return_value=100):
-            # Test successful IP lookup
-            ip = lookup_client_ip(mock_uisp_devices, mock_uisp_services, 1)
-            assert ip == "192.168.1.10"
-            
-            # Test IP lookup for non-existent client
-            ip = lookup_client_ip(mock_uisp_devices, mock_uisp_services, 999)
-            assert ip is None
+        # Test successful IP lookup
+        ip = lookup_client_ip(mock_uisp_devices, mock_uisp_services, 1)
+        assert ip == "192.168.1.10"
+
+        # Test IP lookup for non-existent client
+        ip = lookup_client_ip(mock_uisp_devices, mock_uisp_services, 999)
+        assert ip is None
 
     def test_api_error_simulation(self):
         """Test error handling simulation."""
@@ -3,12 +3,14 @@ import pytest
 import sys
 import os
 from unittest.mock import patch, Mock
+import requests
 import base64
+import json
 
 # Add the parent directory to the path so we can import modules
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from utils.mikrotik import MikroTikApi
+from utils.mikrotik import MikroTikApi, plan_list_moves, render_address_list_script, reverify_failed_writes
 
 
 class TestMikroTikApi:
@@ -45,7 +47,7 @@ class TestMikroTikApi:
         """Test get_address_list without specific list name."""
         mock_api_response.json.return_value = mock_mikrotik_address_lists
         
-        with patch('utils.base.requests.request', return_value=mock_api_response):
+        with patch('utils.base.requests.Session.request', return_value=mock_api_response):
             api = MikroTikApi(
                 base_url="192.168.1.1",
                 username="admin",
@@ -62,7 +64,7 @@ class TestMikroTikApi:
         active_addresses = [addr for addr in mock_mikrotik_address_lists if addr["list"] == "clients_active"]
         mock_api_response.json.return_value = active_addresses
         
-        with patch('utils.base.requests.request', return_value=mock_api_response):
+        with patch('utils.base.requests.Session.request', return_value=mock_api_response):
             api = MikroTikApi(
                 base_url="192.168.1.1",
                 username="admin",
@@ -73,12 +75,38 @@ class TestMikroTikApi:
             
             assert result == active_addresses
 
+    def test_get_address_lists(self, mock_mikrotik_address_lists, mock_api_response):
+        """Test managed lists are fetched in one projected print request and split locally."""
+        mock_api_response.json.return_value = [
+            addr for addr in mock_mikrotik_address_lists if addr["list"] in ("clients_active", "clients_all")
+        ]
+
+        with patch('utils.base.requests.Session.request', return_value=mock_api_response) as mock_request:
+            api = MikroTikApi(
+                base_url="192.168.1.1",
+                username="admin",
+                password="password"
+            )
+
+            result = api.get_address_lists(["clients_active", "clients_all", "clients_suspended"])
+
+            assert mock_request.call_count == 1
+            call_kwargs = mock_request.call_args.kwargs
+            assert call_kwargs["method"] == "POST"
+            assert call_kwargs["url"].endswith("ip/firewall/address-list/print")
+            body = json.loads(call_kwargs["data"])
+            assert body[".proplist"] == [".id", "address", "list", "comment"]
+            assert body[".query"] == ["list=clients_active", "list=clients_all", "list=clients_suspended", "#||"]
+            assert result["clients_active"]
+            assert all(addr["list"] == "clients_active" for addr in result["clients_active"])
+            assert result["clients_suspended"] == []
+
     def test_mikrotik_api_get_address_list_item_id(self, mock_api_response):
         """Test get_address_list_item_id."""
         mock_item = [{"id": "1", "address": "192.168.1.10"}]
         mock_api_response.json.return_value = mock_item
         
-        with patch('utils.base.requests.request', return_value=mock_api_response):
+        with patch('utils.base.requests.Session.request', return_value=mock_api_response):
             api = MikroTikApi(
                 base_url="192.168.1.1",
                 username="admin",
@@ -93,7 +121,7 @@ class TestMikroTikApi:
         """Test add_address_to_list."""
         mock_api_response.status_code = 200
         
-        with patch('utils.base.requests.request', return_value=mock_api_response):
+        with patch('utils.base.requests.Session.request', return_value=mock_api_response):
             api = MikroTikApi(
                 base_url="192.168.1.1",
                 username="admin",
@@ -105,7 +133,7 @@ class TestMikroTikApi:
 
     def test_mikrotik_api_remove_address_from_list(self, mock_api_response_204):
         """Test remove_address_from_list."""
-        with patch('utils.base.requests.request', return_value=mock_api_response_204):
+        with patch('utils.base.requests.Session.request', return_value=mock_api_response_204):
             api = MikroTikApi(
                 base_url="192.168.1.1",
                 username="admin",
@@ -117,7 +145,7 @@ class TestMikroTikApi:
 
     def test_mikrotik_api_get_address_list_error(self, mock_api_error_response):
         """Test get_address_list with API error."""
-        with patch('utils.base.requests.request', return_value=mock_api_error_response):
+        with patch('utils.base.requests.Session.request', return_value=mock_api_error_response):
             api = MikroTikApi(
                 base_url="192.168.1.1",
                 username="admin",
@@ -242,6 +270,85 @@ class TestMikroTikApi:
             # Should not raise an exception
             api.bulk_remove_addresses_from_list(addresses_data)
 
+    def test_bulk_remove_addresses_in_batches(self, mock_api_response):
+        """Test entry IDs are removed in comma-separated batches."""
+        api = MikroTikApi(
+            base_url="192.168.1.1",
+            username="admin",
+            password="password",
+            remove_batch_size=2
+        )
+        addresses_data = [
+            {"entry_id": f"*{i}", "ip_address": f"192.168.1.{i}", "list_name": "clients_active"}
+            for i in range(1, 6)
+        ]
+
+        with patch('requests.Session') as mock_session_class:
+            mock_session = mock_session_class.return_value
+            mock_session.post.return_value = mock_api_response
+            api.bulk_remove_addresses_from_list(addresses_data)
+
+            assert mock_session.post.call_count == 3
+            assert mock_session.post.call_args_list[0].args[0].endswith("ip/firewall/address-list/remove")
+            expected_batches = ["*1,*2", "*3,*4", "*5"]
+            assert [call.kwargs["json"][".id"] for call in mock_session.post.call_args_list] == expected_batches
+            mock_session.delete.assert_not_called()
+
+    def test_bulk_remove_batch_retries_overload_errors(self, mock_api_response):
+        """Test a batch that hits a 503 is retried before any entry is removed individually."""
+        api = MikroTikApi(
+            base_url="192.168.1.1",
+            username="admin",
+            password="password",
+            remove_batch_size=2,
+            max_retries=2,
+            retry_backoff=0
+        )
+        overloaded_response = Mock()
+        overloaded_response.status_code = 503
+        overloaded_response.raise_for_status.side_effect = requests.exceptions.HTTPError(
+            "503 Server Error", response=overloaded_response
+        )
+        addresses_data = [
+            {"entry_id": f"*{i}", "ip_address": f"192.168.1.{i}", "list_name": "clients_active"}
+            for i in range(1, 3)
+        ]
+
+        with patch('requests.Session') as mock_session_class:
+            mock_session = mock_session_class.return_value
+            mock_session.post.side_effect = [overloaded_response, mock_api_response]
+            api.bulk_remove_addresses_from_list(addresses_data)
+
+            assert mock_session.post.call_count == 2
+            mock_session.delete.assert_not_called()
+            assert api.limiter.stats()["overload_errors"] == 1
+            assert api.failed_writes == []
+
+    def test_bulk_remove_failed_batch_falls_back(self, mock_api_response, mock_api_error_response):
+        """Test a rejected batch is retried one entry at a time."""
+        api = MikroTikApi(
+            base_url="192.168.1.1",
+            username="admin",
+            password="password",
+            remove_batch_size=2
+        )
+        addresses_data = [
+            {"entry_id": f"*{i}", "ip_address": f"192.168.1.{i}", "list_name": "clients_active"}
+            for i in range(1, 4)
+        ]
+
+        with patch('requests.Session') as mock_session_class:
+            mock_session = mock_session_class.return_value
+            mock_session.post.side_effect = [mock_api_error_response, mock_api_response]
+            mock_session.delete.return_value = mock_api_response
+            api.bulk_remove_addresses_from_list(addresses_data)
+
+            deleted = sorted(call.args[0] for call in mock_session.delete.call_args_list)
+            assert deleted == [
+                "https://192.168.1.1/rest/ip/firewall/address-list/*1",
+                "https://192.168.1.1/rest/ip/firewall/address-list/*2",
+            ]
+
     def test_bulk_remove_addresses_from_list_empty(self):
         """Test bulk_remove_addresses_from_list with empty data."""
         api = MikroTikApi(
@@ -292,6 +399,311 @@ class TestMikroTikApi:
                 addresses_to_remove=addresses_to_remove
             )
 
+    def test_bulk_sync_address_list_add_first(self):
+        """Test add_first applies additions before removals, in bulk and script mode."""
+        api = MikroTikApi(base_url="192.168.1.1", username="admin", password="password")
+        add = [{"ip_address": "192.168.1.8/31", "list_name": "clients_all", "comment": "Aggregate of 2 services"}]
+        remove = [{"entry_id": "*1", "ip_address": "192.168.1.8/30", "list_name": "clients_all"}]
+        calls = []
+
+        with patch.object(api, 'bulk_add_addresses_to_list', side_effect=lambda *a: calls.append("add")), \
+                patch.object(api, 'bulk_remove_addresses_from_list', side_effect=lambda *a: calls.append("remove")), \
+                patch.object(api, 'run_script_lines') as mock_run:
+            api.script_threshold = 0
+            api.bulk_sync_address_list("clients_all", add, remove, add_first=True)
+            api.script_threshold = 2
+            api.bulk_sync_address_list("clients_all", add, remove, add_first=True)
+
+        assert calls == ["add", "remove"]
+        lines = mock_run.call_args.args[0]
+        assert "add list=" in lines[0] and "remove numbers=*1" in lines[1]
+
+    def test_session_shared_by_single_and_bulk_calls(self, mock_api_response):
+        """Test one pooled session serves single calls and bulk operations, with timeouts."""
+        api = MikroTikApi(
+            base_url="192.168.1.1",
+            username="admin",
+            password="password"
+        )
+
+        with patch('requests.Session') as mock_session_class:
+            mock_session = mock_session_class.return_value
+            mock_session.request.return_value = mock_api_response
+            mock_session.put.return_value = mock_api_response
+
+            api.get_address_list()
+            api.get_address_list(list_name="clients_active")
+            api.bulk_add_addresses_to_list(
+                [{"ip_address": "192.168.1.10", "list_name": "clients_active", "comment": "John Doe"}]
+            )
+
+            mock_session_class.assert_called_once()
+            assert mock_session.request.call_count == 2
+            assert mock_session.request.call_args.kwargs["timeout"] == api.timeout
+            assert mock_session.put.call_args.kwargs["timeout"] == api.timeout
+
+    def test_session_mounts_pooled_adapter(self):
+        """Test the session pools up to pool_size connections per host."""
+        api = MikroTikApi(
+            base_url="192.168.1.1",
+            username="admin",
+            password="password"
+        )
+
+        adapter = api.session.get_adapter("https://192.168.1.1/rest/")
+
+        assert api.session is api.session
+        assert adapter._pool_maxsize == api.pool_size
+        assert adapter._pool_block is True
+
+    def test_bulk_add_retries_overload_errors(self, mock_api_response):
+        """Test a 503 is retried with backoff and the write then succeeds."""
+        api = MikroTikApi(
+            base_url="192.168.1.1",
+            username="admin",
+            password="password",
+            max_retries=2,
+            retry_backoff=0
+        )
+        overloaded_response = Mock()
+        overloaded_response.status_code = 503
+        overloaded_response.raise_for_status.side_effect = requests.exceptions.HTTPError(
+            "503 Server Error", response=overloaded_response
+        )
+
+        with patch('requests.Session') as mock_session_class:
+            mock_session_class.return_value.put.side_effect = [overloaded_response, mock_api_response]
+            api.bulk_add_addresses_to_list(
+                [{"ip_address": "192.168.1.10", "list_name": "clients_active", "comment": "John Doe"}]
+            )
+
+            assert mock_session_class.return_value.put.call_count == 2
+            assert api.failed_writes == []
+
+    def test_bulk_writes_already_applied_count_as_success(self):
+        """Test "already have such entry" and "no such item" responses are not failures."""
+        api = MikroTikApi(
+            base_url="192.168.1.1",
+            username="admin",
+            password="password",
+            max_retries=2
+        )
+
+        def error_response(status_code, detail):
+            response = Mock()
+            response.status_code = status_code
+            response.text = f'{{"error":{status_code},"detail":"{detail}"}}'
+            response.raise_for_status.side_effect = requests.exceptions.HTTPError(
+                f"{status_code} Client Error", response=response
+            )
+            return response
+
+        with patch('requests.Session') as mock_session_class:
+            mock_session = mock_session_class.return_value
+            mock_session.put.return_value = error_response(400, "failure: already have such entry")
+            mock_session.delete.return_value = error_response(404, "no such item")
+            api.bulk_add_addresses_to_list(
+                [{"ip_address": "192.168.1.10", "list_name": "clients_active", "comment": "John Doe"}]
+            )
+            api.bulk_remove_addresses_from_list(
+                [{"entry_id": "*1", "ip_address": "192.168.1.20", "list_name": "clients_active"}]
+            )
+
+            assert mock_session.put.call_count == 1
+            assert mock_session.delete.call_count == 1
+            assert api.failed_writes == []
+
+    def test_failed_writes_are_reverified(self, mock_api_error_response):
+        """Test writes that still fail are re-checked and applied individually."""
+        api = MikroTikApi(
+            base_url="192.168.1.1",
+            username="admin",
+            password="password"
+        )
+        addr_data = {"ip_address": "192.168.1.10", "list_name": "clients_active", "comment": "John Doe"}
+
+        with patch('requests.Session') as mock_session_class:
+            mock_session_class.return_value.put.return_value = mock_api_error_response
+            api.bulk_add_addresses_to_list([addr_data])
+        assert api.failed_writes == [("add", addr_data)]
+
+        with patch.object(api, 'get_address_list_item_id', return_value=[]) as mock_lookup, \
+                patch.object(api, 'add_address_to_list') as mock_add:
+            assert reverify_failed_writes(api) == 0
+
+            mock_lookup.assert_called_once_with("clients_active", "192.168.1.10")
+            mock_add.assert_called_once_with("192.168.1.10", "clients_active", "John Doe")
+            assert api.failed_writes == []
+
+    def test_plan_list_moves(self):
+        """Test a removal and addition of the same IP on different lists become one move."""
+        moves, removals, additions = plan_list_moves(
+            [
+                {"entry_id": "*1", "ip_address": "192.168.1.10", "list_name": "clients_active"},
+                {"entry_id": "*2", "ip_address": "192.168.1.20", "list_name": "clients_active"},
+            ],
+            [
+                {"ip_address": "192.168.1.10", "list_name": "clients_suspended", "comment": "John Doe - 1_101"},
+                {"ip_address": "192.168.1.30", "list_name": "clients_suspended", "comment": "Bob Johnson - 3_103"},
+            ],
+        )
+
+        assert moves == [
+            {
+                "entry_id": "*1",
+                "ip_address": "192.168.1.10",
+                "from_list": "clients_active",
+                "list_name": "clients_suspended",
+                "comment": "John Doe - 1_101",
+            }
+        ]
+        assert [addr["ip_address"] for addr in removals] == ["192.168.1.20"]
+        assert [addr["ip_address"] for addr in additions] == ["192.168.1.30"]
+
+    def test_plan_list_moves_ip_on_two_lists(self):
+        """Test an IP leaving two lists keeps both removals, pairing only one with its addition."""
+        removals = [
+            {"entry_id": "*1", "ip_address": "10.0.0.1", "list_name": "clients_active"},
+            {"entry_id": "*2", "ip_address": "10.0.0.1", "list_name": "clients_suspended"},
+        ]
+
+        moves, remaining, additions = plan_list_moves(removals, [])
+        assert moves == [] and additions == []
+        assert [addr["entry_id"] for addr in remaining] == ["*1", "*2"]
+
+        moves, remaining, additions = plan_list_moves(
+            removals, [{"ip_address": "10.0.0.1", "list_name": "clients_active", "comment": "Ann Lee - 4_104"}]
+        )
+        assert [(move["entry_id"], move["from_list"]) for move in moves] == [("*2", "clients_suspended")]
+        assert [addr["entry_id"] for addr in remaining] == ["*1"]
+        assert additions == []
+
+    def test_bulk_move_addresses(self, mock_api_response):
+        """Test each move is a single PATCH of the entry's list and comment."""
+        api = MikroTikApi(
+            base_url="192.168.1.1",
+            username="admin",
+            password="password"
+        )
+        move = {
+            "entry_id": "*1",
+            "ip_address": "192.168.1.10",
+            "from_list": "clients_active",
+            "list_name": "clients_suspended",
+            "comment": "John Doe - 1_101",
+        }
+
+        with patch('requests.Session') as mock_session_class:
+            mock_session = mock_session_class.return_value
+            mock_session.patch.return_value = mock_api_response
+            api.bulk_move_addresses([move])
+
+            mock_session.patch.assert_called_once()
+            assert mock_session.patch.call_args.args[0] == "https://192.168.1.1/rest/ip/firewall/address-list/*1"
+            assert mock_session.patch.call_args.kwargs["json"] == {"list": "clients_suspended", "comment": "John Doe - 1_101"}
+            mock_session.put.assert_not_called()
+            mock_session.delete.assert_not_called()
+
+    def test_failed_move_is_reverified_as_add_and_remove(self):
+        """Test a move whose entry vanished is repaired by adding to the new list and clearing the old one."""
+        api = MikroTikApi(
+            base_url="192.168.1.1",
+            username="admin",
+            password="password"
+        )
+        api.failed_writes = [
+            (
+                "move",
+                {
+                    "entry_id": "*1",
+                    "ip_address": "192.168.1.10",
+                    "from_list": "clients_active",
+                    "list_name": "clients_suspended",
+                    "comment": "John Doe - 1_101",
+                },
+            )
+        ]
+        lookups = {"clients_suspended": [], "clients_active": [{".id": "*7"}]}
+
+        with patch.object(api, 'get_address_list_item_id', side_effect=lambda list_name, address: lookups[list_name]), \
+                patch.object(api, 'add_address_to_list') as mock_add, \
+                patch.object(api, 'remove_address_from_list') as mock_remove:
+            assert reverify_failed_writes(api) == 0
+
+            mock_add.assert_called_once_with("192.168.1.10", "clients_suspended", "John Doe - 1_101")
+            mock_remove.assert_called_once_with("*7")
+
+    def test_render_address_list_script(self):
+        """Test removals and additions render as error-tolerant script commands with escaped values."""
+        lines = render_address_list_script(
+            [{"ip_address": "192.168.1.10", "list_name": "clients_active", "comment": 'John "JD" $Doe - 1_101'}],
+            [{"entry_id": "*1A", "ip_address": "192.168.1.20", "list_name": "clients_active"}],
+        )
+
+        assert lines == [
+            ":do { /ip firewall address-list remove numbers=*1A } on-error={}",
+            ':do { /ip firewall address-list add list="clients_active" address="192.168.1.10" '
+            'comment="John \\"JD\\" \\$Doe - 1_101" } on-error={}',
+        ]
+
+    def test_bulk_sync_address_list_script_mode(self, mock_api_response):
+        """Test a delta over the threshold is applied as chunked scripts and verified with one count."""
+        mock_api_response.json.return_value = {"ret": "5"}
+        api = MikroTikApi(
+            base_url="192.168.1.1",
+            username="admin",
+            password="password",
+            script_threshold=3,
+            script_chunk_size=2
+        )
+        addresses_to_add = [
+            {"ip_address": f"192.168.1.{i}", "list_name": "clients_active", "comment": f"Client {i}"}
+            for i in range(5)
+        ]
+
+        with patch('utils.base.requests.Session.request', return_value=mock_api_response) as mock_request, \
+                patch.object(api, 'bulk_add_addresses_to_list') as mock_bulk_add:
+            api.bulk_sync_address_list("clients_active", addresses_to_add, [], expected_count=5)
+
+            mock_bulk_add.assert_not_called()
+            urls = [call.kwargs["url"] for call in mock_request.call_args_list]
+            assert urls == ["https://192.168.1.1/rest/execute"] * 3 + ["https://192.168.1.1/rest/ip/firewall/address-list/print"]
+            assert json.loads(mock_request.call_args_list[0].kwargs["data"])["script"].count("\n") == 1
+            assert json.loads(mock_request.call_args_list[-1].kwargs["data"])["count-only"] == ""
+
+    def test_bulk_sync_address_list_script_count_mismatch(self):
+        """Test a script sync that leaves the list the wrong size queues its changes for re-verify."""
+        api = MikroTikApi(
+            base_url="192.168.1.1",
+            username="admin",
+            password="password",
+            script_threshold=2
+        )
+        addresses_to_add = [{"ip_address": "192.168.1.10", "list_name": "clients_active", "comment": "Client"}]
+        addresses_to_remove = [{"entry_id": "*1", "ip_address": "192.168.1.20", "list_name": "clients_active"}]
+
+        with patch.object(api, 'run_script'), patch.object(api, 'count_address_list', return_value=4):
+            api.bulk_sync_address_list("clients_active", addresses_to_add, addresses_to_remove, expected_count=5)
+
+        assert api.failed_writes == [("add", addresses_to_add[0]), ("remove", addresses_to_remove[0])]
+
+    def test_bulk_sync_address_list_below_script_threshold(self):
+        """Test a small delta keeps using per-entry requests."""
+        api = MikroTikApi(
+            base_url="192.168.1.1",
+            username="admin",
+            password="password",
+            script_threshold=3
+        )
+        addresses_to_add = [{"ip_address": "192.168.1.10", "list_name": "clients_active", "comment": "Client"}]
+
+        with patch.object(api, 'bulk_add_addresses_to_list') as mock_bulk_add, \
+                patch.object(api, 'run_script') as mock_run_script:
+            api.bulk_sync_address_list("clients_active", addresses_to_add, [])
+
+            mock_bulk_add.assert_called_once_with(addresses_to_add)
+            mock_run_script.assert_not_called()
+
     def test_bulk_sync_address_list_empty(self):
         """Test bulk_sync_address_list with empty data."""
         api = MikroTikApi(
@@ -311,7 +723,7 @@ class TestMikroTikApi:
         """Test get_address_list_bulk method for all lists."""
         mock_api_response.json.return_value = mock_mikrotik_address_lists
         
-        with patch('utils.base.requests.request', return_value=mock_api_response):
+        with patch('utils.base.requests.Session.request', return_value=mock_api_response):
             api = MikroTikApi(
                 base_url="192.168.1.1",
                 username="admin",
@@ -332,7 +744,7 @@ class TestMikroTikApi:
         active_addresses = [addr for addr in mock_mikrotik_address_lists if addr["list"] == "clients_active"]
         mock_api_response.json.return_value = active_addresses
         
-        with patch('utils.base.requests.request', return_value=mock_api_response):
+        with patch('utils.base.requests.Session.request', return_value=mock_api_response):
             api = MikroTikApi(
                 base_url="192.168.1.1",
                 username="admin",
@@ -350,7 +762,7 @@ class TestMikroTikApi:
         """Test get_entry_ids_bulk method."""
         mock_api_response.json.return_value = mock_mikrotik_address_lists
         
-        with patch('utils.base.requests.request', return_value=mock_api_response):
+        with patch('utils.base.requests.Session.request', return_value=mock_api_response):
             api = MikroTikApi(
                 base_url="192.168.1.1",
                 username="admin",
@@ -391,7 +803,7 @@ class TestMikroTikApi:
         """Test get_entry_ids_bulk with addresses not found."""
         mock_api_response.json.return_value = mock_mikrotik_address_lists
         
-        with patch('utils.base.requests.request', return_value=mock_api_response):
+        with patch('utils.base.requests.Session.request', return_value=mock_api_response):
             api = MikroTikApi(
                 base_url="192.168.1.1",
                 username="admin",
@@ -0,0 +1,204 @@
+"""Tests for the RouterOS API transport."""
+import pytest
+import sys
+import os
+
+# Add the parent directory to the path so we can import modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.routeros import (
+    RouterOSApiClient,
+    MikroTikRouterOSApi,
+    encode_length,
+    encode_sentence,
+    read_sentence,
+    parse_sentence,
+)
+from tests.fake_routeros import FakeRouterOS
+
+
+@pytest.fixture
+def fake_router():
+    """Fake RouterOS API server on a free local port."""
+    router = FakeRouterOS().start()
+    yield router
+    router.stop()
+
+
+@pytest.fixture
+def routeros_api(fake_router):
+    """MikroTikRouterOSApi connected to the fake router."""
+    host, port = fake_router.address
+    api = MikroTikRouterOSApi(base_url=host, port=port, username="admin", password="password", use_ssl=False)
+    yield api
+    api.client.close()
+
+
+def reader(data):
+    """Return a read(n) function over a byte string."""
+    position = [0]
+
+    def read(length):
+        chunk = data[position[0] : position[0] + length]
+        position[0] += length
+        return chunk
+
+    return read
+
+
+class TestProtocol:
+    """Test RouterOS API sentence encoding."""
+
+    @pytest.mark.parametrize("length", [0, 0x7F, 0x80, 0x3FFF, 0x4000, 0x1FFFFF, 0x200000, 0xFFFFFFF, 0x10000000])
+    def test_length_round_trip(self, length):
+        """Test every length encoding size decodes back to the same value."""
+        from utils.routeros import read_length
+
+        assert read_length(reader(encode_length(length))) == length
+
+    def test_sentence_round_trip(self):
+        """Test a sentence decodes back to its words."""
+        words = ["/ip/firewall/address-list/add", "=list=clients_active", "=comment=" + "x" * 200, ".tag=7"]
+        assert read_sentence(reader(encode_sentence(words))) == words
+
+    def test_parse_sentence(self):
+        """Test reply type, attributes and tag are split out."""
+        reply_type, attributes, tag = parse_sentence(["!re", "=.id=*1", "=comment=a=b", ".tag=3"])
+
+        assert reply_type == "!re"
+        assert attributes == {".id": "*1", "comment": "a=b"}
+        assert tag == "3"
+
+
+class TestRouterOSApiClient:
+    """Test RouterOSApiClient against the fake router."""
+
+    def test_login_failure(self, fake_router):
+        """Test wrong credentials raise an API error."""
+        host, port = fake_router.address
+        client = RouterOSApiClient(host=host, port=port, username="admin", password="wrong")
+
+        with pytest.raises(Exception, match="login failed"):
+            client.talk("/ip/firewall/address-list/print")
+
+    def test_pipeline_keeps_order_and_errors(self, fake_router):
+        """Test pipelined commands return results in order with traps reported per command."""
+        fake_router.add_entry("clients_active", "192.168.1.10")
+        host, port = fake_router.address
+        client = RouterOSApiClient(host=host, port=port, username="admin", password="password")
+
+        results = client.pipeline(
+            [
+                ("/ip/firewall/address-list/add", {"list": "clients_active", "address": "192.168.1.10"}, None),
+                ("/ip/firewall/address-list/add", {"list": "clients_active", "address": "192.168.1.20"}, None),
+                ("/ip/firewall/address-list/print", None, ["?list=clients_active"]),
+            ],
+            window=2,
+        )
+        client.close()
+
+        assert results[0][1] == "failure: already have such entry"
+        assert results[1][1] is None
+        assert sorted(entry["address"] for entry in results[2][0]) == ["192.168.1.10", "192.168.1.20"]
+
+    def test_reconnects_after_connection_loss(self, fake_router):
+        """Test talk reconnects when the socket was closed underneath it."""
+        host, port = fake_router.address
+        client = RouterOSApiClient(host=host, port=port, username="admin", password="password")
+        client.talk("/ip/firewall/address-list/print")
+        client.sock.close()
+
+        assert client.talk("/ip/firewall/address-list/print") == []
+        client.close()
+
+
+class TestMikroTikRouterOSApi:
+    """Test the address-list methods over the RouterOS API."""
+
+    def test_get_address_list(self, fake_router, routeros_api):
+        """Test entries are returned in the same shape as the REST API."""
+        fake_router.add_entry("clients_active", "192.168.1.10", "John Doe")
+        fake_router.add_entry("clients_suspended", "192.168.1.30", "Bob Johnson")
+
+        result = routeros_api.get_address_list(list_name="clients_active")
+
+        assert len(result) == 1
+        assert result[0]["address"] == "192.168.1.10"
+        assert result[0][".id"] == "*1"
+        assert result[0]["comment"] == "John Doe"
+        assert len(routeros_api.get_address_list()) == 2
+
+    def test_add_and_remove(self, fake_router, routeros_api):
+        """Test single add and remove."""
+        routeros_api.add_address_to_list("192.168.1.10", "clients_active", "John Doe")
+        entry_id = routeros_api.get_address_entries("192.168.1.10")[0][".id"]
+        routeros_api.remove_address_from_list(entry_id)
+
+        assert fake_router.entries == {}
+
+    def test_remove_missing_entry_raises(self, routeros_api):
+        """Test a trap is raised as an API error."""
+        with pytest.raises(Exception, match="no such item"):
+            routeros_api.remove_address_from_list("*99")
+
+    def test_bulk_add_and_remove(self, fake_router, routeros_api):
+        """Test bulk operations stream every entry over the one connection."""
+        addresses = [
+            {"ip_address": f"10.0.{i // 256}.{i % 256}", "list_name": "clients_all", "comment": f"Client {i}"}
+            for i in range(500)
+        ]
+        routeros_api.bulk_add_addresses_to_list(addresses)
+        assert len(fake_router.entries) == 500
+
+        entries = routeros_api.get_address_lists(["clients_all"])["clients_all"]
+        to_remove = [
+            {"entry_id": entry[".id"], "ip_address": entry["address"], "list_name": "clients_all"} for entry in entries[:200]
+        ]
+        routeros_api.bulk_remove_addresses_from_list(to_remove)
+
+        assert len(fake_router.entries) == 300
+        assert fake_router.commands.count("/login") == 1
+
+    def test_get_address_lists(self, fake_router, routeros_api):
+        """Test managed lists are fetched in one command with only the synced fields."""
+        fake_router.add_entry("clients_active", "192.168.1.10", "John Doe")
+        fake_router.add_entry("clients_all", "192.168.1.10", "John Doe")
+        fake_router.add_entry("blocklist", "203.0.113.5")
+
+        result = routeros_api.get_address_lists(["clients_active", "clients_suspended", "clients_all"])
+
+        assert result["clients_active"] == [
+            {".id": "*1", "address": "192.168.1.10", "list": "clients_active", "comment": "John Doe"}
+        ]
+        assert result["clients_suspended"] == []
+        assert len(result["clients_all"]) == 1
+        assert "blocklist" not in result
+        assert fake_router.commands.count("/ip/firewall/address-list/print") == 1
+
+    def test_bulk_writes_already_applied_count_as_success(self, fake_router, routeros_api):
+        """Test duplicate adds and removes of missing entries are not recorded as failures."""
+        fake_router.add_entry("clients_active", "192.168.1.10")
+
+        routeros_api.bulk_add_addresses_to_list([{"ip_address": "192.168.1.10", "list_name": "clients_active"}])
+        routeros_api.bulk_remove_addresses_from_list([{"entry_id": "*99", "ip_address": "192.168.1.20"}])
+
+        assert routeros_api.failed_writes == []
+
+    def test_bulk_move_addresses(self, fake_router, routeros_api):
+        """Test moves change the entry's list in place, keeping its ID."""
+        entry = fake_router.add_entry("clients_active", "192.168.1.10", "John Doe - 1_101")
+
+        routeros_api.bulk_move_addresses(
+            [
+                {
+                    "entry_id": entry[".id"],
+                    "ip_address": "192.168.1.10",
+                    "from_list": "clients_active",
+                    "list_name": "clients_suspended",
+                    "comment": "John Doe - 1_101",
+                }
+            ]
+        )
+
+        assert fake_router.entries[entry[".id"]]["list"] == "clients_suspended"
+        assert routeros_api.failed_writes == []
@@ -0,0 +1,180 @@
+"""Tests for snapshot-based incremental diffs."""
+import pytest
+import random
+import sys
+import os
+
+# Add the parent directory to the path so we can import modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from classes.uisp import UISPClientAddress
+from utils.snapshot import SyncSnapshot, record_hash
+from utils.sync import index_desired_entries, index_router_entries, plan_sync
+
+LIST_STATUSES = {"clients_active": ["active"], "clients_suspended": ["suspended"], "clients_all": None}
+MOVE_LISTS = ("clients_active", "clients_suspended")
+
+
+class FakeRouter:
+    """In-memory address lists that plans are applied to."""
+
+    def __init__(self):
+        self.entries = {}
+        self.next_id = 1
+
+    def add(self, list_name, ip_address):
+        self.entries[(list_name, ip_address)] = f"*{self.next_id:X}"
+        self.next_id += 1
+
+    def lists(self):
+        """Entries grouped the way `get_address_lists` returns them."""
+        lists = {list_name: [] for list_name in LIST_STATUSES}
+        for (list_name, ip_address), entry_id in self.entries.items():
+            lists[list_name].append({".id": entry_id, "list": list_name, "address": ip_address})
+        return lists
+
+    def apply(self, plan):
+        for move in plan["moves"]:
+            entry_id = self.entries.pop((move["from_list"], move["ip_address"]))
+            self.entries[(move["list_name"], move["ip_address"])] = entry_id
+        for list_name, changes in plan["lists"].items():
+            for addr_data in changes["remove"]:
+                del self.entries[(list_name, addr_data["ip_address"])]
+            for addr_data in changes["add"]:
+                self.add(list_name, addr_data["ip_address"])
+
+
+def full_plan(addresses, router):
+    """The plan a full diff gives."""
+    return plan_sync(
+        index_desired_entries(addresses, LIST_STATUSES), index_router_entries(router.lists()), LIST_STATUSES, MOVE_LISTS
+    )
+
+
+def normalized(plan):
+    """Plan contents independent of ordering."""
+    return (
+        sorted((move["from_list"], move["list_name"], move["ip_address"]) for move in plan["moves"]),
+        {
+            list_name: (
+                sorted(addr_data["ip_address"] for addr_data in changes["add"]),
+                sorted(addr_data["ip_address"] for addr_data in changes["remove"]),
+                changes["expected_count"],
+            )
+            for list_name, changes in plan["lists"].items()
+        },
+    )
+
+
+def make_address(client_id, status, host=None):
+    """One service per client, at 10.0.x.y."""
+    host = client_id if host is None else host
+    return UISPClientAddress(f"10.0.{host // 256}.{host % 256}", f"Client {client_id}", client_id, client_id, status)
+
+
+@pytest.fixture
+def snapshot_path(tmp_path):
+    """Snapshot file in a temporary directory."""
+    return str(tmp_path / "snapshots" / "default.json")
+
+
+class TestSyncSnapshot:
+    """Test incremental plans against full diffs."""
+
+    def test_record_hash_tracks_content(self):
+        """Test the hash changes with status or IP and not otherwise."""
+        address = make_address(1, "active")
+
+        assert record_hash(address) == record_hash(make_address(1, "active"))
+        assert record_hash(address) != record_hash(make_address(1, "suspended"))
+        assert record_hash(address) != record_hash(make_address(1, "active", host=2))
+
+    def test_incremental_matches_full_diff(self, snapshot_path):
+        """Test every cycle's incremental plan equals a full diff through churn, drift and a skipped apply."""
+        rng = random.Random(7)
+        statuses = ["active", "active", "active", "suspended", "ended"]
+        clients = {client_id: (rng.choice(statuses), client_id) for client_id in range(200)}
+        router = FakeRouter()
+
+        for cycle in range(12):
+            snapshot = SyncSnapshot(path=snapshot_path)
+            addresses = [make_address(client_id, status, host) for client_id, (status, host) in clients.items()]
+            expected = full_plan(addresses, router)
+            plan = snapshot.plan(addresses, router.lists(), LIST_STATUSES, MOVE_LISTS)
+            assert normalized(plan) == normalized(expected), f"cycle {cycle}"
+
+            # Cycle 5's plan is never applied, as on a dry run
+            if cycle != 5:
+                router.apply(plan)
+                snapshot.save()
+
+            # Churn: status changes, new and removed clients, a readdressed client and a hand edit on the router
+            for client_id in rng.sample(sorted(clients), 5):
+                clients[client_id] = (rng.choice(statuses), clients[client_id][1])
+            clients[1000 + cycle] = ("active", 1000 + cycle)
+            del clients[rng.choice(sorted(clients))]
+            readdressed = rng.choice(sorted(clients))
+            clients[readdressed] = (clients[readdressed][0], 2000 + cycle)
+            router.entries.pop(rng.choice(sorted(router.entries)))
+
+        # Once the router is in sync there is nothing left to do
+        addresses = [make_address(client_id, status, host) for client_id, (status, host) in clients.items()]
+        router.apply(full_plan(addresses, router))
+        snapshot = SyncSnapshot(path=snapshot_path)
+        snapshot.plan(addresses, router.lists(), LIST_STATUSES, MOVE_LISTS)
+        snapshot.save()
+        plan = snapshot.plan(addresses, router.lists(), LIST_STATUSES, MOVE_LISTS)
+        assert normalized(plan) == normalized(full_plan(addresses, router))
+        assert all(not changes["add"] and not changes["remove"] for changes in plan["lists"].values())
+
+    def test_unchanged_cycle_checks_nothing(self, snapshot_path, caplog):
+        """Test a cycle with no changes on either side examines no entries and writes nothing."""
+        addresses = [make_address(client_id, "active") for client_id in range(50)]
+        router = FakeRouter()
+        snapshot = SyncSnapshot(path=snapshot_path)
+        router.apply(snapshot.plan(addresses, router.lists(), LIST_STATUSES, MOVE_LISTS))
+        snapshot.save()
+        snapshot.plan(addresses, router.lists(), LIST_STATUSES, MOVE_LISTS)
+        snapshot.save()
+
+        with caplog.at_level("INFO", logger="utils.snapshot"):
+            snapshot.plan(addresses, router.lists(), LIST_STATUSES, MOVE_LISTS)
+        os.utime(snapshot_path, (0, 0))
+        snapshot.save()
+
+        assert "0 of 50 UISP records changed, 0 router entries changed, 0 entries checked" in caplog.text
+        assert os.path.getmtime(snapshot_path) == 0, "an unchanged cycle should not rewrite the snapshot"
+
+    def test_other_settings_ignored(self, snapshot_path):
+        """Test a snapshot taken with other list settings is not used."""
+        addresses = [make_address(1, "active")]
+        snapshot = SyncSnapshot(path=snapshot_path, fingerprint="a")
+        snapshot.plan(addresses, FakeRouter().lists(), LIST_STATUSES, MOVE_LISTS)
+        snapshot.save()
+
+        assert SyncSnapshot(path=snapshot_path, fingerprint="a").state is not None
+        assert SyncSnapshot(path=snapshot_path, fingerprint="b").state is None
+
+    def test_full_diff_after_full_sync_every(self, snapshot_path):
+        """Test a full diff runs once `full_sync_every` incremental cycles have passed."""
+        addresses = [make_address(1, "active")]
+        router = FakeRouter()
+        snapshot = SyncSnapshot(path=snapshot_path, full_sync_every=2)
+        counts = []
+        for _cycle in range(4):
+            router.apply(snapshot.plan(addresses, router.lists(), LIST_STATUSES, MOVE_LISTS))
+            snapshot.save()
+            counts.append(snapshot.state["incremental_cycles"])
+
+        assert counts == [0, 1, 2, 0]
+
+    def test_discard(self, snapshot_path):
+        """Test a discarded snapshot is forgotten and its file removed."""
+        snapshot = SyncSnapshot(path=snapshot_path)
+        snapshot.plan([make_address(1, "active")], FakeRouter().lists(), LIST_STATUSES, MOVE_LISTS)
+        snapshot.save()
+
+        snapshot.discard()
+
+        assert snapshot.state is None
+        assert not os.path.exists(snapshot_path)
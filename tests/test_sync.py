@@ -0,0 +1,221 @@
+"""Tests for the address-list diff engine."""
+import pytest
+import sys
+import os
+from unittest.mock import Mock, call
+
+# Add the parent directory to the path so we can import modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from classes.uisp import UISPClientAddress
+from utils.sync import (
+    index_desired_entries,
+    index_router_entries,
+    plan_sync,
+    apply_sync_plan,
+    summarize_plan,
+    save_plans,
+    load_plans,
+)
+
+LIST_STATUSES = {"clients_active": ["active"], "clients_suspended": ["suspended"], "clients_all": None}
+MOVE_LISTS = ("clients_active", "clients_suspended")
+
+
+@pytest.fixture
+def uisp_addresses():
+    """Two active services and one suspended."""
+    return [
+        UISPClientAddress("192.168.1.10", "John Doe", 1, 101, "active"),
+        UISPClientAddress("192.168.1.11", "Jane Smith", 2, 102, "active"),
+        UISPClientAddress("192.168.1.30", "Bob Johnson", 3, 103, "suspended"),
+    ]
+
+
+def router_lists(entries):
+    """Group (id, list, address) tuples the way `get_address_lists` returns them."""
+    lists = {list_name: [] for list_name in LIST_STATUSES}
+    for entry_id, list_name, address in entries:
+        lists.setdefault(list_name, []).append({".id": entry_id, "list": list_name, "address": address})
+    return lists
+
+
+class TestIndexing:
+    """Test indexing desired and router state."""
+
+    def test_index_desired_entries(self, uisp_addresses):
+        """Test each address lands on every list its status belongs to, with its comment."""
+        desired = index_desired_entries(uisp_addresses, LIST_STATUSES)
+
+        assert desired[("clients_active", "192.168.1.10")] == "John Doe - 1_101"
+        assert ("clients_suspended", "192.168.1.30") in desired
+        assert ("clients_active", "192.168.1.30") not in desired
+        assert len([key for key in desired if key[0] == "clients_all"]) == 3
+
+    def test_index_desired_entries_aggregated(self, uisp_addresses):
+        """Test aggregated lists hold collapsed prefixes."""
+        desired = index_desired_entries(uisp_addresses, LIST_STATUSES, aggregate_lists={"clients_active"})
+
+        assert desired[("clients_active", "192.168.1.10/31")] == "Aggregate of 2 services"
+        assert ("clients_active", "192.168.1.10") not in desired
+        assert ("clients_all", "192.168.1.10") in desired
+
+    def test_index_desired_entries_extra_list(self, uisp_addresses):
+        """Test a configured list fills from its statuses alongside the built-in ones."""
+        uisp_addresses.append(UISPClientAddress("192.168.1.40", "Ann Lee", 4, 104, "prepared blocked"))
+        list_statuses = {**LIST_STATUSES, "walled_garden": ["prepared blocked", "suspended"]}
+
+        desired = index_desired_entries(uisp_addresses, list_statuses)
+
+        assert sorted(ip for list_name, ip in desired if list_name == "walled_garden") == ["192.168.1.30", "192.168.1.40"]
+        assert ("clients_all", "192.168.1.40") in desired
+
+    def test_index_router_entries(self):
+        """Test router entries are indexed to their IDs."""
+        current = index_router_entries(router_lists([("*1", "clients_active", "192.168.1.10")]))
+
+        assert current == {("clients_active", "192.168.1.10"): "*1"}
+
+
+class TestPlanSync:
+    """Test building the change plan."""
+
+    def test_empty_router_adds_everything(self, uisp_addresses):
+        """Test every desired entry is added to an empty router."""
+        plan = plan_sync(index_desired_entries(uisp_addresses, LIST_STATUSES), {}, LIST_STATUSES, MOVE_LISTS)
+
+        assert plan["moves"] == []
+        assert [len(plan["lists"][list_name]["add"]) for list_name in LIST_STATUSES] == [2, 1, 3]
+        assert plan["lists"]["clients_all"]["expected_count"] == 3
+
+    def test_in_sync_router_has_no_changes(self, uisp_addresses):
+        """Test a router already matching UISP gets an empty plan."""
+        desired = index_desired_entries(uisp_addresses, LIST_STATUSES)
+        current = {key: f"*{i}" for i, key in enumerate(desired)}
+
+        plan = plan_sync(desired, current, LIST_STATUSES, MOVE_LISTS)
+
+        assert plan["moves"] == []
+        assert all(not changes["add"] and not changes["remove"] for changes in plan["lists"].values())
+
+    def test_status_change_is_a_move(self, uisp_addresses):
+        """Test a service changing between move lists becomes one move with counts adjusted."""
+        current = index_router_entries(
+            router_lists(
+                [
+                    ("*1", "clients_active", "192.168.1.10"),
+                    ("*2", "clients_active", "192.168.1.11"),
+                    ("*3", "clients_active", "192.168.1.30"),
+                    ("*4", "clients_all", "192.168.1.10"),
+                    ("*5", "clients_all", "192.168.1.11"),
+                    ("*6", "clients_all", "192.168.1.30"),
+                ]
+            )
+        )
+
+        plan = plan_sync(index_desired_entries(uisp_addresses, LIST_STATUSES), current, LIST_STATUSES, MOVE_LISTS)
+
+        assert plan["moves"] == [
+            {
+                "ip_address": "192.168.1.30",
+                "list_name": "clients_suspended",
+                "comment": "Bob Johnson - 3_103",
+                "entry_id": "*3",
+                "from_list": "clients_active",
+            }
+        ]
+        assert plan["lists"]["clients_active"] == {"add": [], "remove": [], "expected_count": 2}
+        assert plan["lists"]["clients_suspended"] == {"add": [], "remove": [], "expected_count": 1}
+
+    def test_unmanaged_lists_ignored(self, uisp_addresses):
+        """Test entries on lists outside the managed set are never removed."""
+        current = index_router_entries(router_lists([("*9", "blocklist", "203.0.113.5")]))
+
+        plan = plan_sync(index_desired_entries(uisp_addresses, LIST_STATUSES), current, LIST_STATUSES, MOVE_LISTS)
+
+        assert "blocklist" not in plan["lists"]
+        assert all(not changes["remove"] for changes in plan["lists"].values())
+
+    def test_ip_leaving_two_move_lists(self):
+        """Test an IP on both move lists is removed from both when it is no longer wanted."""
+        current = {("clients_active", "10.0.0.1"): "*1", ("clients_suspended", "10.0.0.1"): "*2"}
+
+        plan = plan_sync({}, current, LIST_STATUSES, MOVE_LISTS)
+
+        assert plan["moves"] == []
+        assert [addr["entry_id"] for addr in plan["lists"]["clients_active"]["remove"]] == ["*1"]
+        assert [addr["entry_id"] for addr in plan["lists"]["clients_suspended"]["remove"]] == ["*2"]
+
+    def test_removal_without_move(self, uisp_addresses):
+        """Test an entry for a service that is gone is removed from its list."""
+        current = index_router_entries(router_lists([("*7", "clients_all", "192.168.1.99")]))
+
+        plan = plan_sync(index_desired_entries(uisp_addresses, LIST_STATUSES), current, LIST_STATUSES, MOVE_LISTS)
+
+        assert plan["lists"]["clients_all"]["remove"] == [
+            {"entry_id": "*7", "ip_address": "192.168.1.99", "list_name": "clients_all"}
+        ]
+        assert plan["lists"]["clients_all"]["expected_count"] == 3
+
+
+class TestApplySyncPlan:
+    """Test applying a change plan to a router."""
+
+    def test_moves_then_lists_with_changes(self, uisp_addresses):
+        """Test moves are applied first and lists without changes are skipped."""
+        plan = plan_sync(
+            index_desired_entries(uisp_addresses, LIST_STATUSES),
+            {("clients_active", "192.168.1.30"): "*3"},
+            LIST_STATUSES,
+            MOVE_LISTS,
+        )
+        plan["lists"]["clients_suspended"] = {"add": [], "remove": [], "expected_count": 1}
+        mikrotik_api = Mock()
+
+        apply_sync_plan(mikrotik_api, plan, aggregate_lists={"clients_all"})
+
+        assert mikrotik_api.method_calls[0] == call.bulk_move_addresses(plan["moves"])
+        synced = [c.kwargs["list_name"] for c in mikrotik_api.bulk_sync_address_list.call_args_list]
+        assert synced == ["clients_active", "clients_all"]
+        assert mikrotik_api.bulk_sync_address_list.call_args.kwargs["add_first"] is True
+        assert mikrotik_api.bulk_sync_address_list.call_args.kwargs["expected_count"] == 3
+
+
+class TestPlanFiles:
+    """Test summarizing, saving and loading plans."""
+
+    def test_summarize_plan(self, uisp_addresses):
+        """Test adds, removes and moves are counted per list."""
+        plan = plan_sync(
+            index_desired_entries(uisp_addresses, LIST_STATUSES),
+            {("clients_active", "192.168.1.30"): "*3", ("clients_all", "192.168.1.99"): "*7"},
+            LIST_STATUSES,
+            MOVE_LISTS,
+        )
+
+        assert summarize_plan(plan) == {
+            "clients_active": {"add": 2, "remove": 0, "move": 0},
+            "clients_suspended": {"add": 0, "remove": 0, "move": 1},
+            "clients_all": {"add": 3, "remove": 1, "move": 0},
+        }
+
+    def test_save_and_load_round_trip(self, tmp_path, uisp_addresses):
+        """Test a saved plan loads back unchanged and can be applied."""
+        plan = plan_sync(index_desired_entries(uisp_addresses, LIST_STATUSES), {}, LIST_STATUSES, MOVE_LISTS)
+        path = str(tmp_path / "plans" / "plan.json")
+
+        save_plans(path, {"core": plan}, {"core": 0.002})
+        loaded = load_plans(path)
+
+        assert loaded == {"core": plan}
+        mikrotik_api = Mock()
+        apply_sync_plan(mikrotik_api, loaded["core"])
+        assert mikrotik_api.bulk_sync_address_list.call_count == 3
+
+    def test_load_rejects_other_versions(self, tmp_path):
+        """Test a plan file from another format version is refused."""
+        path = tmp_path / "plan.json"
+        path.write_text('{"version": 99, "routers": {}}')
+
+        with pytest.raises(ValueError, match="version 99"):
+            load_plans(str(path))
@@ -43,7 +43,7 @@ class TestUISPApi:
         """Test successful get_devices call."""
         mock_api_response.json.return_value = mock_uisp_devices
         
-        with patch('utils.base.requests.request', return_value=mock_api_response):
+        with patch('utils.base.requests.Session.request', return_value=mock_api_response):
             api = UISPApi(
                 base_url="test.uisp.com",
                 api_version="v2.1",
@@ -56,7 +56,7 @@ class TestUISPApi:
 
     def test_uisp_api_get_devices_error(self, mock_api_error_response):
         """Test get_devices call with API error."""
-        with patch('utils.base.requests.request', return_value=mock_api_error_response):
+        with patch('utils.base.requests.Session.request', return_value=mock_api_error_response):
             api = UISPApi(
                 base_url="test.uisp.com",
                 api_version="v2.1",
@@ -66,12 +66,35 @@ class TestUISPApi:
             with pytest.raises(Exception, match="Error communicating to the API: 401 Client Error: Unauthorized"):
                 api.get_devices()
 
+    def test_uisp_api_get_device_addresses(self, mock_uisp_devices, mock_api_response):
+        """Test get_device_addresses excludes interfaces and trims each device."""
+        devices = [dict(device, interfaces=[{"id": "eth0"}]) for device in mock_uisp_devices]
+        mock_api_response.json.return_value = devices
+
+        with patch('utils.base.requests.Session.request', return_value=mock_api_response) as mock_request:
+            api = UISPApi(
+                base_url="test.uisp.com",
+                api_version="v2.1",
+                token="test-token"
+            )
+
+            result = api.get_device_addresses(roles=["station"])
+
+            params = mock_request.call_args.kwargs["params"]
+            assert params["withInterfaces"] == "false"
+            assert params["role"] == ["station"]
+            assert len(result) == len(devices)
+            assert "interfaces" not in result[0]
+            assert result[0]["identification"]["site"] == {"id": "site-1"}
+            assert result[0]["ipAddress"] == "192.168.1.10/24"
+            assert result[3]["identification"]["site"] is None
+
     def test_uisp_api_get_sites_success(self, mock_api_response):
         """Test successful get_sites call."""
         mock_sites = [{"id": "site-1", "name": "Site 1"}]
         mock_api_response.json.return_value = mock_sites
         
-        with patch('utils.base.requests.request', return_value=mock_api_response):
+        with patch('utils.base.requests.Session.request', return_value=mock_api_response):
             api = UISPApi(
                 base_url="test.uisp.com",
                 api_version="v2.1",
@@ -133,7 +156,7 @@ class TestUCRMApi:
         """Test successful get_clients call."""
         mock_api_response.json.return_value = mock_uisp_clients
         
-        with patch('utils.base.requests.request', return_value=mock_api_response):
+        with patch('utils.base.requests.Session.request', return_value=mock_api_response):
             api = UCRMApi(
                 base_url="test.uisp.com",
                 api_version="v2.1",
@@ -148,7 +171,7 @@ class TestUCRMApi:
         """Test successful get_services call."""
         mock_api_response.json.return_value = mock_uisp_services
         
-        with patch('utils.base.requests.request', return_value=mock_api_response):
+        with patch('utils.base.requests.Session.request', return_value=mock_api_response):
             api = UCRMApi(
                 base_url="test.uisp.com",
                 api_version="v2.1",
@@ -159,9 +182,76 @@ class TestUCRMApi:
             
             assert result == mock_uisp_services
 
+    def test_ucrm_api_get_services_by_status(self, mock_uisp_services, mock_api_response):
+        """Test get_services passes status filters to the server."""
+        mock_api_response.json.return_value = mock_uisp_services[:2]
+
+        with patch('utils.base.requests.Session.request', return_value=mock_api_response) as mock_request:
+            api = UCRMApi(
+                base_url="test.uisp.com",
+                api_version="v2.1",
+                token="test-token"
+            )
+
+            result = api.get_services(statuses=[1, 3])
+
+            assert result == mock_uisp_services[:2]
+            assert mock_request.call_args.kwargs["params"]["statuses[]"] == [1, 3]
+
+    def test_ucrm_api_iter_clients_paginates(self, mock_uisp_clients):
+        """Test iter_clients walks limit/offset pages until a short page."""
+        pages = [mock_uisp_clients[:2], mock_uisp_clients[2:]]
+        responses = []
+        for page in pages:
+            response = Mock()
+            response.status_code = 200
+            response.text = "[]"
+            response.json.return_value = page
+            response.raise_for_status.return_value = None
+            responses.append(response)
+
+        with patch('utils.base.requests.Session.request', side_effect=responses) as mock_request:
+            api = UCRMApi(
+                base_url="test.uisp.com",
+                api_version="v2.1",
+                token="test-token"
+            )
+
+            result = list(api.iter_clients(page_size=2))
+
+            assert result == mock_uisp_clients
+            offsets = [call.kwargs["params"]["offset"] for call in mock_request.call_args_list]
+            assert offsets == [0, 2]
+            assert all(call.kwargs["params"]["limit"] == 2 for call in mock_request.call_args_list)
+
+    def test_ucrm_api_iter_services_empty_last_page(self, mock_uisp_services):
+        """Test iter_services stops on an empty page after a full one."""
+        full_page = Mock()
+        full_page.status_code = 200
+        full_page.text = "[]"
+        full_page.json.return_value = mock_uisp_services
+        full_page.raise_for_status.return_value = None
+        empty_page = Mock()
+        empty_page.status_code = 200
+        empty_page.text = "[]"
+        empty_page.json.return_value = []
+        empty_page.raise_for_status.return_value = None
+
+        with patch('utils.base.requests.Session.request', side_effect=[full_page, empty_page]) as mock_request:
+            api = UCRMApi(
+                base_url="test.uisp.com",
+                api_version="v2.1",
+                token="test-token"
+            )
+
+            result = list(api.iter_services(page_size=len(mock_uisp_services)))
+
+            assert result == mock_uisp_services
+            assert mock_request.call_count == 2
+
     def test_ucrm_api_get_clients_error(self, mock_api_error_response):
         """Test get_clients call with API error."""
-        with patch('utils.base.requests.request', return_value=mock_api_error_response):
+        with patch('utils.base.requests.Session.request', return_value=mock_api_error_response):
             api = UCRMApi(
                 base_url="test.uisp.com",
                 api_version="v2.1",
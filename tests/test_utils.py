@@ -2,8 +2,7 @@
 import pytest
 import sys
 import os
-import random
-from unittest.mock import patch
+from unittest.mock import Mock
 
 # Add the parent directory to the path so we can import modules
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -12,6 +11,16 @@ from utils import (
     lookup_client_ip,
     lookup_service_id,
     lookup_service_status,
+    default_fallback_ip,
+    lookup_client_services,
+    index_services_by_client,
+    index_devices_by_site,
+    index_site_parents,
+    aggregate_client_addresses,
+    partition_addresses_by_router,
+    join_client_addresses,
+    fetch_concurrently,
+    service_statuses_for_lists,
     get_objects_by_key_value,
     find_missing_items,
     str_to_bool,
@@ -46,15 +55,13 @@ class TestLookupFunctions:
 
     def test_lookup_client_ip_found(self, mock_uisp_devices, mock_uisp_services):
         """Test lookup_client_ip when IP is found."""
-        with patch('utils.random.randint', return_value=100):
-            result = lookup_client_ip(mock_uisp_devices, mock_uisp_services, 1)
-            assert result == "192.168.1.10"
+        result = lookup_client_ip(mock_uisp_devices, mock_uisp_services, 1)
+        assert result == "192.168.1.10"
 
     def test_lookup_client_ip_not_found(self, mock_uisp_devices, mock_uisp_services):
         """Test lookup_client_ip when IP is not found."""
-        with patch('utils.random.randint', return_value=100):
-            result = lookup_client_ip(mock_uisp_devices, mock_uisp_services, 999)
-            assert result is None
+        result = lookup_client_ip(mock_uisp_devices, mock_uisp_services, 999)
+        assert result is None
 
     def test_lookup_client_ip_device_no_site(self, mock_uisp_devices, mock_uisp_services):
         """Test lookup_client_ip with device that has no site assignment."""
@@ -66,10 +73,9 @@ class TestLookupFunctions:
             "unmsClientSiteId": "site-4"
         }]
         
-        with patch('utils.random.randint', return_value=100):
-            result = lookup_client_ip(mock_uisp_devices, services_with_no_site, 4)
-            # When no matching device is found, the function returns None
-            assert result is None
+        result = lookup_client_ip(mock_uisp_devices, services_with_no_site, 4)
+        # When no matching device is found, the function returns None
+        assert result is None
 
     def test_lookup_client_ip_device_no_ip(self, mock_uisp_devices, mock_uisp_services):
         """Test lookup_client_ip with device that has no IP address."""
@@ -77,9 +83,245 @@ class TestLookupFunctions:
         devices_no_ip = mock_uisp_devices.copy()
         devices_no_ip[0]["ipAddress"] = None
         
-        with patch('utils.random.randint', return_value=100):
-            result = lookup_client_ip(devices_no_ip, mock_uisp_services, 1)
-            assert result == "192.0.0.100"
+        result = lookup_client_ip(devices_no_ip, mock_uisp_services, 1)
+        assert result == default_fallback_ip(1)
+        assert result.startswith("192.0.0.")
+        # The same client gets the same fallback every cycle
+        assert lookup_client_ip(devices_no_ip, mock_uisp_services, 1) == result
+
+    def test_lookup_client_ip_device_no_ip_allocator(self, mock_uisp_devices, mock_uisp_services):
+        """Test lookup_client_ip takes the fallback from an allocator when given."""
+        devices_no_ip = [dict(device) for device in mock_uisp_devices]
+        devices_no_ip[0]["ipAddress"] = None
+        allocator = Mock()
+        allocator.allocate.return_value = "192.0.0.7"
+
+        result = lookup_client_ip(devices_no_ip, mock_uisp_services, 1, fallback_allocator=allocator)
+        assert result == "192.0.0.7"
+        allocator.allocate.assert_called_once_with(1)
+
+    def test_lookup_client_ip_device_no_ip_excluded(self, mock_uisp_devices, mock_uisp_services):
+        """Test lookup_client_ip gives no IP when fallbacks are excluded."""
+        devices_no_ip = [dict(device) for device in mock_uisp_devices]
+        devices_no_ip[0]["ipAddress"] = None
+
+        result = lookup_client_ip(devices_no_ip, mock_uisp_services, 1, exclude_fallback=True)
+        assert result is None
+
+
+class TestIndexedJoin:
+    """Test the indexed join of clients, services and devices."""
+
+    def test_index_services_by_client(self, mock_uisp_services):
+        """Test services are grouped by clientId."""
+        index = index_services_by_client(mock_uisp_services)
+        assert set(index) == {1, 2, 3}
+        assert index[1][0]["id"] == 101
+
+    def test_index_services_by_client_accepts_generator(self, mock_uisp_services):
+        """Test the services index can be built from a generator."""
+        index = index_services_by_client(service for service in mock_uisp_services)
+        assert len(index) == 3
+
+    def test_index_devices_by_site_skips_unassigned(self, mock_uisp_devices):
+        """Test devices without a site are left out of the index."""
+        index = index_devices_by_site(mock_uisp_devices)
+        assert set(index) == {"site-1", "site-2", "site-3"}
+        assert index["site-1"]["id"] == "device-1"
+
+    def test_lookups_with_indexes(self, mock_uisp_devices, mock_uisp_services):
+        """Test the lookup helpers give the same answers with indexes as with lists."""
+        services = index_services_by_client(mock_uisp_services)
+        devices = index_devices_by_site(mock_uisp_devices)
+
+        assert lookup_service_id(services, 2) == 102
+        assert lookup_service_status(services, 3) == 2
+        assert lookup_client_ip(devices, services, 1) == "192.168.1.10"
+        assert lookup_client_ip(devices, services, 999) is None
+
+    def test_join_client_addresses(self, mock_uisp_clients, mock_uisp_services, mock_uisp_devices):
+        """Test every client is resolved in one pass."""
+        result = join_client_addresses(mock_uisp_clients, mock_uisp_services, mock_uisp_devices)
+
+        assert [addr.ip_address for addr in result] == ["192.168.1.10", "192.168.1.20", "192.168.1.30"]
+        assert [addr.service_status for addr in result] == ["active", "active", "ended"]
+        assert result[0].client_name == "John Doe"
+        assert result[0].service_id == 101
+
+    def test_join_client_addresses_multiple_services(self, mock_uisp_clients, mock_uisp_services, mock_uisp_devices):
+        """Test a client with services at several sites gets one record per service."""
+        services = mock_uisp_services + [{"id": 104, "clientId": 1, "status": 3, "unmsClientSiteId": "site-2"}]
+        result = join_client_addresses(mock_uisp_clients, services, mock_uisp_devices)
+
+        client_records = {addr.service_id: addr for addr in result if addr.client_id == 1}
+        assert set(client_records) == {101, 104}
+        assert client_records[101].ip_address == "192.168.1.10"
+        assert client_records[101].service_status == "active"
+        assert client_records[104].ip_address == "192.168.1.20"
+        assert client_records[104].service_status == "suspended"
+        assert client_records[104].site_id == "site-2"
+
+    def test_join_client_addresses_skips_service_without_device(self, mock_uisp_clients, mock_uisp_services, mock_uisp_devices):
+        """Test a service without a device is skipped while the client's other services are kept."""
+        services = mock_uisp_services + [{"id": 104, "clientId": 1, "status": 1, "unmsClientSiteId": "site-9"}]
+        result = join_client_addresses(mock_uisp_clients, services, mock_uisp_devices)
+
+        assert [addr.service_id for addr in result if addr.client_id == 1] == [101]
+
+    def test_lookup_client_services(self, mock_uisp_services):
+        """Test every service of a client is returned."""
+        services = mock_uisp_services + [{"id": 104, "clientId": 1, "status": 1, "unmsClientSiteId": "site-2"}]
+
+        assert [service["id"] for service in lookup_client_services(services, 1)] == [101, 104]
+        assert [service["id"] for service in lookup_client_services(index_services_by_client(services), 1)] == [101, 104]
+        assert lookup_client_services(services, 999) == []
+
+    def test_join_client_addresses_skips_unresolved(self, mock_uisp_clients, mock_uisp_devices):
+        """Test clients without a service are skipped."""
+        services = [{"id": 101, "clientId": 1, "status": 1, "unmsClientSiteId": "site-1"}]
+        result = join_client_addresses(mock_uisp_clients, services, mock_uisp_devices)
+
+        assert len(result) == 1
+        assert result[0].client_id == 1
+
+
+class TestRouterPartitions:
+    """Test splitting subscribers between routers by site."""
+
+    sites = [
+        {"id": "region-north", "identification": {"id": "region-north", "parent": None}},
+        {"id": "tower-1", "identification": {"id": "tower-1", "parent": {"id": "region-north"}}},
+        {"id": "client-site-1", "identification": {"id": "client-site-1", "parent": {"id": "tower-1"}}},
+        {"id": "client-site-2", "identification": {"id": "client-site-2", "parent": {"id": "tower-2"}}},
+    ]
+
+    def addresses(self):
+        """One subscriber at each client site, and one without a site."""
+        from classes.uisp import UISPClientAddress
+
+        return [
+            UISPClientAddress("10.0.0.1", "John Doe", 1, 101, "active", site_id="client-site-1"),
+            UISPClientAddress("10.0.0.2", "Jane Smith", 2, 102, "active", site_id="client-site-2"),
+            UISPClientAddress("10.0.0.3", "Bob Johnson", 3, 103, "active"),
+        ]
+
+    def test_index_site_parents(self):
+        """Test each site is indexed to its parent."""
+        site_parents = index_site_parents(self.sites)
+
+        assert site_parents["client-site-1"] == "tower-1"
+        assert site_parents["region-north"] is None
+
+    def test_partition_follows_site_ancestry(self):
+        """Test a router listing a parent site gets the subscribers of every site below it."""
+        router_sites = {"north": {"region-north"}, "south": {"tower-2"}, "core": None}
+
+        partitions = partition_addresses_by_router(self.addresses(), router_sites, index_site_parents(self.sites))
+
+        assert [addr.ip_address for addr in partitions["north"]] == ["10.0.0.1"]
+        assert [addr.ip_address for addr in partitions["south"]] == ["10.0.0.2"]
+        assert len(partitions["core"]) == 3
+
+    def test_partition_survives_parent_cycle(self):
+        """Test a loop in site parents does not hang the walk."""
+        site_parents = {"client-site-1": "tower-1", "tower-1": "client-site-1"}
+
+        partitions = partition_addresses_by_router(self.addresses(), {"north": {"region-north"}}, site_parents)
+
+        assert partitions["north"] == []
+
+
+class TestAggregateAddresses:
+    """Test collapsing client addresses into prefixes."""
+
+    def addresses(self, hosts):
+        """One active service per host number in 10.0.0.0/24."""
+        from classes.uisp import UISPClientAddress
+
+        return [UISPClientAddress(f"10.0.0.{host}", f"Client {host}", host, 100 + host, "active") for host in hosts]
+
+    def test_contiguous_block_collapses(self):
+        """Test an aligned run of addresses becomes one prefix and a lone address stays a /32."""
+        result = aggregate_client_addresses(self.addresses([4, 5, 6, 7, 9]))
+
+        assert [addr.ip_address for addr in result] == ["10.0.0.4/30", "10.0.0.9"]
+        assert len(result[0].members) == 4
+        assert result[1].comment == "Client 9 - 9_109"
+
+    def test_status_change_splits_only_its_prefix(self):
+        """Test removing one member splits its prefix and leaves other prefixes alone."""
+        before = {addr.ip_address for addr in aggregate_client_addresses(self.addresses(range(8)))}
+        after = {addr.ip_address for addr in aggregate_client_addresses(self.addresses([0, 1, 2, 4, 5, 6, 7]))}
+
+        assert before == {"10.0.0.0/29"}
+        assert after == {"10.0.0.0/31", "10.0.0.2", "10.0.0.4/30"}
+
+    def test_unparseable_address_kept(self):
+        """Test an address that is not an IP is passed through untouched."""
+        from classes.uisp import UISPClientAddress
+
+        odd = UISPClientAddress("not-an-ip", "Client", 1, 101, "active")
+
+        assert aggregate_client_addresses([odd]) == [odd]
+
+
+class TestFetchConcurrently:
+    """Test the concurrent fetch phase."""
+
+    def test_fetch_concurrently_results_and_timings(self):
+        """Test every source result and timing is returned by name."""
+        results, timings = fetch_concurrently({"clients": lambda: [1, 2], "devices": lambda: {"site-1": {}}})
+
+        assert results == {"clients": [1, 2], "devices": {"site-1": {}}}
+        assert set(timings) == {"clients", "devices"}
+        assert all(elapsed >= 0 for elapsed in timings.values())
+
+    def test_fetch_concurrently_runs_in_parallel(self):
+        """Test sources wait on each other rather than running one after another."""
+        import threading
+
+        barrier = threading.Barrier(3, timeout=5)
+        sources = {name: barrier.wait for name in ("clients", "services", "devices")}
+
+        # Would raise BrokenBarrierError if the sources ran serially
+        results, _ = fetch_concurrently(sources)
+        assert len(results) == 3
+
+    def test_fetch_concurrently_raises_source_error(self):
+        """Test a failing source raises after the other sources finish."""
+
+        def failing():
+            raise Exception("Error communicating to the API")
+
+        with pytest.raises(Exception, match="Error communicating to the API"):
+            fetch_concurrently({"clients": lambda: [], "services": failing})
+
+
+class TestServiceStatusFilter:
+    """Test deriving server-side service filters from list definitions."""
+
+    def test_service_statuses_for_lists(self):
+        """Test status names from every list are combined into codes."""
+        lists = {"clients_active": ["active"], "clients_suspended": ["suspended"], "clients_all": ["active", "suspended"]}
+        assert service_statuses_for_lists(lists) == [1, 3]
+
+    def test_service_statuses_for_lists_unrestricted(self):
+        """Test no filter is returned when a list takes every status."""
+        lists = {"clients_active": ["active"], "clients_all": None}
+        assert service_statuses_for_lists(lists) is None
+
+    def test_service_statuses_for_lists_unknown_status(self):
+        """Test an unknown status name is rejected."""
+        with pytest.raises(ValueError, match="Unknown service status"):
+            service_statuses_for_lists({"clients_active": ["live"]})
+
+    def test_join_quiet_for_filtered_services(self, mock_uisp_clients, mock_uisp_devices, caplog):
+        """Test clients filtered out on the server are skipped without a warning."""
+        services = [{"id": 101, "clientId": 1, "status": 1, "unmsClientSiteId": "site-1"}]
+        result = join_client_addresses(mock_uisp_clients, services, mock_uisp_devices, warn_missing_service=False)
+
+        assert len(result) == 1
+        assert "no service found" not in caplog.text
 
 
 class TestObjectFunctions:
@@ -0,0 +1,248 @@
+"""Tests for the UCRM webhook receiver and incremental sync."""
+import pytest
+import sys
+import os
+import threading
+import requests
+from unittest.mock import Mock
+
+# Add the parent directory to the path so we can import modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.webhook import WebhookReceiver, IncrementalSync, event_client_id
+from classes.uisp import UISPClientAddress
+
+
+def sample_event(event_name, client_id=1, service_id=101, uuid="event-1"):
+    """Build a UCRM webhook payload like the ones UCRM posts."""
+    entity, change_type = event_name.split(".", 1)
+    if entity == "client":
+        return {
+            "uuid": uuid,
+            "changeType": change_type,
+            "entity": "client",
+            "entityId": str(client_id),
+            "eventName": event_name,
+            "extraData": {"entity": {"id": client_id}, "entityBeforeEdit": None},
+        }
+    return {
+        "uuid": uuid,
+        "changeType": change_type,
+        "entity": "service",
+        "entityId": str(service_id),
+        "eventName": event_name,
+        "extraData": {"entity": {"id": service_id, "clientId": client_id}, "entityBeforeEdit": None},
+    }
+
+
+@pytest.fixture
+def receiver():
+    """Webhook receiver on a free local port that records handled events."""
+    handled = []
+    done = threading.Event()
+
+    def handler(event):
+        handled.append(event)
+        done.set()
+
+    webhook_receiver = WebhookReceiver(handler=handler, host="127.0.0.1", port=0, token="secret")
+    webhook_receiver.handled = handled
+    webhook_receiver.done = done
+    webhook_receiver.start()
+    yield webhook_receiver
+    webhook_receiver.stop()
+
+
+def post_event(webhook_receiver, event, token="secret"):
+    """Post an event to the receiver like UCRM would."""
+    host, port = webhook_receiver.server_address
+    return requests.post(f"http://{host}:{port}/webhook?token={token}", json=event, timeout=5)
+
+
+class TestEventClientId:
+    """Test resolving the affected client from an event."""
+
+    def test_service_event(self):
+        """Test service events use the service's clientId."""
+        assert event_client_id(sample_event("service.suspend", client_id=7)) == 7
+
+    def test_client_event(self):
+        """Test client events use the entity Id."""
+        assert event_client_id(sample_event("client.edit", client_id=9)) == 9
+
+    def test_missing_client(self):
+        """Test events without a client give None."""
+        assert event_client_id({"entity": "service", "extraData": {}}) is None
+
+
+class TestWebhookReceiver:
+    """Test WebhookReceiver with a local stand-in posting sample events."""
+
+    def test_handled_event_is_queued(self, receiver):
+        """Test a suspend event is accepted and handed to the handler."""
+        response = post_event(receiver, sample_event("service.suspend"))
+
+        assert response.status_code == 200
+        assert response.json()["status"] == "queued"
+        assert receiver.done.wait(timeout=5)
+        assert receiver.handled[0]["eventName"] == "service.suspend"
+
+    def test_unhandled_event_is_ignored(self, receiver):
+        """Test events that cannot change lists are ignored."""
+        response = post_event(receiver, sample_event("client.add"))
+
+        assert response.json()["status"] == "ignored"
+
+    def test_redelivered_event_is_dropped(self, receiver):
+        """Test a redelivered event uuid is only handled once."""
+        post_event(receiver, sample_event("service.activate", uuid="same"))
+        response = post_event(receiver, sample_event("service.activate", uuid="same"))
+
+        assert response.json()["status"] == "duplicate"
+
+    def test_invalid_token_is_rejected(self, receiver):
+        """Test requests without the shared secret are refused."""
+        response = post_event(receiver, sample_event("service.end"), token="wrong")
+
+        assert response.status_code == 403
+
+    def test_invalid_json_is_rejected(self, receiver):
+        """Test a payload that is not JSON is refused."""
+        host, port = receiver.server_address
+        response = requests.post(f"http://{host}:{port}/webhook?token=secret", data="not json", timeout=5)
+
+        assert response.status_code == 400
+
+
+class TestIncrementalSync:
+    """Test applying a single client's changes."""
+
+    def build_sync(self, mock_uisp_clients, services, router_entries):
+        """Create an IncrementalSync with mocked APIs."""
+        ucrm_api = Mock()
+        ucrm_api.get_client.return_value = mock_uisp_clients[0]
+        ucrm_api.get_services.return_value = services
+        mikrotik_api = Mock()
+        mikrotik_api.get_address_entries.return_value = router_entries
+        list_statuses = {"clients_active": ["active"], "clients_suspended": ["suspended"], "clients_all": None}
+        sync = IncrementalSync(
+            ucrm_api=ucrm_api,
+            uisp_api=Mock(),
+            mikrotik_api=mikrotik_api,
+            list_statuses=list_statuses,
+            move_lists=("clients_active", "clients_suspended"),
+        )
+        sync.devices_by_site = {"site-1": {"identification": {"name": "Device-1"}, "ipAddress": "192.168.1.10/24"}}
+        return sync
+
+    def test_suspend_moves_client_between_lists(self, mock_uisp_clients):
+        """Test a suspended client's entry is moved from active to suspended in one write."""
+        services = [{"id": 101, "clientId": 1, "status": 3, "unmsClientSiteId": "site-1"}]
+        router_entries = [
+            {".id": "*1", "list": "clients_active", "address": "192.168.1.10"},
+            {".id": "*4", "list": "clients_all", "address": "192.168.1.10"},
+            {".id": "*9", "list": "blocklist", "address": "192.168.1.10"},
+        ]
+        sync = self.build_sync(mock_uisp_clients, services, router_entries)
+
+        sync.handle_event(sample_event("service.suspend"))
+
+        mikrotik_api = sync.mikrotik_apis["default"]
+        mikrotik_api.move_address_to_list.assert_called_once_with("*1", "clients_suspended", "John Doe - 1_101")
+        mikrotik_api.remove_address_from_list.assert_not_called()
+        mikrotik_api.add_address_to_list.assert_not_called()
+
+    def test_unchanged_client_makes_no_writes(self, mock_uisp_clients):
+        """Test a client already in sync causes no router writes."""
+        services = [{"id": 101, "clientId": 1, "status": 1, "unmsClientSiteId": "site-1"}]
+        router_entries = [
+            {".id": "*1", "list": "clients_active", "address": "192.168.1.10"},
+            {".id": "*4", "list": "clients_all", "address": "192.168.1.10"},
+        ]
+        sync = self.build_sync(mock_uisp_clients, services, router_entries)
+
+        sync.sync_client(1)
+
+        sync.mikrotik_apis["default"].remove_address_from_list.assert_not_called()
+        sync.mikrotik_apis["default"].add_address_to_list.assert_not_called()
+
+    def test_client_without_services_removes_previous_ip(self, mock_uisp_clients):
+        """Test IPs known from the last full sync are cleaned up when the client loses its service."""
+        router_entries = [{".id": "*4", "list": "clients_all", "address": "192.168.1.10"}]
+        sync = self.build_sync(mock_uisp_clients, [], router_entries)
+        sync.update_state(
+            devices_by_site=sync.devices_by_site,
+            client_addresses=[UISPClientAddress("192.168.1.10", "John Doe", 1, 101, "active")],
+        )
+
+        sync.sync_client(1)
+
+        sync.mikrotik_apis["default"].get_address_entries.assert_called_once_with(address="192.168.1.10")
+        sync.mikrotik_apis["default"].remove_address_from_list.assert_called_once_with("*4")
+        assert sync.client_ips[1] == set()
+
+    def test_every_router_is_synced_when_one_fails(self, mock_uisp_clients):
+        """Test a router that errors does not stop the client syncing to the others."""
+        services = [{"id": 101, "clientId": 1, "status": 1, "unmsClientSiteId": "site-1"}]
+        ucrm_api = Mock()
+        ucrm_api.get_client.return_value = mock_uisp_clients[0]
+        ucrm_api.get_services.return_value = services
+        broken_router = Mock()
+        broken_router.get_address_entries.side_effect = Exception("Error communicating to the API: timeout")
+        edge_router = Mock()
+        edge_router.get_address_entries.return_value = []
+        sync = IncrementalSync(
+            ucrm_api=ucrm_api,
+            uisp_api=Mock(),
+            list_statuses={"clients_active": ["active"]},
+            mikrotik_apis={"core": broken_router, "edge": edge_router},
+        )
+        sync.devices_by_site = {"site-1": {"identification": {"name": "Device-1"}, "ipAddress": "192.168.1.10/24"}}
+
+        sync.sync_client(1)
+
+        edge_router.add_address_to_list.assert_called_once_with(
+            ip_address="192.168.1.10", list_name="clients_active", comment="John Doe - 1_101"
+        )
+
+    def test_client_only_synced_to_routers_serving_its_site(self, mock_uisp_clients):
+        """Test a partitioned router only gets clients at its sites, and drops clients that moved away."""
+        services = [{"id": 101, "clientId": 1, "status": 1, "unmsClientSiteId": "site-1"}]
+        ucrm_api = Mock()
+        ucrm_api.get_client.return_value = mock_uisp_clients[0]
+        ucrm_api.get_services.return_value = services
+        north_router = Mock()
+        north_router.get_address_entries.return_value = []
+        south_router = Mock()
+        south_router.get_address_entries.return_value = [{".id": "*7", "list": "clients_active", "address": "192.168.1.10"}]
+        sync = IncrementalSync(
+            ucrm_api=ucrm_api,
+            uisp_api=Mock(),
+            list_statuses={"clients_active": ["active"]},
+            mikrotik_apis={"north": north_router, "south": south_router},
+            router_sites={"north": {"tower-1"}, "south": {"tower-2"}},
+        )
+        sync.devices_by_site = {"site-1": {"identification": {"name": "Device-1"}, "ipAddress": "192.168.1.10/24"}}
+        sync.site_parents = {"site-1": "tower-1"}
+
+        sync.sync_client(1)
+
+        north_router.add_address_to_list.assert_called_once_with(
+            ip_address="192.168.1.10", list_name="clients_active", comment="John Doe - 1_101"
+        )
+        south_router.add_address_to_list.assert_not_called()
+        south_router.remove_address_from_list.assert_called_once_with("*7")
+
+    def test_aggregated_lists_left_to_full_sync(self, mock_uisp_clients):
+        """Test lists stored as prefixes are neither added to nor removed from by a webhook."""
+        services = [{"id": 101, "clientId": 1, "status": 1, "unmsClientSiteId": "site-1"}]
+        router_entries = [{".id": "*4", "list": "clients_all", "address": "192.168.1.8/29"}]
+        sync = self.build_sync(mock_uisp_clients, services, router_entries)
+        sync.aggregate_lists = {"default": {"clients_all"}}
+
+        sync.sync_client(1)
+
+        sync.mikrotik_apis["default"].remove_address_from_list.assert_not_called()
+        sync.mikrotik_apis["default"].add_address_to_list.assert_called_once_with(
+            ip_address="192.168.1.10", list_name="clients_active", comment="John Doe - 1_101"
+        )
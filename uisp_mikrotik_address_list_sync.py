@@ -1,8 +1,12 @@
 import datetime
-import ipaddress
+import json
 import logging
 import os
+import re
 import argparse
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
 
 from utils import send_healthcheck_ping
 
@@ -14,11 +18,17 @@ def parse_arguments():
     parser = argparse.ArgumentParser(description='UISP MikroTik Address List Sync')
     parser.add_argument('--debug', action='store_true', 
                        help='Enable detailed debug logging')
+    parser.add_argument('--dry-run', action='store_true',
+                       help='Compute and log the change plan without writing to any router')
+    parser.add_argument('--plan-file',
+                       help='Write the change plan for every router to this JSON file')
     return parser.parse_args()
 
 # Parse command line arguments
 args = parse_arguments()
 DEBUG_MODE = args.debug
+DRY_RUN = args.dry_run
+PLAN_FILE = args.plan_file
 
 # Set logging level based on debug mode
 log_level = logging.DEBUG if DEBUG_MODE else logging.INFO
@@ -53,32 +63,39 @@ logger.addHandler(file_handler)
 
 
 from __init__ import UISPMikroTikSyncConfig
-from classes.uisp import UISPClientAddress
-from classes.mikrotik import MikroTikClientAddress
 from constants import (
     ucrm_api_version,
     uisp_api_version,
-    all_list_name,
-    suspended_list_name,
-    active_list_name,
-    service_status_map,
-    service_status_map_reverse,
 )
 from utils.uisp import UISPApi, UCRMApi
-from utils.mikrotik import MikroTikApi
+from utils.mikrotik import MikroTikApi, reverify_failed_writes
+from utils.routeros import MikroTikRouterOSApi
+from utils.cache import ResponseCache
+from utils.fallback import FallbackAllocator
+from utils.webhook import IncrementalSync, WebhookReceiver
+from utils.snapshot import SyncSnapshot
+from utils.sync import (
+    index_desired_entries,
+    index_router_entries,
+    plan_sync,
+    apply_sync_plan,
+    summarize_plan,
+    save_plans,
+)
 from utils import (
-    lookup_client_ip,
-    lookup_service_id,
-    lookup_service_status,
-    get_objects_by_key_value,
-    find_missing_items,
+    fetch_concurrently,
+    service_statuses_for_lists,
+    index_services_by_client,
+    index_devices_by_site,
+    index_site_parents,
+    join_client_addresses,
+    partition_addresses_by_router,
 )
 
 module_config = UISPMikroTikSyncConfig
-client_list = [UISPClientAddress]
-active_address_list = [MikroTikClientAddress]
-suspended_address_list = [MikroTikClientAddress]
-all_address_list = [MikroTikClientAddress]
+# Every managed list is diffed and applied by the same engine, from one read of the router per cycle
+managed_list_statuses = module_config.managed_list_statuses
+move_list_names = module_config.move_list_names
 
 uisp_api = UISPApi(
     base_url=module_config.uisp_fqdn,
@@ -95,357 +112,306 @@ ucrm_api = UCRMApi(
     use_ssl=module_config.uisp_use_ssl,
 )
 
-mikrotik_api = MikroTikApi(
-    base_url=module_config.mt_ip,
-    username=module_config.mt_username,
-    password=module_config.mt_password,
-    ssl_verify=module_config.ssl_verify,
-    use_ssl=module_config.mt_use_ssl,
-)
-
-
-def load_uisp_addresses():
-    """Load IP addresses and client information from UISP."""
-
-    clients = ucrm_api.get_clients()
-    services = ucrm_api.get_services()
-    devices = uisp_api.get_devices()
-
-    debug_log(f"Loaded {len(clients)} clients, {len(services)} services, {len(devices)} devices")
-    
-    # Log all client names and IDs for easy searching
-    debug_log("All clients loaded:")
-    for client in clients:
-        debug_log(f"Client ID: {client['id']}, Name: {client['firstName']} {client['lastName']}")
-
-    for client in clients:
-        _client_id = client["id"]
-        _client_name = f'{client["firstName"]} {client["lastName"]}'
-        
-        debug_log(f"Processing client ID {_client_id} - {_client_name}")
-        
-        _client_ip = lookup_client_ip(
-            devices=devices, services=services, client_id=_client_id, debug_mode=DEBUG_MODE
-        )
-        debug_log(f"Client {_client_id} IP: {_client_ip}")
-        
-        _service_id = lookup_service_id(services=services, client_id=_client_id)
-        debug_log(f"Client {_client_id} service_id: {_service_id}")
-        
-        _service_status = lookup_service_status(services=services, client_id=_client_id)
-        debug_log(f"Client {_client_id} service_status (raw): {_service_status}")
-        
-        _mapped_status = service_status_map.get(_service_status)
-        debug_log(f"Client {_client_id} service_status (mapped): {_mapped_status}")
-
-        # Skip clients without IP address
-        if _client_ip is None:
-            logger.warning(f"Skipping client {_client_id} ({_client_name}) - no IP address found")
-            continue
-            
-        # Skip clients without service
-        if _service_id is None:
-            logger.warning(f"Skipping client {_client_id} ({_client_name}) - no service found")
-            continue
-            
-        # Skip clients with no service status
-        if _service_status is None:
-            logger.warning(f"Skipping client {_client_id} ({_client_name}) - no service status found")
-            continue
-
-        new_client = UISPClientAddress(
-            ip_address=_client_ip,
-            client_name=_client_name,
-            client_id=_client_id,
-            service_id=_service_id,
-            service_status=_mapped_status,
-        )
-
-        debug_log(f"Adding client {_client_id} to list with status: {_mapped_status}")
-        client_list.append(new_client)
-
-    debug_log(f"Total clients added to list: {len(client_list)}")
-    return client_list
-
-
-def load_mikrotik_addresses():
-    """Load IP addresses from MikroTik address lists."""
-    active_addresses = []
-    suspended_addresses = []
-    all_addresses = []
-
-    active_address_list = mikrotik_api.get_address_list(list_name=active_list_name)
-    suspended_address_list = mikrotik_api.get_address_list(
-        list_name=suspended_list_name
+if module_config.cache_enabled:
+    # Device IP and site assignments change far less often than the sync interval
+    response_cache = ResponseCache(
+        directory=module_config.cache_directory,
+        ttls=module_config.cache_ttls,
+        max_size_bytes=module_config.cache_max_size,
     )
-    all_address_list = mikrotik_api.get_address_list(list_name=all_list_name)
-
-    for address in active_address_list:
-        try:
-            _comment = address["comment"]
-        except TypeError:
-            _comment = ""
-        except KeyError:
-            _comment = ""
-
-        new_address = MikroTikClientAddress(
-            ip_address=address["address"],
-            list_name=address["list"],
-            comment=_comment,
-            state="active",
-            entry_id=address[".id"],
+    uisp_api.cache = response_cache
+    ucrm_api.cache = response_cache
+
+def build_mikrotik_api(settings):
+    """Create the API connection for one router from its parsed settings."""
+    if settings["transport"] == "api":
+        # Binary RouterOS API over one persistent, pipelined connection
+        return MikroTikRouterOSApi(
+            base_url=settings["router_ip"],
+            username=settings["username"],
+            password=settings["password"],
+            port=settings["api_port"],
+            ssl_verify=settings["ssl_verify"],
+            use_ssl=settings["use_ssl"],
+            pipeline_window=settings["pipeline_window"],
         )
-
-        active_addresses.append(new_address)
-
-    for address in suspended_address_list:
-        try:
-            _comment = address["comment"]
-        except TypeError:
-            _comment = ""
-        except KeyError:
-            _comment = ""
-
-        new_address = MikroTikClientAddress(
-            ip_address=address["address"],
-            list_name=address["list"],
-            comment=_comment,
-            state="suspended",
-            entry_id=address[".id"],
-        )
-
-        suspended_addresses.append(new_address)
-
-    for address in all_address_list:
-        try:
-            _comment = address["comment"]
-        except TypeError:
-            _comment = ""
-        except KeyError:
-            _comment = ""
-
-        new_address = MikroTikClientAddress(
-            ip_address=address["address"],
-            list_name=address["list"],
-            comment=_comment,
-            state="None",
-            entry_id=address[".id"],
-        )
-
-        all_addresses.append(new_address)
-
-    return all_addresses, active_addresses, suspended_addresses
-
-
-def compare_addresses(list_type, uisp_ips, mikrotik_ips):
-    """Compare what's loaded from UISP to what's on the MikroTik. Returns addresses missing from UISP or MikroTik."""
-
-    uisp_addresses = get_objects_by_key_value(
-        object_list=uisp_ips, key="service_status", value=list_type
-    )
-
-    debug_log(f"{list_type} comparison - UISP addresses with status '{list_type}': {len(uisp_addresses)}")
-    debug_log(f"{list_type} comparison - MikroTik addresses: {len(mikrotik_ips)}")
-    
-    # Log all UISP addresses for this status
-    for addr in uisp_addresses:
-        debug_log(f"UISP {list_type} address: {getattr(addr, 'ip_address', 'N/A')} (client: {getattr(addr, 'client_name', 'N/A')}, ID: {getattr(addr, 'client_id', 'N/A')})")
-
-    addresses_missing_uisp = find_missing_items(
-        objects1=mikrotik_ips, objects2=uisp_addresses
-    )
-    addresses_missing_mikrotik = find_missing_items(
-        objects1=uisp_addresses, objects2=mikrotik_ips
+    return MikroTikApi(
+        base_url=settings["router_ip"],
+        username=settings["username"],
+        password=settings["password"],
+        ssl_verify=settings["ssl_verify"],
+        use_ssl=settings["use_ssl"],
+        remove_batch_size=settings["remove_batch_size"],
+        script_threshold=settings["script_threshold"],
+        script_chunk_size=settings["script_chunk_size"],
+        concurrency_min=settings["concurrency_min"],
+        concurrency_max=settings["concurrency_max"],
+        concurrency_initial=settings["concurrency_initial"],
+        latency_target=settings["latency_target"],
+        max_retries=settings["max_retries"],
+        retry_backoff=settings["retry_backoff"],
     )
 
-    debug_log(f"{list_type} - Missing from UISP: {len(addresses_missing_uisp)}")
-    debug_log(f"{list_type} - Missing from MikroTik: {len(addresses_missing_mikrotik)}")
-    
-    # Log missing addresses
-    for addr in addresses_missing_uisp:
-        debug_log(f"{list_type} missing from UISP: {addr.ip_address} (comment: {getattr(addr, 'comment', 'N/A')})")
-    for addr in addresses_missing_mikrotik:
-        debug_log(f"{list_type} missing from MikroTik: {getattr(addr, 'ip_address', 'N/A')} (client: {getattr(addr, 'client_name', 'N/A')}, ID: {getattr(addr, 'client_id', 'N/A')})")
 
-    return addresses_missing_uisp, addresses_missing_mikrotik
+# One connection per router, each with its own concurrency limits
+mikrotik_apis = {name: build_mikrotik_api(settings) for name, settings in module_config.mikrotik_routers.items()}
+# UISP sites each router serves, None for every site
+router_sites = {
+    name: set(settings["sites"]) if settings["sites"] else None for name, settings in module_config.mikrotik_routers.items()
+}
+
+# Last cycle's state per router, so a cycle only diffs what changed. Lists stored as prefixes are
+# always diffed in full, since one change can split or merge a prefix shared with other clients
+snapshots = {}
+if module_config.snapshot_enabled:
+    snapshot_fingerprint = json.dumps({"lists": managed_list_statuses, "moves": move_list_names}, sort_keys=True)
+    snapshots = {
+        name: SyncSnapshot(
+            path=os.path.join(module_config.snapshot_directory, re.sub(r"[^\w.-]", "_", name) + ".json"),
+            fingerprint=snapshot_fingerprint,
+            full_sync_every=module_config.snapshot_full_sync_every,
+        )
+        for name, settings in module_config.mikrotik_routers.items()
+        if not settings["aggregate_lists"]
+    }
+
+
+# Devices without an IP keep the same fallback address from cycle to cycle
+fallback_allocator = FallbackAllocator(path=module_config.fallback_file, pool=module_config.fallback_pool)
+
+# Full syncs and webhook-driven syncs never touch the router at the same time
+sync_lock = threading.Lock()
+incremental_sync = IncrementalSync(
+    ucrm_api=ucrm_api,
+    uisp_api=uisp_api,
+    mikrotik_apis=mikrotik_apis,
+    list_statuses=managed_list_statuses,
+    lock=sync_lock,
+    roles=module_config.device_roles,
+    fallback_allocator=fallback_allocator,
+    exclude_fallback=module_config.exclude_fallback_ips,
+    router_sites=router_sites,
+    aggregate_lists={name: settings["aggregate_lists"] for name, settings in module_config.mikrotik_routers.items()},
+    move_lists=move_list_names,
+)
 
 
-def compare_all_addresses(uisp_ips, mikrotik_ips):
-    """Compare what's loaded from UISP to what's on the MikroTik. Returns addresses missing from UISP or MikroTik."""
+def fetch_cycle_data():
+    """Fetch UISP state for a sync cycle, running every request concurrently."""
+    page_size = module_config.ucrm_page_size
+    # Only download services in statuses that land on a managed list
+    service_statuses = service_statuses_for_lists(managed_list_statuses)
 
-    debug_log(f"all comparison - UISP addresses: {len(uisp_ips)}")
-    debug_log(f"all comparison - MikroTik addresses: {len(mikrotik_ips)}")
-    
-    # Log all UISP addresses
-    for addr in uisp_ips:
-        debug_log(f"UISP all address: {getattr(addr, 'ip_address', 'N/A')} (client: {getattr(addr, 'client_name', 'N/A')}, ID: {getattr(addr, 'client_id', 'N/A')}, status: {getattr(addr, 'service_status', 'N/A')})")
+    def fetch_clients():
+        if page_size > 0:
+            return list(ucrm_api.iter_clients(page_size=page_size))
+        return ucrm_api.get_clients()
 
-    addresses_missing_uisp = find_missing_items(
-        objects1=mikrotik_ips, objects2=uisp_ips
-    )
-    addresses_missing_mikrotik = find_missing_items(
-        objects1=uisp_ips, objects2=mikrotik_ips
-    )
+    def fetch_services():
+        # Index while pages stream in so the next page downloads during indexing
+        if page_size > 0:
+            return index_services_by_client(ucrm_api.iter_services(page_size=page_size, statuses=service_statuses))
+        return index_services_by_client(ucrm_api.get_services(statuses=service_statuses))
 
-    debug_log(f"all - Missing from UISP: {len(addresses_missing_uisp)}")
-    debug_log(f"all - Missing from MikroTik: {len(addresses_missing_mikrotik)}")
-    
-    # Log missing addresses
-    for addr in addresses_missing_uisp:
-        debug_log(f"all missing from UISP: {addr.ip_address} (comment: {getattr(addr, 'comment', 'N/A')})")
-    for addr in addresses_missing_mikrotik:
-        debug_log(f"all missing from MikroTik: {getattr(addr, 'ip_address', 'N/A')} (client: {getattr(addr, 'client_name', 'N/A')}, ID: {getattr(addr, 'client_id', 'N/A')}, status: {getattr(addr, 'service_status', 'N/A')})")
+    def fetch_devices():
+        return index_devices_by_site(uisp_api.get_device_addresses(roles=module_config.device_roles))
 
-    return addresses_missing_uisp, addresses_missing_mikrotik
+    sources = {
+        "clients": fetch_clients,
+        "services": fetch_services,
+        "devices": fetch_devices,
+    }
+    # Site ancestry is only needed to partition subscribers between routers
+    if any(sites is not None for sites in router_sites.values()):
+        sources["sites"] = lambda: index_site_parents(uisp_api.get_sites())
 
+    results, _timings = fetch_concurrently(sources)
+    return results
 
-def sync_addresses():
-    """Sync addresses from the UISP information to MikroTik address lists."""
 
-    uisp_addresses = load_uisp_addresses()
-    logger.debug(f"\n\nUISP Addresses: {uisp_addresses}")
+def load_uisp_addresses(clients, services_by_client, devices_by_site, persist_fallbacks=True):
+    """Load IP addresses and client information from UISP."""
 
-    (
-        mikrotik_all_addresses,
-        mikrotik_active_addresses,
-        mikrotik_suspended_addresses,
-    ) = load_mikrotik_addresses()
-    logger.debug(
-        f"\n\nMikroTik Active Addresses: {mikrotik_active_addresses}\nMikrotik Suspended Addresses: {mikrotik_suspended_addresses}\nMikrotik All Addresses: {mikrotik_all_addresses}"
+    debug_log(
+        f"Loaded {len(clients)} clients, services for {len(services_by_client)} clients, "
+        f"devices for {len(devices_by_site)} sites"
     )
 
-    (
-        addresses_suspended_missing_uisp,
-        addresses_suspended_missing_mikrotik,
-    ) = compare_addresses(
-        list_type="suspended",
-        uisp_ips=uisp_addresses,
-        mikrotik_ips=mikrotik_suspended_addresses,
+    client_addresses = join_client_addresses(
+        clients=clients,
+        services=services_by_client,
+        devices=devices_by_site,
+        debug_mode=DEBUG_MODE,
+        warn_missing_service=service_statuses_for_lists(managed_list_statuses) is None,
+        fallback_allocator=fallback_allocator,
+        exclude_fallback=module_config.exclude_fallback_ips,
     )
-    logger.debug(
-        f"\n\nSuspended missing from UISP: {addresses_suspended_missing_uisp}\nSuspended missing from MikroTik: {addresses_suspended_missing_mikrotik}"
+    # Release fallbacks for clients no longer using them and persist the rest
+    if persist_fallbacks:
+        fallback_allocator.save(prune=True)
+    return client_addresses
+
+
+def plan_router(name, mikrotik_api, uisp_ready):
+    """Compute the change plan for one router's address lists.
+
+    The router's lists download while UISP is still being fetched; `uisp_ready` is a future
+    resolving to the joined UISP addresses of each router's sites, keyed by router name.
+    Returns:
+        tuple: (plan, seconds spent computing it, excluding waiting on the router and UISP)
+    """
+    # Every managed list in one request, split locally
+    router_lists = mikrotik_api.get_address_lists(list(managed_list_statuses))
+    uisp_addresses = uisp_ready.result()[name]
+    aggregate_lists = set(module_config.mikrotik_routers[name]["aggregate_lists"])
+
+    start_time = time.perf_counter()
+    snapshot = snapshots.get(name)
+    if snapshot is not None:
+        plan = snapshot.plan(uisp_addresses, router_lists, managed_list_statuses, move_lists=move_list_names)
+    else:
+        # Desired and router state are each indexed once by (list, address) and diffed for every list together
+        desired = index_desired_entries(uisp_addresses, managed_list_statuses, aggregate_lists)
+        current = index_router_entries(router_lists)
+        plan = plan_sync(desired, current, managed_list_statuses, move_lists=move_list_names)
+    plan_seconds = time.perf_counter() - start_time
+
+    for list_name, changes in plan["lists"].items():
+        debug_log(
+            f"{list_name} - Missing from UISP: {len(changes['remove'])}, missing from MikroTik: {len(changes['add'])}"
+        )
+        for addr_data in changes["remove"]:
+            debug_log(f"{list_name} missing from UISP: {addr_data['ip_address']}")
+        for addr_data in changes["add"]:
+            debug_log(f"{list_name} missing from MikroTik: {addr_data['ip_address']} ({addr_data['comment']})")
+    return plan, plan_seconds
+
+
+def reconcile_router(name, mikrotik_api, uisp_ready, dry_run=False):
+    """Fully reconcile one router's address lists with UISP: plan, then apply unless `dry_run`.
+
+    Returns:
+        tuple: (plan, seconds spent computing it)
+    """
+    plan, plan_seconds = plan_router(name, mikrotik_api, uisp_ready)
+    summary = ", ".join(
+        f"{list_name} +{counts['add']} -{counts['remove']} moved in {counts['move']}"
+        for list_name, counts in summarize_plan(plan).items()
     )
+    logger.info(f"Router '{name}' plan computed in {plan_seconds * 1000:.1f} ms: {summary}")
+    if dry_run:
+        logger.info(f"Dry run: router '{name}' left unchanged")
+        return plan, plan_seconds
+
+    start_time = time.perf_counter()
+    aggregate_lists = set(module_config.mikrotik_routers[name]["aggregate_lists"])
+    snapshot = snapshots.get(name)
+    try:
+        apply_sync_plan(mikrotik_api, plan, aggregate_lists)
+
+        # Targeted second attempt for writes that failed even after retries
+        still_failed = reverify_failed_writes(mikrotik_api)
+    except Exception:
+        # The router is in an unknown state, so the next cycle diffs it in full
+        if snapshot is not None:
+            snapshot.discard()
+        raise
+    if snapshot is not None:
+        # Entries that are still wrong are not in the plan's state, so only a full diff would find them
+        if still_failed:
+            snapshot.discard()
+        else:
+            snapshot.save()
+
+    logger.info(f"Router '{name}' synchronized in {time.perf_counter() - start_time:.1f}s")
+    return plan, plan_seconds
+
+
+def reconcile_addresses(dry_run=False, plan_file=None):
+    """Fully reconcile every router's address lists with UISP. Returns the cycle data and UISP addresses.
+
+    Args:
+        dry_run (bool): Only compute and log each router's plan, writing nothing to the routers.
+        plan_file (str, optional): Write every router's plan to this JSON file.
+    """
+
+    uisp_ready = Future()
+    # UISP is fetched and joined once; each router then diffs and applies in its own thread,
+    # so a slow router holds up no other
+    with ThreadPoolExecutor(max_workers=len(mikrotik_apis)) as executor:
+        router_futures = {
+            executor.submit(reconcile_router, name, mikrotik_api, uisp_ready, dry_run): name
+            for name, mikrotik_api in mikrotik_apis.items()
+        }
+        try:
+            cycle_data = fetch_cycle_data()
+            uisp_addresses = load_uisp_addresses(
+                clients=cycle_data["clients"],
+                services_by_client=cycle_data["services"],
+                devices_by_site=cycle_data["devices"],
+                persist_fallbacks=not dry_run,
+            )
+            logger.debug(f"\n\nUISP Addresses: {uisp_addresses}")
+            partitions = partition_addresses_by_router(uisp_addresses, router_sites, cycle_data.get("sites"))
+            for name, addresses in partitions.items():
+                if router_sites[name] is not None:
+                    logger.info(f"Router '{name}' serves {len(addresses)} of {len(uisp_addresses)} addresses")
+            uisp_ready.set_result(partitions)
+        except Exception as err:
+            uisp_ready.set_exception(err)
+            raise
+
+        plans = {}
+        plan_seconds = {}
+        failed_routers = []
+        for future in as_completed(router_futures):
+            name = router_futures[future]
+            try:
+                plans[name], plan_seconds[name] = future.result()
+            except Exception as err:
+                logger.error(f"Sync to router '{name}' failed: {err}")
+                failed_routers.append(name)
+
+    if plan_file:
+        save_plans(plan_file, plans, plan_seconds)
+        logger.info(f"Change plan written to {plan_file}")
+
+    if failed_routers:
+        raise Exception(f"Sync failed for routers: {', '.join(sorted(failed_routers))}")
+
+    if not dry_run:
+        logger.info(f"All Addresses should now be syncronized.")
+    return cycle_data, uisp_addresses
+
+
+def sync_addresses(dry_run=None, plan_file=None):
+    """Sync addresses from the UISP information to MikroTik address lists.
+
+    `dry_run` and `plan_file` default to the `--dry-run` and `--plan-file` command line options.
+    """
+    dry_run = DRY_RUN if dry_run is None else dry_run
+    with sync_lock:
+        cycle_data, uisp_addresses = reconcile_addresses(dry_run=dry_run, plan_file=plan_file or PLAN_FILE)
+        if dry_run:
+            return
+        # Give webhook-driven syncs the latest devices and client IPs
+        incremental_sync.update_state(
+            devices_by_site=cycle_data["devices"],
+            client_addresses=uisp_addresses,
+            site_parents=cycle_data.get("sites"),
+        )
 
-    (
-        addresses_active_missing_uisp,
-        addresses_active_missing_mikrotik,
-    ) = compare_addresses(
-        list_type="active",
-        uisp_ips=uisp_addresses,
-        mikrotik_ips=mikrotik_active_addresses,
-    )
-    logger.debug(
-        f"\n\nActive missing from UISP: {addresses_active_missing_uisp}\nActive missing from MikroTik: {addresses_active_missing_mikrotik}"
-    )
 
-    (
-        addresses_all_missing_uisp,
-        addresses_all_missing_mikrotik,
-    ) = compare_all_addresses(
-        uisp_ips=uisp_addresses,
-        mikrotik_ips=mikrotik_all_addresses,
-    )
-    logger.debug(
-        f"\n\nAll missing from UISP: {addresses_all_missing_uisp}\nAll missing from MikroTik: {addresses_all_missing_mikrotik}"
+def start_webhook_receiver():
+    """Start the UCRM webhook receiver, applying single-client changes between full syncs."""
+    receiver = WebhookReceiver(
+        handler=incremental_sync.handle_event,
+        host=module_config.webhook_listen_address,
+        port=module_config.webhook_port,
+        token=module_config.webhook_token,
     )
-
-    # Prepare bulk operations for suspended addresses
-    logger.info("Preparing bulk operations for suspended addresses")
-    
-    # Prepare addresses to remove (no longer suspended in UISP)
-    suspended_addresses_to_remove_raw = []
-    for item in addresses_suspended_missing_uisp:
-        suspended_addresses_to_remove_raw.append({
-            "ip_address": item["ip_address"],
-            "list_name": item["list_name"]
-        })
-    
-    # Get entry IDs in bulk
-    suspended_addresses_to_remove = mikrotik_api.get_entry_ids_bulk(suspended_addresses_to_remove_raw)
-    
-    # Prepare addresses to add (newly suspended in UISP)
-    suspended_addresses_to_add = []
-    for item in addresses_suspended_missing_mikrotik:
-        _comment = f'{item["client_name"]} - {item["client_id"]}_{item["service_id"]}'
-        suspended_addresses_to_add.append({
-            "ip_address": item["ip_address"],
-            "list_name": suspended_list_name,
-            "comment": _comment
-        })
-    
-    # Perform bulk sync for suspended addresses
-    if suspended_addresses_to_remove or suspended_addresses_to_add:
-        mikrotik_api.bulk_sync_address_list(
-            list_name=suspended_list_name,
-            addresses_to_add=suspended_addresses_to_add,
-            addresses_to_remove=suspended_addresses_to_remove
-        )
-    
-    # Prepare bulk operations for active addresses
-    logger.info("Preparing bulk operations for active addresses")
-    
-    # Prepare addresses to remove (no longer active in UISP)
-    active_addresses_to_remove_raw = []
-    for item in addresses_active_missing_uisp:
-        active_addresses_to_remove_raw.append({
-            "ip_address": item["ip_address"],
-            "list_name": item["list_name"]
-        })
-    
-    # Get entry IDs in bulk
-    active_addresses_to_remove = mikrotik_api.get_entry_ids_bulk(active_addresses_to_remove_raw)
-    
-    # Prepare addresses to add (newly active in UISP)
-    active_addresses_to_add = []
-    for item in addresses_active_missing_mikrotik:
-        _comment = f'{item["client_name"]} - {item["client_id"]}_{item["service_id"]}'
-        active_addresses_to_add.append({
-            "ip_address": item["ip_address"],
-            "list_name": active_list_name,
-            "comment": _comment
-        })
-    
-    # Perform bulk sync for active addresses
-    if active_addresses_to_remove or active_addresses_to_add:
-        mikrotik_api.bulk_sync_address_list(
-            list_name=active_list_name,
-            addresses_to_add=active_addresses_to_add,
-            addresses_to_remove=active_addresses_to_remove
-        )
-    
-    # Prepare bulk operations for all addresses
-    logger.info("Preparing bulk operations for all addresses")
-    
-    # Prepare addresses to remove (no longer in UISP)
-    all_addresses_to_remove_raw = []
-    for item in addresses_all_missing_uisp:
-        all_addresses_to_remove_raw.append({
-            "ip_address": item["ip_address"],
-            "list_name": item["list_name"]
-        })
-    
-    # Get entry IDs in bulk
-    all_addresses_to_remove = mikrotik_api.get_entry_ids_bulk(all_addresses_to_remove_raw)
-    
-    # Prepare addresses to add (newly in UISP)
-    all_addresses_to_add = []
-    for item in addresses_all_missing_mikrotik:
-        _comment = f'{item["client_name"]} - {item["client_id"]}_{item["service_id"]}'
-        all_addresses_to_add.append({
-            "ip_address": item["ip_address"],
-            "list_name": all_list_name,
-            "comment": _comment
-        })
-    
-    # Perform bulk sync for all addresses
-    if all_addresses_to_remove or all_addresses_to_add:
-        mikrotik_api.bulk_sync_address_list(
-            list_name=all_list_name,
-            addresses_to_add=all_addresses_to_add,
-            addresses_to_remove=all_addresses_to_remove
-        )
-
-    logger.info(f"All Addresses should now be syncronized.")
+    receiver.start()
+    return receiver
 
 
 if __name__ == "__main__":
@@ -454,6 +420,6 @@ if __name__ == "__main__":
     
     sync_addresses()
 
-    if module_config.send_health_check:
+    if module_config.send_health_check and not DRY_RUN:
         url = f"https://hc-ping.com/{module_config.health_check_id}"
         send_healthcheck_ping(check_url=url)
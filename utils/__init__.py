@@ -8,9 +8,12 @@ def strtobool(val: str) -> bool:
         return False
     else:
         raise ValueError(f"invalid truth value {val!r}")
+import ipaddress
 import logging
 import requests
-import random
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
 
 logger = logging.getLogger(__name__)
 
@@ -44,79 +47,428 @@ def send_healthcheck_ping(check_url):
         logger.error(f"Error sending ping: {e}")
 
 
-def lookup_service_id(services, client_id):
-    """Lookup a service Id based on a client Id. Returns the service Id if found, otherwise None."""
+def fetch_concurrently(sources, max_workers=None):
+    """Run independent fetches concurrently and time each one.
+
+    Args:
+        sources (dict): Mapping of source name to a callable taking no arguments.
+        max_workers (int, optional): Thread pool size. Defaults to one thread per source.
+    Raises:
+        Exception: The first error raised by a source, once every source has finished.
+    Returns:
+        tuple: (results, timings) dictionaries keyed by source name, timings in seconds.
+    """
+    results = {}
+    timings = {}
+    errors = []
+
+    def timed(name, fetch):
+        start_time = time.perf_counter()
+        try:
+            return fetch()
+        finally:
+            timings[name] = time.perf_counter() - start_time
+
+    cycle_start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max_workers or len(sources) or 1) as executor:
+        futures = {name: executor.submit(timed, name, fetch) for name, fetch in sources.items()}
+        for name, future in futures.items():
+            try:
+                results[name] = future.result()
+            except Exception as err:
+                logger.error(f"Fetching '{name}' failed after {timings.get(name, 0):.2f}s: {err}")
+                errors.append(err)
+
+    for name, elapsed in sorted(timings.items(), key=lambda item: item[1], reverse=True):
+        logger.info(f"Fetched '{name}' in {elapsed:.2f}s")
+    logger.info(f"Fetch phase completed in {time.perf_counter() - cycle_start:.2f}s")
+
+    if errors:
+        raise errors[0]
+    return results, timings
+
+
+def index_services_by_client(services):
+    """Build a clientId -> [services] index in one pass over the services.
+
+    Accepts a list of services or any iterable of them, so paged fetches can be indexed as they arrive.
+    """
+    index = {}
     for service in services:
-        if service.get("clientId") == client_id:
-            return service.get("id")
+        index.setdefault(service.get("clientId"), []).append(service)
+    return index
+
+
+def index_devices_by_site(devices):
+    """Build a siteId -> device index in one pass over the devices.
+
+    The first device seen for a site wins, matching the order the linear lookup used.
+    """
+    index = {}
+    for device in devices:
+        identification = device.get("identification")
+        if not identification or not identification.get("site"):
+            device_name = (identification or {}).get("name", "Unknown device")
+            logger.warning(f"Device '{device_name}' has no site assignment")
+            continue
+        index.setdefault(identification["site"].get("id"), device)
+    return index
+
+
+def _services_for_client(services, client_id):
+    """Return the services for a client from either a clientId index or a plain list."""
+    if isinstance(services, dict):
+        return services.get(client_id, [])
+    return (service for service in services if service.get("clientId") == client_id)
+
+
+def _device_for_site(devices, site_id, client_id=None):
+    """Return the first device at a site from either a siteId index or a plain list."""
+    if isinstance(devices, dict):
+        return devices.get(site_id)
+    for device in devices:
+        device_name = device.get("identification", {}).get("name", "Unknown device")
+        if not device.get("identification") or not device["identification"].get("site"):
+            logger.warning(f"Device '{device_name}' (client ID: {client_id}) has no site assignment")
+            continue
+        if device["identification"]["site"].get("id") == site_id:
+            return device
+    return None
+
+
+def lookup_service_id(services, client_id):
+    """Lookup a service Id based on a client Id. Returns the service Id if found, otherwise None.
+
+    `services` may be the raw services list or an index from `index_services_by_client`.
+    """
+    for service in _services_for_client(services, client_id):
+        return service.get("id")
     return None
 
 
 def lookup_service_status(services, client_id):
-    """Lookup the status value for a service plan based on the client id. Returns status as an integer."""
-    for service in services:
-        if service.get("clientId") == client_id:
-            return service.get("status")
+    """Lookup the status value for a service plan based on the client id. Returns status as an integer.
+
+    `services` may be the raw services list or an index from `index_services_by_client`.
+    """
+    for service in _services_for_client(services, client_id):
+        return service.get("status")
     return None
 
 
-def lookup_client_ip(devices, services, client_id, debug_mode=False):
-    """Lookup a client IP address by client Id. Returns the IP if found, otherwise None."""
+def default_fallback_ip(client_id):
+    """Return a fallback IP in 192.0.0.2-254 derived from the client Id, stable across runs."""
+    return f"192.0.0.{2 + zlib.crc32(str(client_id).encode('utf-8')) % 253}"
+
+
+def lookup_client_services(services, client_id):
+    """Lookup every service belonging to a client. Returns a list, empty if the client has none.
+
+    `services` may be the raw services list or an index from `index_services_by_client`.
+    """
+    return list(_services_for_client(services, client_id))
+
+
+def lookup_service_ip(
+    devices, service, client_id, debug_mode=False, fallback_allocator=None, exclude_fallback=False, fallback_key=None
+):
+    """Lookup the IP address of the device at a service's site. Returns the IP if found, otherwise None.
+
+    When the matching device has no IP a fallback is returned: from `fallback_allocator` (keyed by
+    `fallback_key`, defaulting to the client Id) if given, otherwise `default_fallback_ip`. With
+    `exclude_fallback` the service gets no IP instead.
+    """
+    if debug_mode:
+        logger.debug(f"Service {service.get('id')} unmsClientSiteId: {service.get('unmsClientSiteId')}")
+
+    # Look for a device matching the site
+    device = _device_for_site(devices, service.get("unmsClientSiteId"), client_id=client_id)
+    if device is None:
+        if debug_mode:
+            logger.debug(f"No matching device found for client_id: {client_id}, service: {service.get('id')}")
+        return None
+
+    device_name = device.get("identification", {}).get("name", "Unknown device")
+    if debug_mode:
+        logger.debug(f"Device {device_name} matches service site")
+    if device.get("ipAddress"):
+        ip = device.get("ipAddress").split("/")[0]
+        if debug_mode:
+            logger.debug(f"Found IP for client {client_id}: {ip}")
+        return ip
+
+    if exclude_fallback:
+        logger.warning(f"Device '{device_name}' (client ID: {client_id}) has no IP address, skipping")
+        return None
+    logger.warning(f"Device '{device_name}' (client ID: {client_id}) has no IP address, using fallback")
+    fallback_key = client_id if fallback_key is None else fallback_key
+    if fallback_allocator is not None:
+        fallback_ip = fallback_allocator.allocate(fallback_key)
+    else:
+        fallback_ip = default_fallback_ip(fallback_key)
+    if debug_mode:
+        logger.debug(f"Using fallback IP for client {client_id}: {fallback_ip}")
+    return fallback_ip
+
+
+def lookup_client_ip(
+    devices, services, client_id, debug_mode=False, fallback_allocator=None, exclude_fallback=False
+):
+    """Lookup a client IP address by client Id. Returns the IP if found, otherwise None.
+
+    Only the client's first service is considered; use `lookup_client_services` and
+    `lookup_service_ip` for clients with several services.
+
+    `devices` and `services` may be raw lists or the indexes from `index_devices_by_site` and
+    `index_services_by_client`; with indexes the lookup is O(1).
+    """
     if debug_mode:
         logger.debug(f"Looking up IP for client_id: {client_id}")
-    
+
     # First, find the service for this client
     client_service = None
-    for service in services:
-        if service.get("clientId") == client_id:
-            client_service = service
-            if debug_mode:
-                logger.debug(f"Found service for client {client_id}: {service}")
-            break
-    
+    for service in _services_for_client(services, client_id):
+        client_service = service
+        if debug_mode:
+            logger.debug(f"Found service for client {client_id}: {service}")
+        break
+
     if not client_service:
         if debug_mode:
             logger.debug(f"No service found for client_id: {client_id}")
         return None
-    
-    if debug_mode:
-        logger.debug(f"Service unmsClientSiteId: {client_service.get('unmsClientSiteId')}")
-    
-    # Now look for devices matching the site
-    for device in devices:
-        device_name = device.get("identification", {}).get("name", "Unknown device")
+
+    return lookup_service_ip(
+        devices=devices,
+        service=client_service,
+        client_id=client_id,
+        debug_mode=debug_mode,
+        fallback_allocator=fallback_allocator,
+        exclude_fallback=exclude_fallback,
+    )
+
+
+def join_client_addresses(
+    clients,
+    services,
+    devices,
+    debug_mode=False,
+    warn_missing_service=True,
+    fallback_allocator=None,
+    exclude_fallback=False,
+):
+    """Resolve every service of every client to its IP and status in one linear pass.
+
+    A client with several services gets one record per service, each with the IP of the device at
+    that service's site.
+
+    Args:
+        clients (iterable): UCRM clients.
+        services (iterable|dict): UCRM services, or an index from `index_services_by_client`.
+        devices (iterable|dict): NMS devices, or an index from `index_devices_by_site`.
+        debug_mode (bool): Emit per-client debug logging.
+        warn_missing_service (bool): Warn about clients without a service. Disable when services were
+            filtered by status on the server, where most clients are expected to have none.
+        fallback_allocator (FallbackAllocator, optional): Assigns stable IPs to devices without one,
+            keyed by `<client_id>_<service_id>`.
+        exclude_fallback (bool): Skip services whose device has no IP instead of using a fallback.
+    Returns:
+        list: UISPClientAddress objects, one per service that resolved to an IP and status.
+    """
+    from classes.uisp import UISPClientAddress
+    from constants import service_status_map
+
+    if not isinstance(services, dict):
+        services = index_services_by_client(services)
+    if not isinstance(devices, dict):
+        devices = index_devices_by_site(devices)
+
+    client_addresses = []
+    for client in clients:
+        _client_id = client["id"]
+        _client_name = f'{client["firstName"]} {client["lastName"]}'
         if debug_mode:
-            logger.debug(f"Checking device: {device_name}")
-        
-        # Log warning if device is missing identification or site data
-        if not device.get("identification") or not device["identification"].get("site"):
-            logger.warning(f"Device '{device_name}' (client ID: {client_id}) has no site assignment")
+            logger.debug(f"Processing client ID {_client_id} - {_client_name}")
+
+        _client_services = services.get(_client_id)
+
+        # Skip clients without service
+        if not _client_services:
+            if warn_missing_service:
+                logger.warning(f"Skipping client {_client_id} ({_client_name}) - no service found")
+            elif debug_mode:
+                logger.debug(f"Skipping client {_client_id} ({_client_name}) - no service in filtered statuses")
             continue
 
-        device_site_id = device["identification"]["site"].get("id")
-        if debug_mode:
-            logger.debug(f"Device {device_name} site_id: {device_site_id}")
-        
-        if device_site_id == client_service["unmsClientSiteId"]:
+        for _service in _client_services:
+            _service_id = _service.get("id")
+            _service_status = _service.get("status")
+            _mapped_status = service_status_map.get(_service_status)
+            _client_ip = lookup_service_ip(
+                devices=devices,
+                service=_service,
+                client_id=_client_id,
+                debug_mode=debug_mode,
+                fallback_allocator=fallback_allocator,
+                exclude_fallback=exclude_fallback,
+                fallback_key=f"{_client_id}_{_service_id}",
+            )
             if debug_mode:
-                logger.debug(f"Device {device_name} matches service site")
-            if device.get("ipAddress"):
-                ip = device.get("ipAddress").split("/")[0]
-                if debug_mode:
-                    logger.debug(f"Found IP for client {client_id}: {ip}")
-                return ip
-            else:
-                logger.warning(f"Device '{device_name}' (client ID: {client_id}) has no IP address, using fallback")
-                # TODO: Better handling of devices without an IP.
-                _num = random.randint(2, 254)
-                fallback_ip = f"192.0.0.{_num}"
-                if debug_mode:
-                    logger.debug(f"Using fallback IP for client {client_id}: {fallback_ip}")
-                return fallback_ip
-    
+                logger.debug(
+                    f"Client {_client_id} service {_service_id} IP: {_client_ip}, "
+                    f"service_status: {_service_status} ({_mapped_status})"
+                )
+
+            # Skip services without IP address
+            if _client_ip is None:
+                logger.warning(
+                    f"Skipping client {_client_id} ({_client_name}) service {_service_id} - no IP address found"
+                )
+                continue
+
+            # Skip services with no service status
+            if _service_status is None:
+                logger.warning(
+                    f"Skipping client {_client_id} ({_client_name}) service {_service_id} - no service status found"
+                )
+                continue
+
+            client_addresses.append(
+                UISPClientAddress(
+                    ip_address=_client_ip,
+                    client_name=_client_name,
+                    client_id=_client_id,
+                    service_id=_service_id,
+                    service_status=_mapped_status,
+                    site_id=_service.get("unmsClientSiteId"),
+                )
+            )
+
     if debug_mode:
-        logger.debug(f"No matching device found for client_id: {client_id}")
-    return None
+        logger.debug(f"Total service addresses added to list: {len(client_addresses)}")
+    return client_addresses
+
+
+def index_site_parents(sites):
+    """Index UISP sites by Id. Returns a dict of each site's parent site Id, None for top-level sites."""
+    site_parents = {}
+    for site in sites or []:
+        identification = site.get("identification") or {}
+        site_id = site.get("id") or identification.get("id")
+        if site_id:
+            site_parents[site_id] = (identification.get("parent") or {}).get("id")
+    return site_parents
+
+
+def site_routers(site_id, router_sites, site_parents):
+    """Return the names of the routers serving a site.
+
+    A router serves a site it lists, or any site below one it lists, following parent sites up to the
+    top level. A router without a site list serves every site.
+    Args:
+        site_id (str): UISP site Id, usually a service's `unmsClientSiteId`.
+        router_sites (dict): Mapping of router name to a set of site Ids, or None for every site.
+        site_parents (dict): Index from `index_site_parents`.
+    Returns:
+        set: Router names.
+    """
+    routers = {name for name, sites in router_sites.items() if sites is None}
+    seen = set()
+    while site_id is not None and site_id not in seen:
+        seen.add(site_id)
+        routers.update(name for name, sites in router_sites.items() if sites is not None and site_id in sites)
+        site_id = site_parents.get(site_id)
+    return routers
+
+
+def partition_addresses_by_router(client_addresses, router_sites, site_parents=None):
+    """Split client addresses into the subset each router serves, by the site of their service.
+
+    Addresses are grouped by site first, so each site's ancestry is walked once however many
+    services it has.
+    Args:
+        client_addresses (list): UISPClientAddress objects.
+        router_sites (dict): Mapping of router name to a set of site Ids, or None for every site.
+        site_parents (dict, optional): Index from `index_site_parents`.
+    Returns:
+        dict: Mapping of router name to its list of UISPClientAddress objects.
+    """
+    addresses_by_site = {}
+    for address in client_addresses:
+        addresses_by_site.setdefault(address.site_id, []).append(address)
+
+    partitions = {name: [] for name in router_sites}
+    unserved = 0
+    for site_id, addresses in addresses_by_site.items():
+        routers = site_routers(site_id, router_sites, site_parents or {})
+        if not routers:
+            unserved += len(addresses)
+        for name in routers:
+            partitions[name].extend(addresses)
+
+    if unserved:
+        logger.warning(f"{unserved} addresses are at sites no router is configured to serve")
+    return partitions
+
+
+def aggregate_client_addresses(client_addresses):
+    """Collapse client addresses into the fewest prefixes covering exactly those addresses.
+
+    Uses `ipaddress.collapse_addresses`, so a run of contiguous, aligned addresses becomes a single
+    prefix entry and a status change in one of them only splits the prefix it falls in.
+    Args:
+        client_addresses (list): UISPClientAddress objects.
+    Returns:
+        list: UISPAddressBlock objects for prefixes covering two or more addresses, and the
+            UISPClientAddress itself for an address that merges with no neighbour.
+    """
+    from classes.uisp import UISPAddressBlock
+
+    networks = {}
+    result = []
+    for address in client_addresses:
+        try:
+            network = ipaddress.ip_network(address.ip_address)
+        except ValueError:
+            result.append(address)
+            continue
+        networks.setdefault(network, []).append(address)
+
+    for version in (4, 6):
+        hosts = sorted(network for network in networks if network.version == version)
+        position = 0
+        for prefix in ipaddress.collapse_addresses(hosts):
+            members = []
+            while position < len(hosts) and hosts[position].subnet_of(prefix):
+                members.extend(networks[hosts[position]])
+                position += 1
+            if prefix.num_addresses == 1:
+                # Keep the service's own comment when there is nothing to merge
+                result.append(members[0])
+            else:
+                result.append(UISPAddressBlock(ip_address=str(prefix), members=members))
+    return result
+
+
+def service_statuses_for_lists(list_statuses):
+    """Return the UCRM status codes needed to fill the given lists, for server-side filtering.
+
+    Args:
+        list_statuses (dict): Mapping of list name to a list of status names, or None for every status.
+    Returns:
+        list: Sorted status codes, or None if any list takes every status and no filter can be applied.
+    """
+    from constants import service_status_map_reverse
+
+    statuses = set()
+    for list_name, status_names in list_statuses.items():
+        if status_names is None:
+            return None
+        for status_name in status_names:
+            if status_name not in service_status_map_reverse:
+                raise ValueError(f"Unknown service status '{status_name}' for list '{list_name}'")
+            statuses.add(service_status_map_reverse[status_name])
+    return sorted(statuses)
 
 
 def get_objects_by_key_value(object_list, key, value):
@@ -4,7 +4,11 @@ from __init__ import UISPMikroTikSyncConfig
 import requests
 import urllib3
 import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from os.path import exists
+from requests.adapters import HTTPAdapter
 from requests.auth import HTTPBasicAuth
 from utils import is_truthy
 import logging
@@ -39,10 +43,35 @@ class ApiEndpoint:
         self.headers = {"Accept": "*/*", "Content-Type": "application/json"}
         self.data = data
         self.accept_204 = False
+        self.cache = None
+        self.pool_size = module_config.http_pool_size
+        self.timeout = (module_config.http_connect_timeout, module_config.http_read_timeout)
+        self.keep_alive = module_config.http_keep_alive
+        self._session = None
+        self._session_lock = threading.Lock()
 
         if self.verify is False:
             urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
+    @property
+    def session(self):
+        """Long-lived pooled session shared by every request to this endpoint.
+
+        Pooled connections stay open between calls and scheduler cycles, so the TCP and TLS
+        handshakes are paid once per connection instead of once per request.
+        """
+        if self._session is None:
+            with self._session_lock:
+                if self._session is None:
+                    session = requests.Session()
+                    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size, pool_block=True)
+                    session.mount("https://", adapter)
+                    session.mount("http://", adapter)
+                    if not self.keep_alive:
+                        session.headers["Connection"] = "close"
+                    self._session = session
+        return self._session
+
     def validate_url(self, path):
         """Validate URL formatting is correct.
         Args:
@@ -84,20 +113,48 @@ class ApiEndpoint:
         else:
             params = {**self.params, **params}
 
-        response = requests.request(
+        headers = self.headers
+        cache_key = None
+        cached = None
+        if method == "GET" and self.cache is not None and self.cache.ttl_for(path) is not None:
+            cache_key = self.cache.key(url, params)
+            cached = self.cache.get(cache_key)
+            if cached and time.time() - cached["stored_at"] < self.cache.ttl_for(path):
+                logger.debug(f"Serving {path} from cache")
+                return self.cache.decoded_body(cache_key, cached)
+            if cached:
+                headers = {**self.headers}
+                if cached.get("etag"):
+                    headers["If-None-Match"] = cached["etag"]
+                if cached.get("last_modified"):
+                    headers["If-Modified-Since"] = cached["last_modified"]
+
+        response = self.session.request(
             method=method,
-            headers=self.headers,
+            headers=headers,
             url=url,
             params=params,
             verify=is_truthy(self.verify),
             data=payload,
+            timeout=self.timeout,
         )
         try:
             logger.debug(f"API Response: {response}")
             response.raise_for_status()
+            if cached and response.status_code == 304:
+                logger.debug(f"{path} not modified, refreshing cached response")
+                return self.cache.decoded_body(cache_key, self.cache.refresh(cache_key, cached))
             if response.status_code == 204 and not accept_204:
                 return None
             elif response.text:  # Check if the response is not empty
+                if cache_key:
+                    entry = self.cache.put(
+                        cache_key,
+                        response.text,
+                        etag=response.headers.get("ETag"),
+                        last_modified=response.headers.get("Last-Modified"),
+                    )
+                    return self.cache.decoded_body(cache_key, entry)
                 return response.json()
             else:
                 return None
@@ -107,3 +164,32 @@ class ApiEndpoint:
         except json.JSONDecodeError as err:
             logger.error(f"Error decoding API response as JSON: {err}")
             raise Exception(f"Error decoding API response as JSON: {err}")
+
+    def iter_pages(self, path: str, page_size: int, params: dict = {}):  # pylint: disable=dangerous-default-value
+        """Yield pages from a limit/offset paginated GET endpoint.
+
+        The next page is requested in the background while the caller processes the current one.
+        Args:
+            path (str): API path to send request to.
+            page_size (int): Number of records to request per page.
+            params (dict, optional): Additional parameters to send to API. Defaults to None.
+        Yields:
+            list: One page of decoded records.
+        """
+
+        def fetch_page(offset):
+            page = self.api_call(path=path, params={**params, "limit": page_size, "offset": offset})
+            return page or []
+
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            offset = 0
+            future = executor.submit(fetch_page, offset)
+            while True:
+                page = future.result()
+                if len(page) < page_size:
+                    if page:
+                        yield page
+                    return
+                offset += page_size
+                future = executor.submit(fetch_page, offset)
+                yield page
@@ -0,0 +1,120 @@
+""" On-disk cache for API responses """
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class ResponseCache:
+    """Size-bounded on-disk cache of GET responses, with per-endpoint TTLs and HTTP validators.
+
+    Within an endpoint's TTL a cached response is returned without touching the network. Once it
+    expires the request is revalidated with If-None-Match/If-Modified-Since, so an unchanged response
+    costs a 304 instead of a full transfer. The decoded body of each entry on disk is also kept in
+    memory, so a hit skips the JSON decode as well; it goes when the entry is replaced or evicted.
+    """
+
+    def __init__(self, directory: str, ttls: dict, max_size_bytes: int = 100 * 1024 * 1024):
+        """Create response cache.
+
+        Args:
+            directory (str): Directory to store cached responses in.
+            ttls (dict): Mapping of API path (without query string) to TTL in seconds. Only these paths are cached.
+            max_size_bytes (int): Total size the cache directory is trimmed to, least recently used first.
+        """
+        self.directory = directory
+        self.ttls = ttls
+        self.max_size_bytes = max_size_bytes
+        self._decoded = {}
+        self._lock = threading.Lock()
+        os.makedirs(self.directory, exist_ok=True)
+
+    def ttl_for(self, path: str):
+        """Return the TTL for an API path, or None if the path is not cached."""
+        return self.ttls.get(path.split("?", 1)[0].strip("/"))
+
+    def key(self, url: str, params: dict = None):
+        """Return the cache key for a URL and its query parameters."""
+        raw = json.dumps([url, params or {}], sort_keys=True, default=str)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _path(self, key: str):
+        return os.path.join(self.directory, f"{key}.json")
+
+    def get(self, key: str):
+        """Return the cached entry for a key, or None. Entries hold stored_at, etag, last_modified and body."""
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as cache_file:
+                entry = json.load(cache_file)
+        except (OSError, json.JSONDecodeError):
+            return None
+        # Track recency for eviction
+        os.utime(path)
+        return entry
+
+    def decoded_body(self, key: str, entry: dict):
+        """Return the decoded JSON body for an entry, decoding it at most once per stored response."""
+        with self._lock:
+            cached = self._decoded.get(key)
+            if cached and cached[0] == entry["stored_at"]:
+                return cached[1]
+        body = json.loads(entry["body"]) if entry["body"] else None
+        with self._lock:
+            self._decoded[key] = (entry["stored_at"], body)
+        return body
+
+    def put(self, key: str, body: str, etag: str = None, last_modified: str = None):
+        """Store a response body and its validators."""
+        entry = {"stored_at": time.time(), "etag": etag, "last_modified": last_modified, "body": body}
+        path = self._path(key)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as cache_file:
+            json.dump(entry, cache_file)
+        os.replace(tmp_path, path)
+        with self._lock:
+            self._decoded.pop(key, None)
+        self.evict()
+        return entry
+
+    def refresh(self, key: str, entry: dict):
+        """Restart an entry's TTL after the server confirmed it is unchanged, keeping its decoded body."""
+        with self._lock:
+            cached = self._decoded.get(key)
+        refreshed = self.put(key, entry["body"], etag=entry.get("etag"), last_modified=entry.get("last_modified"))
+        if cached and cached[0] == entry["stored_at"] and os.path.exists(self._path(key)):
+            with self._lock:
+                self._decoded[key] = (refreshed["stored_at"], cached[1])
+        return refreshed
+
+    def evict(self):
+        """Delete least recently used entries until the cache fits in max_size_bytes."""
+        entries = []
+        total_size = 0
+        for name in os.listdir(self.directory):
+            if not name.endswith(".json"):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+            total_size += stat.st_size
+
+        for _mtime, size, path in sorted(entries):
+            if total_size <= self.max_size_bytes:
+                break
+            try:
+                os.remove(path)
+                total_size -= size
+                with self._lock:
+                    self._decoded.pop(os.path.basename(path)[: -len(".json")], None)
+                logger.debug(f"Evicted cached response {path}")
+            except OSError as err:
+                logger.warning(f"Error evicting cached response {path}: {err}")
@@ -0,0 +1,121 @@
+""" Adaptive concurrency limit for requests to a router """
+
+import logging
+import threading
+import time
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+
+def is_overload_error(err):
+    """Return True if an exception means the server is overloaded rather than rejecting the request."""
+    if isinstance(err, (requests.exceptions.ConnectionError, requests.exceptions.Timeout)):
+        return True
+    if isinstance(err, requests.exceptions.HTTPError) and err.response is not None:
+        return err.response.status_code >= 500
+    return False
+
+
+class AdaptiveLimiter:
+    """AIMD limit on the number of requests in flight.
+
+    Every request that completes within `latency_target` seconds widens the limit by one request per
+    full window (additive increase). A request that fails with an overload error or exceeds the target
+    multiplies the limit by `backoff` (multiplicative decrease), at most once per window: requests
+    started before the last decrease cannot trigger another one.
+    """
+
+    def __init__(
+        self,
+        floor: int = 1,
+        ceiling: int = 10,
+        initial: int = None,
+        latency_target: float = 0.5,
+        backoff: float = 0.5,
+        name: str = "requests",
+    ):
+        self.floor = max(1, floor)
+        self.ceiling = max(self.floor, ceiling)
+        if initial is None:
+            initial = self.ceiling
+        self.limit = float(min(max(initial, self.floor), self.ceiling))
+        self.latency_target = latency_target
+        self.backoff = backoff
+        self.name = name
+        self.in_flight = 0
+        self._condition = threading.Condition()
+        self._started = 0
+        self._last_decrease = 0
+        self._completed = 0
+        self._overloads = 0
+        self._slow = 0
+        self._increases = 0
+        self._decreases = 0
+        self._total_latency = 0.0
+
+    def acquire(self):
+        """Block until a request may start. Returns a ticket to pass to `release`."""
+        with self._condition:
+            while self.in_flight >= int(self.limit):
+                self._condition.wait()
+            self.in_flight += 1
+            self._started += 1
+            return self._started
+
+    def release(self, ticket, latency, overloaded=False):
+        """Record a finished request and adjust the limit."""
+        with self._condition:
+            self.in_flight -= 1
+            self._completed += 1
+            self._total_latency += latency
+            previous = int(self.limit)
+            slow = latency > self.latency_target
+            if overloaded or slow:
+                if overloaded:
+                    self._overloads += 1
+                else:
+                    self._slow += 1
+                if ticket > self._last_decrease:
+                    self.limit = max(self.floor, self.limit * self.backoff)
+                    self._last_decrease = self._started
+                    self._decreases += 1
+            else:
+                self.limit = min(self.ceiling, self.limit + 1 / self.limit)
+                if int(self.limit) > previous:
+                    self._increases += 1
+            if int(self.limit) != previous:
+                reason = "overload error" if overloaded else f"latency {latency * 1000:.0f} ms"
+                direction = "increased" if int(self.limit) > previous else "decreased"
+                logger.info(f"Concurrency for {self.name} {direction} {previous} -> {int(self.limit)} ({reason})")
+            self._condition.notify_all()
+
+    def call(self, func, *args, **kwargs):
+        """Run `func` once a slot is free, timing it to adjust the limit. Exceptions are re-raised."""
+        ticket = self.acquire()
+        start_time = time.perf_counter()
+        overloaded = False
+        try:
+            return func(*args, **kwargs)
+        except Exception as err:
+            overloaded = is_overload_error(err)
+            raise
+        finally:
+            self.release(ticket, time.perf_counter() - start_time, overloaded)
+
+    def stats(self):
+        """Return the current limit and counters since the limiter was created."""
+        with self._condition:
+            return {
+                "limit": int(self.limit),
+                "floor": self.floor,
+                "ceiling": self.ceiling,
+                "in_flight": self.in_flight,
+                "completed": self._completed,
+                "overload_errors": self._overloads,
+                "slow_requests": self._slow,
+                "increases": self._increases,
+                "decreases": self._decreases,
+                "average_latency_ms": round(self._total_latency / self._completed * 1000, 1) if self._completed else None,
+            }
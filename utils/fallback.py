@@ -0,0 +1,94 @@
+""" Stable fallback addresses for clients whose device has no IP """
+
+from ipaddress import ip_network
+import json
+import logging
+import os
+import threading
+import zlib
+
+logger = logging.getLogger(__name__)
+
+
+class FallbackAllocator:
+    """Assign each client a fallback IP from a pool and keep it across runs.
+
+    The assignment for a key is sticky: it is stored in a JSON file and reused every cycle, so a
+    client without a device IP keeps the same address on the router instead of churning. New keys
+    start probing at a hash of the key, so assignments stay mostly stable even if the file is lost.
+    """
+
+    def __init__(self, path: str = "./data/fallback_ips.json", pool: str = "192.0.0.0/24"):
+        """Create fallback allocator.
+
+        Args:
+            path (str): JSON file the assignments are persisted to.
+            pool (str): Network to allocate fallback IPs from.
+        """
+        self.path = path
+        self.pool = ip_network(pool)
+        self.hosts = [str(host) for host in self.pool.hosts()]
+        self.assignments = {}
+        self.used_keys = set()
+        self._dirty = False
+        self._lock = threading.Lock()
+        self.load()
+
+    def load(self):
+        """Load persisted assignments, dropping any outside the pool."""
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as assignments_file:
+                assignments = json.load(assignments_file)
+        except (OSError, json.JSONDecodeError) as err:
+            logger.error(f"Error loading fallback IP assignments from {self.path}: {err}")
+            return
+        hosts = set(self.hosts)
+        self.assignments = {key: ip for key, ip in assignments.items() if ip in hosts}
+        self._dirty = len(self.assignments) != len(assignments)
+
+    def allocate(self, key):
+        """Return the fallback IP for a key, assigning a free one if needed. Returns None if the pool is exhausted."""
+        key = str(key)
+        with self._lock:
+            self.used_keys.add(key)
+            if key in self.assignments:
+                return self.assignments[key]
+
+            taken = set(self.assignments.values())
+            if len(taken) >= len(self.hosts):
+                logger.error(f"Fallback IP pool {self.pool} is exhausted, no address for {key}")
+                return None
+
+            start = zlib.crc32(key.encode("utf-8")) % len(self.hosts)
+            for offset in range(len(self.hosts)):
+                ip = self.hosts[(start + offset) % len(self.hosts)]
+                if ip not in taken:
+                    self.assignments[key] = ip
+                    self._dirty = True
+                    logger.info(f"Assigned fallback IP {ip} to {key}")
+                    return ip
+        return None
+
+    def save(self, prune: bool = False):
+        """Persist assignments.
+
+        Args:
+            prune (bool): Release assignments for keys not allocated since the last prune. Use after a full sync.
+        """
+        with self._lock:
+            if prune:
+                stale = set(self.assignments) - self.used_keys
+                for key in stale:
+                    logger.info(f"Released fallback IP {self.assignments.pop(key)} from {key}")
+                self._dirty = self._dirty or bool(stale)
+                self.used_keys = set()
+            if not self._dirty:
+                return
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as assignments_file:
+                json.dump(self.assignments, assignments_file, indent=2, sort_keys=True)
+            os.replace(tmp_path, self.path)
+            self._dirty = False
@@ -1,12 +1,150 @@
 """ Utility Methods for working with MikroTik RouterOS Queues """
 
 from utils.base import ApiEndpoint
+from utils.concurrency import AdaptiveLimiter, is_overload_error
 import base64
 import json
 import logging
+import random
+import time
 
 logger = logging.getLogger(__name__)
 
+# The only address-list properties the sync reads
+ADDRESS_LIST_FIELDS = [".id", "address", "list", "comment"]
+
+
+# RouterOS errors meaning the router is already in the state a write asked for
+IDEMPOTENT_ERRORS = ("already have such entry", "no such item")
+
+
+def is_idempotent_error(err):
+    """Return True if a write failed only because the entry was already added or removed."""
+    text = str(err)
+    response = getattr(err, "response", None)
+    if response is not None and isinstance(getattr(response, "text", None), str):
+        text += response.text
+    return any(message in text for message in IDEMPOTENT_ERRORS)
+
+
+def reverify_failed_writes(mikrotik_api):
+    """Re-check only the entries whose bulk writes failed this cycle and apply them once more.
+
+    Works with either transport: each API keeps failed writes in `failed_writes` as
+    ("add" | "remove" | "move", addr_data) pairs. Returns the number of entries still wrong.
+    """
+    failed_writes, mikrotik_api.failed_writes = mikrotik_api.failed_writes, []
+    if not failed_writes:
+        return 0
+
+    logger.info(f"Re-verifying {len(failed_writes)} failed address-list writes")
+    still_failed = 0
+    for operation, addr_data in failed_writes:
+        try:
+            entries = mikrotik_api.get_address_list_item_id(addr_data["list_name"], addr_data["ip_address"]) or []
+            if operation == "add" and not entries:
+                mikrotik_api.add_address_to_list(addr_data["ip_address"], addr_data["list_name"], addr_data.get("comment", ""))
+            elif operation == "remove":
+                for entry in entries:
+                    mikrotik_api.remove_address_from_list(entry[".id"])
+            elif operation == "move":
+                if not entries:
+                    mikrotik_api.add_address_to_list(
+                        addr_data["ip_address"], addr_data["list_name"], addr_data.get("comment", "")
+                    )
+                for entry in mikrotik_api.get_address_list_item_id(addr_data["from_list"], addr_data["ip_address"]) or []:
+                    mikrotik_api.remove_address_from_list(entry[".id"])
+        except Exception as err:
+            still_failed += 1
+            logger.error(f"Re-verify failed to {operation} {addr_data['ip_address']} on '{addr_data['list_name']}': {err}")
+    logger.info(f"Re-verify completed: {len(failed_writes) - still_failed} fixed, {still_failed} still failing")
+    return still_failed
+
+
+def plan_list_moves(addresses_to_remove, addresses_to_add):
+    """Pair removals and additions of the same IP on different lists into in-place moves.
+
+    Args:
+        addresses_to_remove (list): Entries leaving a list, with entry_id, ip_address and list_name
+        addresses_to_add (list): Entries joining a list, with ip_address, list_name and comment
+    Returns:
+        tuple: (moves, remaining removals, remaining additions). Each move has entry_id, ip_address,
+            from_list, list_name and comment.
+    """
+    # An IP can leave several lists at once, so keep every removal and pair each with at most one addition
+    removals_by_ip = {}
+    for addr_data in addresses_to_remove:
+        removals_by_ip.setdefault(addr_data["ip_address"], []).append(addr_data)
+    paired = set()
+    moves = []
+    remaining_additions = []
+    for addr_data in addresses_to_add:
+        removal = next(
+            (
+                removal
+                for removal in removals_by_ip.get(addr_data["ip_address"], [])
+                if id(removal) not in paired and removal["list_name"] != addr_data["list_name"]
+            ),
+            None,
+        )
+        if removal is not None:
+            paired.add(id(removal))
+            moves.append({**addr_data, "entry_id": removal["entry_id"], "from_list": removal["list_name"]})
+        else:
+            remaining_additions.append(addr_data)
+    remaining_removals = [addr_data for addr_data in addresses_to_remove if id(addr_data) not in paired]
+    return moves, remaining_removals, remaining_additions
+
+
+def address_list_query(list_names):
+    """Build RouterOS query words matching entries in any of `list_names`."""
+    queries = [f"list={list_name}" for list_name in list_names]
+    if len(list_names) > 1:
+        queries.append("#" + "|" * (len(list_names) - 1))
+    return queries
+
+
+def quote_script_value(value):
+    """Quote a value for a RouterOS script, escaping the characters the script parser interprets."""
+    escaped = str(value)
+    for char in ("\\", '"', "$", "?"):
+        escaped = escaped.replace(char, f"\\{char}")
+    escaped = escaped.replace("\n", "\\n").replace("\r", "\\r")
+    return f'"{escaped}"'
+
+
+def render_address_list_script(addresses_to_add, addresses_to_remove, addresses_to_move=()):
+    """Render address-list moves, removals and additions as RouterOS script lines.
+
+    Each command is wrapped in `:do {} on-error={}` so an entry that was already added or removed
+    does not stop the rest of the script.
+    """
+    lines = []
+    for addr_data in addresses_to_move:
+        lines.append(
+            f":do {{ /ip firewall address-list set numbers={addr_data['entry_id']} "
+            f"list={quote_script_value(addr_data['list_name'])} "
+            f"comment={quote_script_value(addr_data.get('comment', ''))} }} on-error={{}}"
+        )
+    for addr_data in addresses_to_remove:
+        lines.append(f":do {{ /ip firewall address-list remove numbers={addr_data['entry_id']} }} on-error={{}}")
+    for addr_data in addresses_to_add:
+        lines.append(
+            f":do {{ /ip firewall address-list add list={quote_script_value(addr_data['list_name'])} "
+            f"address={quote_script_value(addr_data['ip_address'])} "
+            f"comment={quote_script_value(addr_data.get('comment', ''))} }} on-error={{}}"
+        )
+    return lines
+
+
+def split_address_lists(entries, list_names):
+    """Group address-list entries by list. Every name in `list_names` gets a (possibly empty) list."""
+    result = {list_name: [] for list_name in list_names}
+    for entry in entries or []:
+        if entry.get("list") in result:
+            result[entry["list"]].append(entry)
+    return result
+
 
 class MikroTikApi(ApiEndpoint):
     """interactions with the MikroTik API"""
@@ -19,8 +157,25 @@ class MikroTikApi(ApiEndpoint):
         params: dict = {},
         ssl_verify: bool = True,
         use_ssl: bool = True,
+        remove_batch_size: int = 0,
+        script_threshold: int = 0,
+        script_chunk_size: int = 500,
+        concurrency_min: int = 1,
+        concurrency_max: int = 10,
+        concurrency_initial: int = 10,
+        latency_target: float = 0.5,
+        max_retries: int = 0,
+        retry_backoff: float = 0.5,
     ):
-        """Create MikroTik API connection."""
+        """Create MikroTik API connection.
+
+        `remove_batch_size` entry IDs are removed per request by bulk removals; 0 sends one DELETE per entry.
+        A list sync with at least `script_threshold` changes is applied as scripts of `script_chunk_size`
+        commands instead of one request per entry; 0 disables script mode.
+        Per-entry bulk requests run between `concurrency_min` and `concurrency_max` at a time, adjusted
+        by how quickly the router answers relative to `latency_target` seconds, and are retried up to
+        `max_retries` times after overload errors with jittered exponential backoff from `retry_backoff` seconds.
+        """
         super().__init__(base_url=base_url)
         self.base_url = f"https://{base_url}/rest/"
         if not use_ssl:
@@ -32,6 +187,22 @@ class MikroTikApi(ApiEndpoint):
         authentication = base64.b64encode(credentials.encode("utf-8")).decode("utf-8")
         self.params = params
         self.headers = {"Accept": "*/*", "Authorization": f"Basic {authentication}"}
+        self.remove_batch_size = remove_batch_size
+        self.script_threshold = script_threshold
+        self.script_chunk_size = script_chunk_size
+        # Kept for the life of the connection so the limit learned for this router carries across cycles
+        self.limiter = AdaptiveLimiter(
+            floor=concurrency_min,
+            ceiling=concurrency_max,
+            initial=concurrency_initial,
+            latency_target=latency_target,
+            name=f"MikroTik {base_url}",
+        )
+        self.pool_size = max(self.pool_size, self.limiter.ceiling)
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        # Writes that still failed after retries, re-checked by reverify_failed_writes
+        self.failed_writes = []
 
     def get_address_list(self, list_name=None):
         """get address-list by name from router"""
@@ -43,6 +214,29 @@ class MikroTikApi(ApiEndpoint):
             address_list = self.api_call(path=url)
         return address_list
 
+    def get_address_lists(self, list_names):
+        """Get several address-lists in one request, projected to the fields the sync reads.
+
+        Returns a dictionary with list names as keys and address lists as values.
+        """
+        url = "ip/firewall/address-list/print"
+        _data = {".proplist": ADDRESS_LIST_FIELDS, ".query": address_list_query(list_names)}
+        address_list = self.api_call(path=url, payload=json.dumps(_data), method="POST")
+        return split_address_lists(address_list, list_names)
+
+    def count_address_list(self, list_name):
+        """Count the entries in an address-list without downloading them."""
+        url = "ip/firewall/address-list/print"
+        _data = json.dumps({"count-only": "", ".query": [f"list={list_name}"]})
+        result = self.api_call(path=url, payload=_data, method="POST")
+        return int(result["ret"])
+
+    def run_script(self, script):
+        """Run a RouterOS script on the router and wait for it to finish."""
+        url = "execute"
+        _data = json.dumps({"script": script, "as-string": ""})
+        return self.api_call(path=url, payload=_data, method="POST")
+
     def get_address_list_item_id(self, list_name, address):
         """Delete an address from an address-list."""
         url = f"ip/firewall/address-list?list={list_name}&address={address}"
@@ -50,6 +244,13 @@ class MikroTikApi(ApiEndpoint):
 
         return address_item
 
+    def get_address_entries(self, address):
+        """Get every address-list entry for an address, across all lists."""
+        url = f"ip/firewall/address-list?address={address}"
+        address_entries = self.api_call(path=url)
+
+        return address_entries
+
     def add_address_to_list(self, ip_address, list_name, comment=""):
         """Add an IP Address to an address-list."""
         url = f"ip/firewall/address-list"
@@ -62,6 +263,59 @@ class MikroTikApi(ApiEndpoint):
         url = f"ip/firewall/address-list/{entry_id}"
         self.api_call(path=url, method="DELETE", accept_204=True)
 
+    def move_address_to_list(self, entry_id, list_name, comment=""):
+        """Move an address-list entry to another list in place."""
+        url = f"ip/firewall/address-list/{entry_id}"
+        _data = json.dumps({"list": list_name, "comment": comment})
+        self.api_call(path=url, payload=_data, method="PATCH")
+
+    def remove_addresses_from_list(self, entry_ids):
+        """Remove several address-list entries in one request."""
+        url = "ip/firewall/address-list/remove"
+        _data = json.dumps({".id": ",".join(entry_ids)})
+        self.api_call(path=url, payload=_data, method="POST")
+
+    def _send_bulk_request(self, method, url, **kwargs):
+        """Send one request of a bulk operation on the pooled session, raising on an error status."""
+        if method == "PUT":
+            response = self.session.put(url, headers=self.headers, verify=self.verify, timeout=self.timeout, **kwargs)
+        elif method == "PATCH":
+            response = self.session.patch(url, headers=self.headers, verify=self.verify, timeout=self.timeout, **kwargs)
+        elif method == "POST":
+            response = self.session.post(url, headers=self.headers, verify=self.verify, timeout=self.timeout, **kwargs)
+        else:
+            response = self.session.delete(url, headers=self.headers, verify=self.verify, timeout=self.timeout, **kwargs)
+        response.raise_for_status()
+        return response
+
+    def _send_with_retries(self, method, url, idempotent=True, **kwargs):
+        """Send a bulk request, retrying overload errors with jittered exponential backoff.
+
+        Unless `idempotent` is False, an "already have such entry" or "no such item" error counts as success.
+        """
+        for attempt in range(self.max_retries + 1):
+            try:
+                return self.limiter.call(self._send_bulk_request, method, url, **kwargs)
+            except Exception as err:
+                if idempotent and is_idempotent_error(err):
+                    logger.debug(f"{method} {url} already applied: {err}")
+                    return None
+                if attempt == self.max_retries or not is_overload_error(err):
+                    raise
+                delay = random.uniform(0, self.retry_backoff * 2**attempt)
+                logger.warning(f"{method} {url} failed ({err}), retry {attempt + 1} of {self.max_retries} in {delay:.2f}s")
+                time.sleep(delay)
+
+    def log_concurrency(self):
+        """Log the adaptive concurrency limit and request statistics for this router."""
+        stats = self.limiter.stats()
+        logger.info(
+            f"Concurrency limit {stats['limit']} (range {stats['floor']}-{stats['ceiling']}), "
+            f"average latency {stats['average_latency_ms']} ms, {stats['overload_errors']} overload errors, "
+            f"{stats['slow_requests']} slow requests, {stats['increases']} increases, {stats['decreases']} decreases"
+        )
+        return stats
+
     def bulk_add_addresses_to_list(self, addresses_data):
         """Add multiple IP addresses to an address-list using concurrent requests.
         
@@ -91,23 +345,10 @@ class MikroTikApi(ApiEndpoint):
             
             # Use concurrent requests for better performance
             import concurrent.futures
-            import threading
-            
-            # Thread-local storage for session reuse
-            thread_local = threading.local()
-            
-            def get_session():
-                if not hasattr(thread_local, "session"):
-                    import requests
-                    thread_local.session = requests.Session()
-                    thread_local.session.headers.update(self.headers)
-                    thread_local.session.verify = self.verify
-                return thread_local.session
             
             def add_single_address(addr_data):
-                """Add a single address using the session."""
+                """Add a single address using the pooled session."""
                 try:
-                    session = get_session()
                     url = f"{self.base_url}ip/firewall/address-list"
                     payload = {
                         "list": list_name,
@@ -115,8 +356,7 @@ class MikroTikApi(ApiEndpoint):
                         "comment": addr_data.get('comment', '')
                     }
                     
-                    response = session.put(url, json=payload)
-                    response.raise_for_status()
+                    self._send_with_retries("PUT", url, json=payload)
                     return True, addr_data.get('ip_address')
                 except Exception as e:
                     return False, f"{addr_data.get('ip_address')}: {str(e)}"
@@ -125,7 +365,7 @@ class MikroTikApi(ApiEndpoint):
             success_count = 0
             error_count = 0
             
-            with concurrent.futures.ThreadPoolExecutor(max_workers=10) as executor:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=self.limiter.ceiling) as executor:
                 # Submit all tasks
                 future_to_addr = {
                     executor.submit(add_single_address, addr_data): addr_data 
@@ -140,6 +380,7 @@ class MikroTikApi(ApiEndpoint):
                     else:
                         error_count += 1
                         logger.error(f"Failed to add address: {result}")
+                        self.failed_writes.append(("add", future_to_addr[future]))
             
             logger.info(f"Bulk add completed for '{list_name}': {success_count} successful, {error_count} failed")
             
@@ -147,6 +388,8 @@ class MikroTikApi(ApiEndpoint):
             if error_count > 0:
                 logger.warning(f"Some addresses failed to add to '{list_name}': {error_count} errors")
 
+        self.log_concurrency()
+
     def bulk_remove_addresses_from_list(self, addresses_data):
         """Remove multiple IP addresses from address-lists using concurrent requests.
         
@@ -176,40 +419,44 @@ class MikroTikApi(ApiEndpoint):
             
             # Use concurrent requests for better performance
             import concurrent.futures
-            import threading
-            
-            # Thread-local storage for session reuse
-            thread_local = threading.local()
-            
-            def get_session():
-                if not hasattr(thread_local, "session"):
-                    import requests
-                    thread_local.session = requests.Session()
-                    thread_local.session.headers.update(self.headers)
-                    thread_local.session.verify = self.verify
-                return thread_local.session
             
             def remove_single_address(addr_data):
-                """Remove a single address using the session."""
+                """Remove a single address using the pooled session."""
                 try:
-                    session = get_session()
                     url = f"{self.base_url}ip/firewall/address-list/{addr_data.get('entry_id')}"
                     
-                    response = session.delete(url)
-                    response.raise_for_status()
+                    self._send_with_retries("DELETE", url)
                     return True, addr_data.get('ip_address')
                 except Exception as e:
                     return False, f"{addr_data.get('ip_address')}: {str(e)}"
             
-            # Use ThreadPoolExecutor for concurrent requests
             success_count = 0
             error_count = 0
-            
-            with concurrent.futures.ThreadPoolExecutor(max_workers=10) as executor:
+
+            # Remove in batches of entry IDs, falling back to single removals for a batch that still fails after
+            # its retries. One missing entry fails the whole batch, so "no such item" is not taken as success here
+            single_addresses = addresses
+            if self.remove_batch_size > 0:
+                single_addresses = []
+                batch_url = f"{self.base_url}ip/firewall/address-list/remove"
+                for start in range(0, len(addresses), self.remove_batch_size):
+                    batch = addresses[start : start + self.remove_batch_size]
+                    try:
+                        payload = {".id": ",".join(addr_data.get('entry_id') for addr_data in batch)}
+                        self._send_with_retries("POST", batch_url, idempotent=False, json=payload)
+                        success_count += len(batch)
+                    except Exception as e:
+                        logger.warning(
+                            f"Batch removal from '{list_name}' failed, removing {len(batch)} entries individually: {e}"
+                        )
+                        single_addresses.extend(batch)
+
+            # Use ThreadPoolExecutor for concurrent requests
+            with concurrent.futures.ThreadPoolExecutor(max_workers=self.limiter.ceiling) as executor:
                 # Submit all tasks
                 future_to_addr = {
                     executor.submit(remove_single_address, addr_data): addr_data 
-                    for addr_data in addresses
+                    for addr_data in single_addresses
                 }
                 
                 # Collect results
@@ -220,6 +467,7 @@ class MikroTikApi(ApiEndpoint):
                     else:
                         error_count += 1
                         logger.error(f"Failed to remove address: {result}")
+                        self.failed_writes.append(("remove", future_to_addr[future]))
             
             logger.info(f"Bulk remove completed for '{list_name}': {success_count} successful, {error_count} failed")
             
@@ -227,26 +475,127 @@ class MikroTikApi(ApiEndpoint):
             if error_count > 0:
                 logger.warning(f"Some addresses failed to remove from '{list_name}': {error_count} errors")
 
-    def bulk_sync_address_list(self, list_name, addresses_to_add, addresses_to_remove):
+        self.log_concurrency()
+
+    def bulk_sync_address_list(self, list_name, addresses_to_add, addresses_to_remove, expected_count=None, add_first=False):
         """Perform bulk sync operation for a single address list.
         
         Args:
             list_name (str): Name of the address list to sync
             addresses_to_add (list): List of addresses to add
             addresses_to_remove (list): List of addresses to remove
+            expected_count (int): Optional number of entries the list should hold afterwards,
+                checked after a script-mode sync
+            add_first (bool): Add before removing, so a prefix being split or merged never
+                leaves its addresses uncovered
         """
         logger.info(f"Starting bulk sync for list '{list_name}'")
         logger.info(f"Adding {len(addresses_to_add)} addresses, removing {len(addresses_to_remove)} addresses")
         
         # Perform bulk operations
+        if self.script_threshold > 0 and len(addresses_to_add) + len(addresses_to_remove) >= self.script_threshold:
+            self.apply_address_list_script(list_name, addresses_to_add, addresses_to_remove, expected_count, add_first)
+            logger.info(f"Completed bulk sync for list '{list_name}'")
+            return
+
+        if addresses_to_add and add_first:
+            self.bulk_add_addresses_to_list(addresses_to_add)
+
         if addresses_to_remove:
             self.bulk_remove_addresses_from_list(addresses_to_remove)
         
-        if addresses_to_add:
+        if addresses_to_add and not add_first:
             self.bulk_add_addresses_to_list(addresses_to_add)
         
         logger.info(f"Completed bulk sync for list '{list_name}'")
 
+    def run_script_lines(self, lines):
+        """Run script commands in chunks of `script_chunk_size`."""
+        for start in range(0, len(lines), self.script_chunk_size):
+            self.run_script("\n".join(lines[start : start + self.script_chunk_size]))
+
+    def bulk_move_addresses(self, moves):
+        """Move entries between address-lists in place, one PATCH per entry using concurrent requests.
+
+        The entry never leaves the router, so the address is on one list or the other at every moment.
+        Args:
+            moves (list): List of dictionaries containing:
+                - entry_id: Entry ID to move
+                - ip_address: IP address (for logging and re-verify)
+                - from_list: Name of the list the entry is on
+                - list_name: Name of the list to move it to
+                - comment: Comment for the entry on its new list
+        """
+        if not moves:
+            logger.info("No addresses to move in bulk operation")
+            return
+
+        logger.info(f"Bulk moving {len(moves)} addresses")
+        if self.script_threshold > 0 and len(moves) >= self.script_threshold:
+            logger.info(f"Applying {len(moves)} moves as scripts of up to {self.script_chunk_size} commands")
+            self.run_script_lines(render_address_list_script([], [], moves))
+            return
+
+        import concurrent.futures
+
+        def move_single_address(move):
+            """Move a single entry using the pooled session."""
+            try:
+                url = f"{self.base_url}ip/firewall/address-list/{move['entry_id']}"
+                payload = {"list": move["list_name"], "comment": move.get("comment", "")}
+                # "no such item" means the entry is gone, not moved, so it is a real failure here
+                self._send_with_retries("PATCH", url, idempotent=False, json=payload)
+                return True, move["ip_address"]
+            except Exception as e:
+                return False, f"{move['ip_address']}: {str(e)}"
+
+        success_count = 0
+        error_count = 0
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.limiter.ceiling) as executor:
+            future_to_move = {executor.submit(move_single_address, move): move for move in moves}
+            for future in concurrent.futures.as_completed(future_to_move):
+                success, result = future.result()
+                if success:
+                    success_count += 1
+                else:
+                    error_count += 1
+                    logger.error(f"Failed to move address: {result}")
+                    self.failed_writes.append(("move", future_to_move[future]))
+
+        logger.info(f"Bulk move completed: {success_count} successful, {error_count} failed")
+        self.log_concurrency()
+
+    def apply_address_list_script(self, list_name, addresses_to_add, addresses_to_remove, expected_count=None, add_first=False):
+        """Apply address-list changes as RouterOS scripts run in chunks, then verify the list size.
+
+        The script skips commands that fail, so if the list ends up the wrong size every planned addition
+        and removal is queued in `failed_writes` for reverify_failed_writes to check one by one.
+        Args:
+            list_name (str): Name of the address list being synced
+            addresses_to_add (list): List of addresses to add
+            addresses_to_remove (list): List of addresses to remove, with entry_id
+            expected_count (int): Optional number of entries the list should hold afterwards
+            add_first (bool): Render the additions ahead of the removals
+        """
+        if add_first:
+            lines = render_address_list_script(addresses_to_add, []) + render_address_list_script([], addresses_to_remove)
+        else:
+            lines = render_address_list_script(addresses_to_add, addresses_to_remove)
+        logger.info(f"Applying {len(lines)} changes to '{list_name}' as scripts of up to {self.script_chunk_size} commands")
+        self.run_script_lines(lines)
+
+        if expected_count is not None:
+            count = self.count_address_list(list_name)
+            if count != expected_count:
+                logger.error(
+                    f"Script sync of '{list_name}' left {count} entries, expected {expected_count}, "
+                    f"re-verifying its {len(addresses_to_add) + len(addresses_to_remove)} changes"
+                )
+                self.failed_writes.extend(("add", addr_data) for addr_data in addresses_to_add)
+                self.failed_writes.extend(("remove", addr_data) for addr_data in addresses_to_remove)
+            else:
+                logger.info(f"Script sync of '{list_name}' verified: {count} entries")
+
     def get_address_list_bulk(self, list_names=None):
         """Get multiple address lists in a single API call.
         
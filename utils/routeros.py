@@ -0,0 +1,440 @@
+""" Utility Methods for working with the MikroTik RouterOS API (port 8728/8729) """
+
+import hashlib
+import logging
+import socket
+import ssl
+import threading
+
+from utils.mikrotik import ADDRESS_LIST_FIELDS, address_list_query, is_idempotent_error, split_address_lists
+
+logger = logging.getLogger(__name__)
+
+
+def encode_length(length: int):
+    """Encode a word length using the RouterOS API variable-length scheme."""
+    if length < 0x80:
+        return bytes([length])
+    if length < 0x4000:
+        return (length | 0x8000).to_bytes(2, "big")
+    if length < 0x200000:
+        return (length | 0xC00000).to_bytes(3, "big")
+    if length < 0x10000000:
+        return (length | 0xE0000000).to_bytes(4, "big")
+    return b"\xf0" + length.to_bytes(4, "big")
+
+
+def encode_sentence(words):
+    """Encode a list of words into a RouterOS API sentence, terminated by an empty word."""
+    data = bytearray()
+    for word in words:
+        raw = word.encode("utf-8")
+        data += encode_length(len(raw))
+        data += raw
+    data += b"\x00"
+    return bytes(data)
+
+
+def read_length(read):
+    """Read a word length using `read(n)`, which must return exactly n bytes."""
+    first = read(1)[0]
+    if first < 0x80:
+        return first
+    if first < 0xC0:
+        return int.from_bytes(bytes([first & 0x3F]) + read(1), "big")
+    if first < 0xE0:
+        return int.from_bytes(bytes([first & 0x1F]) + read(2), "big")
+    if first < 0xF0:
+        return int.from_bytes(bytes([first & 0x0F]) + read(3), "big")
+    return int.from_bytes(read(4), "big")
+
+
+def read_sentence(read):
+    """Read one sentence using `read(n)`. Returns the list of words."""
+    words = []
+    while True:
+        length = read_length(read)
+        if length == 0:
+            return words
+        words.append(read(length).decode("utf-8", errors="replace"))
+
+
+def parse_sentence(words):
+    """Split a reply sentence into its type, attributes and tag."""
+    reply_type = words[0] if words else ""
+    attributes = {}
+    tag = None
+    for word in words[1:]:
+        if word.startswith(".tag="):
+            tag = word[len(".tag=") :]
+        elif word.startswith("="):
+            key, _, value = word[1:].partition("=")
+            attributes[key] = value
+    return reply_type, attributes, tag
+
+
+class RouterOSApiClient:
+    """Persistent connection to the RouterOS API that supports tagged, pipelined commands."""
+
+    def __init__(
+        self,
+        host: str,
+        username: str,
+        password: str,
+        port: int = None,
+        use_ssl: bool = False,
+        ssl_verify: bool = True,
+        timeout: float = 30,
+    ):
+        """Create RouterOS API connection. The socket is opened on first use."""
+        self.host = host
+        self.port = port or (8729 if use_ssl else 8728)
+        self.username = username
+        self.password = password
+        self.use_ssl = use_ssl
+        self.ssl_verify = ssl_verify
+        self.timeout = timeout
+        self.sock = None
+        self._tag = 0
+        self._lock = threading.RLock()
+
+    def _read(self, length: int):
+        """Read exactly `length` bytes from the socket."""
+        data = bytearray()
+        while len(data) < length:
+            chunk = self.sock.recv(length - len(data))
+            if not chunk:
+                raise ConnectionError("RouterOS API connection closed")
+            data += chunk
+        return bytes(data)
+
+    def connect(self):
+        """Open the socket and log in."""
+        with self._lock:
+            self.close()
+            sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+            if self.use_ssl:
+                context = ssl.create_default_context()
+                if not self.ssl_verify:
+                    context.check_hostname = False
+                    context.verify_mode = ssl.CERT_NONE
+                sock = context.wrap_socket(sock, server_hostname=self.host)
+            self.sock = sock
+            self.login()
+            logger.debug(f"Connected to RouterOS API at {self.host}:{self.port}")
+
+    def close(self):
+        """Close the socket if it is open."""
+        with self._lock:
+            if self.sock is not None:
+                try:
+                    self.sock.close()
+                except OSError:
+                    pass
+                self.sock = None
+
+    def login(self):
+        """Log in, falling back to the challenge-response login used before RouterOS 6.43."""
+        replies, error, attributes = self._run("/login", {"name": self.username, "password": self.password})
+        if error:
+            raise Exception(f"Error communicating to the API: login failed: {error}")
+        challenge = attributes.get("ret")
+        if challenge:
+            digest = hashlib.md5(b"\x00" + self.password.encode("utf-8") + bytes.fromhex(challenge)).hexdigest()
+            replies, error, attributes = self._run("/login", {"name": self.username, "response": f"00{digest}"})
+            if error:
+                raise Exception(f"Error communicating to the API: login failed: {error}")
+
+    def _next_tag(self):
+        self._tag += 1
+        return str(self._tag)
+
+    def _sentence(self, command, attributes=None, queries=None, tag=None):
+        words = [command]
+        words += [f"={key}={value}" for key, value in (attributes or {}).items()]
+        words += list(queries or [])
+        if tag is not None:
+            words.append(f".tag={tag}")
+        return encode_sentence(words)
+
+    def _run(self, command, attributes=None, queries=None):
+        """Send one command and wait for its completion. Returns (replies, error, done attributes)."""
+        results = self._pipeline_batch([(command, attributes, queries)])
+        return results[0]
+
+    def _pipeline_batch(self, commands):
+        """Send a batch of tagged commands in one write, then collect every reply by tag."""
+        tags = [self._next_tag() for _ in commands]
+        self.sock.sendall(
+            b"".join(
+                self._sentence(command, attributes, queries, tag)
+                for (command, attributes, queries), tag in zip(commands, tags)
+            )
+        )
+
+        pending = {tag: {"replies": [], "error": None, "done": None} for tag in tags}
+        remaining = len(tags)
+        while remaining:
+            reply_type, attributes, tag = parse_sentence(read_sentence(self._read))
+            if reply_type == "!fatal":
+                self.close()
+                raise ConnectionError(f"RouterOS API fatal error: {attributes or 'connection closed'}")
+            result = pending.get(tag)
+            if result is None:
+                logger.debug(f"Ignoring RouterOS API reply for unknown tag {tag}")
+                continue
+            if reply_type == "!re":
+                result["replies"].append(attributes)
+            elif reply_type == "!trap":
+                result["error"] = attributes.get("message", "unknown error")
+            elif reply_type == "!done":
+                result["done"] = attributes
+                remaining -= 1
+
+        return [(pending[tag]["replies"], pending[tag]["error"], pending[tag]["done"]) for tag in tags]
+
+    def pipeline(self, commands, window: int = 100):
+        """Run many commands over the one connection, keeping up to `window` in flight.
+
+        Args:
+            commands (list): (command, attributes, queries) tuples.
+            window (int): Commands sent before waiting for their replies.
+        Returns:
+            list: (replies, error) per command, in order. `error` is the trap message or None.
+        """
+        results = []
+        with self._lock:
+            if self.sock is None:
+                self.connect()
+            for start in range(0, len(commands), max(window, 1)):
+                batch = commands[start : start + max(window, 1)]
+                try:
+                    batch_results = self._pipeline_batch(batch)
+                except (OSError, ConnectionError) as err:
+                    # Replies for this batch are lost with the connection; the caller sees them as failed
+                    logger.error(f"RouterOS API connection error: {err}")
+                    self.close()
+                    batch_results = [([], f"connection error: {err}", None) for _ in batch]
+                    if start + len(batch) < len(commands):
+                        self.connect()
+                results.extend((replies, error) for replies, error, _done in batch_results)
+        return results
+
+    def talk(self, command, attributes=None, queries=None):
+        """Run a single command. Returns the list of reply attribute dictionaries.
+
+        Raises:
+            Exception: Error thrown if the router replies with a trap or the connection fails.
+        """
+        with self._lock:
+            for attempt in range(2):
+                try:
+                    if self.sock is None:
+                        self.connect()
+                    replies, error, _done = self._run(command, attributes, queries)
+                    break
+                except (OSError, ConnectionError) as err:
+                    self.close()
+                    if attempt:
+                        logger.error(f"Error communicating to the API: {err}")
+                        raise Exception(f"Error communicating to the API: {err}")
+        if error:
+            logger.error(f"Error communicating to the API: {command}: {error}")
+            raise Exception(f"Error communicating to the API: {command}: {error}")
+        return replies
+
+
+class MikroTikRouterOSApi:
+    """interactions with the MikroTik RouterOS API, as an alternative transport to the REST API"""
+
+    ADDRESS_LIST = "/ip/firewall/address-list"
+
+    def __init__(
+        self,
+        base_url: str,
+        username: str,
+        password: str,
+        port: int = None,
+        ssl_verify: bool = True,
+        use_ssl: bool = True,
+        pipeline_window: int = 100,
+    ):
+        """Create MikroTik RouterOS API connection."""
+        self.base_url = base_url
+        self.username = username
+        self.password = password
+        self.verify = ssl_verify
+        self.pipeline_window = pipeline_window
+        # Writes that failed, re-checked by reverify_failed_writes
+        self.failed_writes = []
+        self.client = RouterOSApiClient(
+            host=base_url,
+            port=port,
+            username=username,
+            password=password,
+            use_ssl=use_ssl,
+            ssl_verify=ssl_verify,
+        )
+
+    def get_address_list(self, list_name=None):
+        """get address-list by name from router"""
+        queries = [f"?list={list_name}"] if list_name is not None else []
+        return self.client.talk(f"{self.ADDRESS_LIST}/print", queries=queries)
+
+    def get_address_lists(self, list_names):
+        """Get several address-lists in one command, projected to the fields the sync reads.
+
+        Returns a dictionary with list names as keys and address lists as values.
+        """
+        entries = self.client.talk(
+            f"{self.ADDRESS_LIST}/print",
+            {".proplist": ",".join(ADDRESS_LIST_FIELDS)},
+            queries=[f"?{query}" for query in address_list_query(list_names)],
+        )
+        return split_address_lists(entries, list_names)
+
+    def get_address_list_item_id(self, list_name, address):
+        """Get the address-list entries for an address in a list."""
+        return self.client.talk(f"{self.ADDRESS_LIST}/print", queries=[f"?list={list_name}", f"?address={address}"])
+
+    def get_address_entries(self, address):
+        """Get every address-list entry for an address, across all lists."""
+        return self.client.talk(f"{self.ADDRESS_LIST}/print", queries=[f"?address={address}"])
+
+    def add_address_to_list(self, ip_address, list_name, comment=""):
+        """Add an IP Address to an address-list."""
+        self.client.talk(f"{self.ADDRESS_LIST}/add", {"list": list_name, "address": ip_address, "comment": comment})
+
+    def remove_address_from_list(self, entry_id):
+        """Remove an IP Address from an address-list."""
+        self.client.talk(f"{self.ADDRESS_LIST}/remove", {".id": entry_id})
+
+    def move_address_to_list(self, entry_id, list_name, comment=""):
+        """Move an address-list entry to another list in place."""
+        self.client.talk(f"{self.ADDRESS_LIST}/set", {".id": entry_id, "list": list_name, "comment": comment})
+
+    def remove_addresses_from_list(self, entry_ids):
+        """Remove several address-list entries in one command."""
+        self.client.talk(f"{self.ADDRESS_LIST}/remove", {".id": ",".join(entry_ids)})
+
+    def bulk_add_addresses_to_list(self, addresses_data):
+        """Add multiple IP addresses to address-lists, pipelined over the API connection.
+
+        Args:
+            addresses_data (list): List of dictionaries containing:
+                - ip_address: IP address to add
+                - list_name: Name of the address list
+                - comment: Optional comment for the address
+        """
+        if not addresses_data:
+            logger.info("No addresses to add in bulk operation")
+            return
+
+        logger.info(f"Bulk adding {len(addresses_data)} addresses")
+        commands = [
+            (
+                f"{self.ADDRESS_LIST}/add",
+                {
+                    "list": addr_data.get("list_name"),
+                    "address": addr_data.get("ip_address"),
+                    "comment": addr_data.get("comment", ""),
+                },
+                None,
+            )
+            for addr_data in addresses_data
+        ]
+        results = self.client.pipeline(commands, window=self.pipeline_window)
+
+        error_count = 0
+        for addr_data, (_replies, error) in zip(addresses_data, results):
+            if error and not is_idempotent_error(error):
+                error_count += 1
+                logger.error(f"Failed to add address: {addr_data.get('ip_address')}: {error}")
+                self.failed_writes.append(("add", addr_data))
+        logger.info(f"Bulk add completed: {len(results) - error_count} successful, {error_count} failed")
+
+    def bulk_remove_addresses_from_list(self, addresses_data):
+        """Remove multiple IP addresses from address-lists, pipelined over the API connection.
+
+        Args:
+            addresses_data (list): List of dictionaries containing:
+                - entry_id: Entry ID to remove
+                - ip_address: IP address (for logging)
+                - list_name: Name of the address list (for logging)
+        """
+        if not addresses_data:
+            logger.info("No addresses to remove in bulk operation")
+            return
+
+        logger.info(f"Bulk removing {len(addresses_data)} addresses")
+        commands = [
+            (f"{self.ADDRESS_LIST}/remove", {".id": addr_data.get("entry_id")}, None) for addr_data in addresses_data
+        ]
+        results = self.client.pipeline(commands, window=self.pipeline_window)
+
+        error_count = 0
+        for addr_data, (_replies, error) in zip(addresses_data, results):
+            if error and not is_idempotent_error(error):
+                error_count += 1
+                logger.error(f"Failed to remove address: {addr_data.get('ip_address')}: {error}")
+                self.failed_writes.append(("remove", addr_data))
+        logger.info(f"Bulk remove completed: {len(results) - error_count} successful, {error_count} failed")
+
+    def bulk_move_addresses(self, moves):
+        """Move entries between address-lists in place, pipelined over the API connection.
+
+        Args:
+            moves (list): List of dictionaries containing:
+                - entry_id: Entry ID to move
+                - ip_address: IP address (for logging and re-verify)
+                - from_list: Name of the list the entry is on
+                - list_name: Name of the list to move it to
+                - comment: Comment for the entry on its new list
+        """
+        if not moves:
+            logger.info("No addresses to move in bulk operation")
+            return
+
+        logger.info(f"Bulk moving {len(moves)} addresses")
+        commands = [
+            (
+                f"{self.ADDRESS_LIST}/set",
+                {".id": move["entry_id"], "list": move["list_name"], "comment": move.get("comment", "")},
+                None,
+            )
+            for move in moves
+        ]
+        results = self.client.pipeline(commands, window=self.pipeline_window)
+
+        error_count = 0
+        for move, (_replies, error) in zip(moves, results):
+            if error:
+                error_count += 1
+                logger.error(f"Failed to move address: {move['ip_address']}: {error}")
+                self.failed_writes.append(("move", move))
+        logger.info(f"Bulk move completed: {len(results) - error_count} successful, {error_count} failed")
+
+    def bulk_sync_address_list(self, list_name, addresses_to_add, addresses_to_remove, expected_count=None, add_first=False):
+        """Perform bulk sync operation for a single address list.
+
+        Args:
+            list_name (str): Name of the address list to sync
+            addresses_to_add (list): List of addresses to add
+            addresses_to_remove (list): List of addresses to remove
+            expected_count (int): Unused; pipelined commands already report each failure
+            add_first (bool): Add before removing, so a prefix being split or merged never
+                leaves its addresses uncovered
+        """
+        logger.info(f"Starting bulk sync for list '{list_name}'")
+        logger.info(f"Adding {len(addresses_to_add)} addresses, removing {len(addresses_to_remove)} addresses")
+
+        if addresses_to_add and add_first:
+            self.bulk_add_addresses_to_list(addresses_to_add)
+
+        if addresses_to_remove:
+            self.bulk_remove_addresses_from_list(addresses_to_remove)
+
+        if addresses_to_add and not add_first:
+            self.bulk_add_addresses_to_list(addresses_to_add)
+
+        logger.info(f"Completed bulk sync for list '{list_name}'")
@@ -0,0 +1,234 @@
+""" Snapshots of the last sync cycle, so the next one only diffs what changed """
+
+import hashlib
+import json
+import logging
+import os
+import threading
+
+from utils.sync import index_desired_entries, index_router_entries, plan_sync
+
+logger = logging.getLogger(__name__)
+
+# Bumped whenever the snapshot file layout changes
+SNAPSHOT_FORMAT_VERSION = 1
+
+
+def record_key(address):
+    """Return the key identifying a UISP service record across cycles."""
+    return f"{address.client_id}_{address.service_id}"
+
+
+def record_hash(address):
+    """Return a content hash over everything in a UISP record that reaches the router.
+
+    The comment is built from the client name and the record key, so hashing the name covers it.
+    """
+    content = f"{address.ip_address}\0{address.service_status}\0{address.client_name}"
+    return hashlib.blake2b(content.encode("utf-8"), digest_size=8).hexdigest()
+
+
+def index_contributors(records, list_statuses):
+    """Index the record keys behind each (list name, address) entry, as tuples so copies can share them."""
+    contributors = {}
+    for key, (_hash, ip_address, service_status) in records.items():
+        for entry_key in entry_keys(ip_address, service_status, list_statuses):
+            contributors[entry_key] = contributors.get(entry_key, ()) + (key,)
+    return contributors
+
+
+def entry_keys(ip_address, service_status, list_statuses):
+    """Return the (list name, address) keys a record with this IP and status places on the router."""
+    return [
+        (list_name, ip_address)
+        for list_name, statuses in list_statuses.items()
+        if statuses is None or service_status in statuses
+    ]
+
+
+class SyncSnapshot:
+    """Normalized UISP and router state from the last applied cycle of one router.
+
+    UISP records are kept with a content hash, together with the entries each one placed on the
+    router, and router entries with their IDs. The next cycle hashes the new records and compares the
+    router entries it reads. It then diffs only the entries touched by records whose hash changed, by
+    router entries that changed, or by the previous plan. Every other entry was in sync after the last
+    cycle and has not changed on either side since.
+
+    Changes to the list settings, a failed apply, or `full_sync_every` incremental cycles in a row
+    trigger a full diff instead.
+    """
+
+    def __init__(self, path: str, fingerprint: str = "", full_sync_every: int = 96):
+        """Create sync snapshot.
+
+        Args:
+            path (str): JSON file the snapshot is persisted to.
+            fingerprint (str): Identifies the list settings the snapshot was taken with. A snapshot with
+                a different fingerprint is ignored.
+            full_sync_every (int): Run a full diff after this many incremental cycles, 0 to never force one.
+        """
+        self.path = path
+        self.fingerprint = fingerprint
+        self.full_sync_every = full_sync_every
+        self.state = None
+        self._next = None
+        self._next_unchanged = False
+        self._lock = threading.Lock()
+        self.load()
+
+    def load(self):
+        """Load the persisted snapshot, ignoring one from another format or other list settings."""
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as snapshot_file:
+                document = json.load(snapshot_file)
+        except (OSError, json.JSONDecodeError) as err:
+            logger.error(f"Error loading sync snapshot from {self.path}: {err}")
+            return
+        if document.get("version") != SNAPSHOT_FORMAT_VERSION or document.get("fingerprint") != self.fingerprint:
+            logger.info(f"Sync snapshot {self.path} was taken with other settings, running a full diff")
+            return
+        self.state = {
+            "records": {key: tuple(record) for key, record in document["records"].items()},
+            "contributors": None,
+            "router": {
+                (list_name, ip_address): entry_id
+                for list_name, entries in document["router"].items()
+                for ip_address, entry_id in entries.items()
+            },
+            "pending": {tuple(key) for key in document["pending"]},
+            "incremental_cycles": document.get("incremental_cycles", 0),
+        }
+
+    def plan(self, client_addresses, router_lists, list_statuses, move_lists=()):
+        """Plan a cycle, diffing only what changed since the snapshot when there is one.
+
+        Args:
+            client_addresses (list): UISPClientAddress objects for this router.
+            router_lists (dict): Mapping of list name to the entries on it, as from `get_address_lists`.
+            list_statuses (dict): Mapping of list name to status names, or None for every status.
+            move_lists (iterable): Lists whose entries move in place; see `plan_sync`.
+        Returns:
+            dict: The change plan, as from `plan_sync`. Call `save` once it has been applied.
+        """
+        records = {}
+        addresses = {}
+        for address in client_addresses:
+            key = record_key(address)
+            records[key] = (record_hash(address), address.ip_address, address.service_status)
+            addresses[key] = address
+        current = index_router_entries(router_lists)
+
+        with self._lock:
+            state = self.state
+            if state is not None and self.full_sync_every and state["incremental_cycles"] >= self.full_sync_every:
+                logger.info(f"{state['incremental_cycles']} incremental cycles since the last full diff, running a full diff")
+                state = None
+
+            if state is None:
+                desired = index_desired_entries(client_addresses, list_statuses)
+                plan = plan_sync(desired, current, list_statuses, move_lists)
+                contributors = index_contributors(records, list_statuses)
+                incremental_cycles = 0
+                unchanged = False
+            else:
+                # Only records whose content hash changed, appeared or disappeared move their entries
+                changed = {key for key, _record in records.items() ^ state["records"].items()}
+                if state["contributors"] is None:
+                    state["contributors"] = index_contributors(state["records"], list_statuses)
+                # The snapshot keeps its own index until it is replaced; only the touched entries get new tuples
+                contributors = dict(state["contributors"])
+                affected = set()
+                for key in changed:
+                    previous = state["records"].get(key)
+                    if previous is not None:
+                        for entry_key in entry_keys(previous[1], previous[2], list_statuses):
+                            remaining = tuple(other for other in contributors[entry_key] if other != key)
+                            if remaining:
+                                contributors[entry_key] = remaining
+                            else:
+                                del contributors[entry_key]
+                            affected.add(entry_key)
+                    if key in records:
+                        for entry_key in entry_keys(records[key][1], records[key][2], list_statuses):
+                            contributors[entry_key] = contributors.get(entry_key, ()) + (key,)
+                            affected.add(entry_key)
+
+                # Router entries added, removed or replaced since the snapshot, by this tool or by hand
+                router_changed = {entry_key for entry_key, _entry_id in current.items() ^ state["router"].items()}
+                keys = affected | router_changed | state["pending"]
+                desired = {
+                    entry_key: addresses[min(contributors[entry_key])].comment
+                    for entry_key in keys
+                    if entry_key in contributors
+                }
+                plan = plan_sync(
+                    desired,
+                    current,
+                    list_statuses,
+                    move_lists,
+                    keys=keys,
+                    list_sizes={list_name: len(router_lists.get(list_name) or []) for list_name in list_statuses},
+                )
+                incremental_cycles = state["incremental_cycles"] + 1
+                unchanged = not keys
+                logger.info(
+                    f"Incremental diff: {len(changed)} of {len(records)} UISP records changed, "
+                    f"{len(router_changed)} router entries changed, {len(keys)} entries checked"
+                )
+
+            pending = {(move["from_list"], move["ip_address"]) for move in plan["moves"]}
+            pending.update((move["list_name"], move["ip_address"]) for move in plan["moves"])
+            for list_name, changes in plan["lists"].items():
+                pending.update((list_name, addr_data["ip_address"]) for addr_data in changes["add"] + changes["remove"])
+            self._next = {
+                "records": records,
+                "contributors": contributors,
+                "router": current,
+                "pending": pending,
+                "incremental_cycles": incremental_cycles,
+            }
+            self._next_unchanged = unchanged
+        return plan
+
+    def save(self):
+        """Persist the state from the last `plan`, once that plan has been applied.
+
+        A cycle that found nothing changed on either side leaves the file as it is.
+        """
+        with self._lock:
+            if self._next is None:
+                return
+            state = self._next
+            if self._next_unchanged:
+                self.state = state
+                self._next = None
+                return
+            document = {
+                "version": SNAPSHOT_FORMAT_VERSION,
+                "fingerprint": self.fingerprint,
+                "records": state["records"],
+                "router": {},
+                "pending": sorted(state["pending"]),
+                "incremental_cycles": state["incremental_cycles"],
+            }
+            for (list_name, ip_address), entry_id in state["router"].items():
+                document["router"].setdefault(list_name, {})[ip_address] = entry_id
+
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as snapshot_file:
+                json.dump(document, snapshot_file, separators=(",", ":"))
+            os.replace(tmp_path, self.path)
+            self.state = state
+            self._next = None
+
+    def discard(self):
+        """Forget the snapshot after a failed apply, so the next cycle runs a full diff."""
+        with self._lock:
+            self.state = None
+            self._next = None
+            if os.path.exists(self.path):
+                os.remove(self.path)
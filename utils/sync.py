@@ -0,0 +1,194 @@
+""" Diff engine turning desired and router state into one change plan for every managed list """
+
+import datetime
+import json
+import logging
+import os
+
+from utils import aggregate_client_addresses
+from utils.mikrotik import plan_list_moves
+
+logger = logging.getLogger(__name__)
+
+# Bumped whenever the plan file layout changes
+PLAN_FORMAT_VERSION = 1
+
+
+def index_desired_entries(client_addresses, list_statuses, aggregate_lists=()):
+    """Index the entries every managed list should hold, in one pass over the UISP addresses.
+
+    Args:
+        client_addresses (list): UISPClientAddress objects.
+        list_statuses (dict): Mapping of list name to status names, or None for every status.
+        aggregate_lists (iterable): Lists stored as collapsed prefixes rather than one entry per address.
+    Returns:
+        dict: Mapping of (list name, address) to the entry's comment.
+    """
+    desired = {}
+    to_aggregate = {list_name: [] for list_name in list_statuses if list_name in aggregate_lists}
+    for address in client_addresses:
+        for list_name, statuses in list_statuses.items():
+            if statuses is not None and address.service_status not in statuses:
+                continue
+            if list_name in to_aggregate:
+                to_aggregate[list_name].append(address)
+            else:
+                desired[(list_name, address.ip_address)] = address.comment
+
+    for list_name, addresses in to_aggregate.items():
+        for block in aggregate_client_addresses(addresses):
+            desired[(list_name, block.ip_address)] = block.comment
+    return desired
+
+
+def index_router_entries(router_lists):
+    """Index entries read from the router by (list name, address).
+
+    Args:
+        router_lists (dict): Mapping of list name to the entries on it, as from `get_address_lists`.
+    Returns:
+        dict: Mapping of (list name, address) to entry ID.
+    """
+    return {
+        (entry["list"], entry["address"]): entry[".id"]
+        for entries in router_lists.values()
+        for entry in entries or []
+    }
+
+
+def plan_sync(desired, current, list_names, move_lists=(), keys=None, list_sizes=None):
+    """Diff desired and router entries for every list in one pass.
+
+    Removals and additions of the same address between two of `move_lists` are paired into in-place
+    moves; see `plan_list_moves`.
+    Args:
+        desired (dict): Index from `index_desired_entries`.
+        current (dict): Index from `index_router_entries`.
+        list_names (iterable): Managed lists, in the order their changes are applied. Entries on other
+            lists are ignored.
+        move_lists (iterable): Lists whose entries move in place rather than being removed and re-added.
+        keys (iterable, optional): Only diff these (list name, address) keys, taking every other entry
+            as already in sync. `desired` then only needs to cover these keys.
+        list_sizes (dict, optional): Mapping of list name to the number of entries on the router,
+            required with `keys` to work out each list's expected count.
+    Returns:
+        dict: The change plan, with
+            - moves: List of moves, each with entry_id, ip_address, from_list, list_name and comment
+            - lists: Mapping of list name to its `add` and `remove` entries and the `expected_count`
+              of entries it holds once the plan is applied
+    """
+    lists = {
+        list_name: {"add": [], "remove": [], "expected_count": (list_sizes or {}).get(list_name, 0)}
+        for list_name in list_names
+    }
+
+    if keys is None:
+        on_router = current.items()
+        wanted = desired.items()
+    else:
+        on_router = [(key, current[key]) for key in keys if key in current]
+        wanted = [(key, desired[key]) for key in keys if key in desired]
+
+    for (list_name, ip_address), entry_id in on_router:
+        if list_name not in lists:
+            continue
+        if keys is None:
+            lists[list_name]["expected_count"] += 1
+        if (list_name, ip_address) not in desired:
+            lists[list_name]["remove"].append({"entry_id": entry_id, "ip_address": ip_address, "list_name": list_name})
+
+    for (list_name, ip_address), comment in wanted:
+        if list_name in lists and (list_name, ip_address) not in current:
+            lists[list_name]["add"].append({"ip_address": ip_address, "list_name": list_name, "comment": comment})
+
+    movable = [list_name for list_name in move_lists if list_name in lists]
+    moves, remaining_removals, remaining_additions = plan_list_moves(
+        [addr_data for list_name in movable for addr_data in lists[list_name]["remove"]],
+        [addr_data for list_name in movable for addr_data in lists[list_name]["add"]],
+    )
+    for list_name in movable:
+        lists[list_name]["remove"] = [addr_data for addr_data in remaining_removals if addr_data["list_name"] == list_name]
+        lists[list_name]["add"] = [addr_data for addr_data in remaining_additions if addr_data["list_name"] == list_name]
+    for move in moves:
+        lists[move["list_name"]]["expected_count"] += 1
+        lists[move["from_list"]]["expected_count"] -= 1
+
+    for changes in lists.values():
+        changes["expected_count"] += len(changes["add"]) - len(changes["remove"])
+    return {"moves": moves, "lists": lists}
+
+
+def apply_sync_plan(mikrotik_api, plan, aggregate_lists=()):
+    """Apply a change plan to a router: moves first, then each list's removals and additions.
+
+    Args:
+        mikrotik_api: Router API connection.
+        plan (dict): Plan from `plan_sync`.
+        aggregate_lists (iterable): Lists stored as prefixes, which add before removing so a prefix being
+            split or merged never leaves its addresses uncovered.
+    """
+    if plan["moves"]:
+        logger.info(f"Moving {len(plan['moves'])} addresses between lists")
+        mikrotik_api.bulk_move_addresses(plan["moves"])
+
+    for list_name, changes in plan["lists"].items():
+        if changes["add"] or changes["remove"]:
+            mikrotik_api.bulk_sync_address_list(
+                list_name=list_name,
+                addresses_to_add=changes["add"],
+                addresses_to_remove=changes["remove"],
+                expected_count=changes["expected_count"],
+                add_first=list_name in aggregate_lists,
+            )
+
+
+def summarize_plan(plan):
+    """Count each list's changes in a plan.
+
+    Returns:
+        dict: Mapping of list name to counts of `add`, `remove` and `move` (entries moved onto the list).
+    """
+    summary = {
+        list_name: {"add": len(changes["add"]), "remove": len(changes["remove"]), "move": 0}
+        for list_name, changes in plan["lists"].items()
+    }
+    for move in plan["moves"]:
+        summary[move["list_name"]]["move"] += 1
+    return summary
+
+
+def save_plans(path, plans, plan_seconds=None):
+    """Write router plans to `path` as compact JSON.
+
+    Args:
+        path (str): File to write.
+        plans (dict): Mapping of router name to its plan from `plan_sync`.
+        plan_seconds (dict, optional): Mapping of router name to the seconds spent computing its plan.
+    """
+    document = {
+        "version": PLAN_FORMAT_VERSION,
+        "created": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "routers": {
+            name: {
+                "plan_seconds": (plan_seconds or {}).get(name),
+                "summary": summarize_plan(plan),
+                "moves": plan["moves"],
+                "lists": plan["lists"],
+            }
+            for name, plan in plans.items()
+        },
+    }
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as plan_file:
+        json.dump(document, plan_file, separators=(",", ":"))
+    os.replace(tmp_path, path)
+
+
+def load_plans(path):
+    """Read router plans written by `save_plans`. Returns a mapping of router name to plan."""
+    with open(path, encoding="utf-8") as plan_file:
+        document = json.load(plan_file)
+    if document.get("version") != PLAN_FORMAT_VERSION:
+        raise ValueError(f"Unsupported plan file version {document.get('version')} in {path}")
+    return {name: {"moves": plan["moves"], "lists": plan["lists"]} for name, plan in document["routers"].items()}
@@ -35,6 +35,30 @@ class UISPApi(ApiEndpoint):
         devices = self.api_call(path=url)
         return devices
 
+    def get_device_addresses(self, roles: list = None):
+        """get devices in UISP, trimmed to the fields needed to match sites to IP addresses.
+
+        Interfaces are excluded on the server and everything but the name, site and IP address is
+        dropped after decoding, so the devices index stays small.
+        Args:
+            roles (list, optional): Only return devices with these roles, e.g. ["station", "router"].
+        """
+        url = "devices"
+        params = {"withInterfaces": "false"}
+        if roles:
+            params["role"] = roles
+        devices = self.api_call(path=url, params=params) or []
+        return [
+            {
+                "identification": {
+                    "name": (device.get("identification") or {}).get("name"),
+                    "site": (device.get("identification") or {}).get("site"),
+                },
+                "ipAddress": device.get("ipAddress"),
+            }
+            for device in devices
+        ]
+
     def get_sites(self):
         """get a list of sites in UISP."""
         url = "sites"
@@ -72,8 +96,40 @@ class UCRMApi(ApiEndpoint):
         clients = self.api_call(path=url)
         return clients
 
-    def get_services(self):
-        """get a list of services in UISP."""
+    def get_client(self, client_id: int):
+        """get a single client in UISP."""
+        url = f"clients/{client_id}"
+        client = self.api_call(path=url)
+        return client
+
+    def get_services(self, statuses: list = None, client_id: int = None):
+        """get a list of services in UISP.
+
+        Args:
+            statuses (list, optional): Only return services with these status codes.
+            client_id (int, optional): Only return services belonging to this client.
+        """
         url = "clients/services"
-        services = self.api_call(path=url)
+        params = {"statuses[]": statuses} if statuses else {}
+        if client_id is not None:
+            params["clientId"] = client_id
+        services = self.api_call(path=url, params=params)
         return services
+
+    def iter_clients(self, page_size: int = 500):
+        """iterate over clients in UISP, fetching them one page at a time."""
+        url = "clients"
+        for page in self.iter_pages(path=url, page_size=page_size):
+            yield from page
+
+    def iter_services(self, page_size: int = 500, statuses: list = None):
+        """iterate over services in UISP, fetching them one page at a time.
+
+        Args:
+            page_size (int): Number of services to request per page.
+            statuses (list, optional): Only return services with these status codes.
+        """
+        url = "clients/services"
+        params = {"statuses[]": statuses} if statuses else {}
+        for page in self.iter_pages(path=url, page_size=page_size, params=params):
+            yield from page
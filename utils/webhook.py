@@ -0,0 +1,313 @@
+""" Utility Methods for receiving UCRM webhook events """
+
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+from utils import index_devices_by_site, join_client_addresses, site_routers
+from utils.sync import index_desired_entries, plan_sync
+import json
+import logging
+import queue
+import threading
+
+logger = logging.getLogger(__name__)
+
+# UCRM events that can change which lists a client's IP belongs on
+HANDLED_EVENTS = {
+    "service.suspend",
+    "service.suspend_cancel",
+    "service.activate",
+    "service.end",
+    "service.edit",
+    "client.edit",
+}
+
+
+def event_client_id(event):
+    """Return the client Id affected by a UCRM webhook event, or None if it cannot be determined."""
+    entity = (event.get("extraData") or {}).get("entity") or {}
+    if event.get("entity") == "client":
+        client_id = event.get("entityId") or entity.get("id")
+    else:
+        client_id = entity.get("clientId")
+    try:
+        return int(client_id)
+    except (TypeError, ValueError):
+        return None
+
+
+class WebhookReceiver:
+    """Local HTTP receiver that queues UCRM webhook events for a handler.
+
+    Events are handled one at a time on a worker thread, in the order they arrived, so UCRM gets its
+    response straight away and a slow router never blocks the webhook sender.
+    """
+
+    def __init__(
+        self,
+        handler,
+        host: str = "0.0.0.0",
+        port: int = 8080,
+        token: str = None,
+        history_size: int = 1000,
+    ):
+        """Create webhook receiver.
+
+        Args:
+            handler (callable): Called with each accepted event.
+            host (str): Address to listen on.
+            port (int): Port to listen on, 0 picks a free port.
+            token (str, optional): Shared secret expected in the `token` query parameter.
+            history_size (int): Number of recent event uuids remembered to drop UCRM redeliveries.
+        """
+        self.handler = handler
+        self.host = host
+        self.port = port
+        self.token = token
+        self.events = queue.Queue()
+        self.seen_uuids = deque(maxlen=history_size)
+        self.server = None
+        self._threads = []
+
+    @property
+    def server_address(self):
+        """Return the (host, port) the receiver is listening on."""
+        return self.server.server_address
+
+    def start(self):
+        """Start listening and processing events on background threads."""
+        receiver = self
+
+        class RequestHandler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+                logger.debug(f"Webhook request: {format % args}")
+
+            def do_POST(self):
+                status, body = receiver.receive(self.path, self.rfile.read(int(self.headers.get("Content-Length") or 0)))
+                data = json.dumps(body).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+        self.server = ThreadingHTTPServer((self.host, self.port), RequestHandler)
+        self._threads = [
+            threading.Thread(target=self.server.serve_forever, name="webhook-server", daemon=True),
+            threading.Thread(target=self._process_events, name="webhook-worker", daemon=True),
+        ]
+        for thread in self._threads:
+            thread.start()
+        logger.info(f"Webhook receiver listening on {self.server_address[0]}:{self.server_address[1]}")
+
+    def stop(self):
+        """Stop listening and let the worker drain queued events."""
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+        self.events.put(None)
+        for thread in self._threads:
+            thread.join(timeout=5)
+
+    def receive(self, path, raw_body):
+        """Validate and queue a webhook request. Returns an HTTP status code and response body."""
+        if self.token:
+            token = parse_qs(urlparse(path).query).get("token", [None])[0]
+            if token != self.token:
+                logger.warning("Rejected webhook request with missing or invalid token")
+                return 403, {"status": "forbidden"}
+
+        try:
+            event = json.loads(raw_body or b"{}")
+        except json.JSONDecodeError as err:
+            logger.error(f"Error decoding webhook payload as JSON: {err}")
+            return 400, {"status": "invalid json"}
+
+        event_name = event.get("eventName")
+        if event_name not in HANDLED_EVENTS:
+            logger.debug(f"Ignoring webhook event '{event_name}'")
+            return 200, {"status": "ignored"}
+
+        uuid = event.get("uuid")
+        if uuid and uuid in self.seen_uuids:
+            logger.debug(f"Ignoring redelivered webhook event {uuid}")
+            return 200, {"status": "duplicate"}
+        if uuid:
+            self.seen_uuids.append(uuid)
+
+        logger.info(f"Queued webhook event '{event_name}' for {event.get('entity')} {event.get('entityId')}")
+        self.events.put(event)
+        return 200, {"status": "queued"}
+
+    def _process_events(self):
+        """Hand queued events to the handler until stopped."""
+        while True:
+            event = self.events.get()
+            try:
+                if event is None:
+                    return
+                self.handler(event)
+            except Exception as err:
+                logger.error(f"Error handling webhook event '{event.get('eventName')}': {err}")
+            finally:
+                self.events.task_done()
+
+
+class IncrementalSync:
+    """Apply a single client's changes to the router in response to a webhook event.
+
+    Holds the devices index and client IPs from the last full sync, so an event costs a couple of
+    UCRM requests and a handful of router requests instead of a full download.
+    """
+
+    def __init__(
+        self,
+        ucrm_api,
+        uisp_api,
+        mikrotik_api=None,
+        list_statuses=None,
+        lock=None,
+        roles=None,
+        fallback_allocator=None,
+        exclude_fallback=False,
+        mikrotik_apis=None,
+        router_sites=None,
+        aggregate_lists=None,
+        move_lists=(),
+    ):
+        """Create incremental sync.
+
+        Args:
+            ucrm_api (UCRMApi): UCRM API connection.
+            uisp_api (UISPApi): NMS API connection, used when no full sync has loaded devices yet.
+            mikrotik_api (MikroTikApi): Router API connection, when syncing a single router.
+            list_statuses (dict): Mapping of list name to status names, or None for every status.
+            lock (threading.Lock, optional): Lock shared with the full sync so they never interleave.
+            roles (list, optional): Device roles to fetch when loading devices.
+            fallback_allocator (FallbackAllocator, optional): Assigns stable IPs to devices without one.
+            exclude_fallback (bool): Skip clients whose device has no IP instead of using a fallback.
+            mikrotik_apis (dict, optional): Router API connections keyed by router name, instead of `mikrotik_api`.
+            router_sites (dict, optional): Mapping of router name to the set of site Ids it serves, or None for
+                every site. Routers missing from the mapping serve every site.
+            aggregate_lists (dict, optional): Mapping of router name to the lists it stores as collapsed
+                prefixes. Those lists are left to the full sync, since one client's change can split or
+                merge a prefix shared with other clients.
+            move_lists (iterable): Lists whose entries move in place when a client's status changes between
+                them, so the address is never missing from both.
+        """
+        self.ucrm_api = ucrm_api
+        self.uisp_api = uisp_api
+        self.mikrotik_apis = mikrotik_apis or {"default": mikrotik_api}
+        self.list_statuses = list_statuses
+        self.lock = lock or threading.Lock()
+        self.roles = roles
+        self.fallback_allocator = fallback_allocator
+        self.exclude_fallback = exclude_fallback
+        self.router_sites = {name: (router_sites or {}).get(name) for name in self.mikrotik_apis}
+        self.aggregate_lists = {name: set((aggregate_lists or {}).get(name) or ()) for name in self.mikrotik_apis}
+        self.move_lists = tuple(move_lists)
+        self.devices_by_site = None
+        self.site_parents = {}
+        self.client_ips = {}
+
+    def update_state(self, devices_by_site, client_addresses, site_parents=None):
+        """Refresh the devices index, site ancestry and client IPs after a full sync."""
+        client_ips = {}
+        for address in client_addresses:
+            client_ips.setdefault(address.client_id, set()).add(address.ip_address)
+        self.devices_by_site = devices_by_site
+        self.site_parents = site_parents or {}
+        self.client_ips = client_ips
+
+    def handle_event(self, event):
+        """Sync the client affected by a webhook event."""
+        client_id = event_client_id(event)
+        if client_id is None:
+            logger.warning(f"Webhook event '{event.get('eventName')}' has no client Id, waiting for full sync")
+            return
+        with self.lock:
+            self.sync_client(client_id)
+
+    def sync_client(self, client_id):
+        """Bring one client's address-list entries in line with UCRM."""
+        if self.devices_by_site is None:
+            self.devices_by_site = index_devices_by_site(self.uisp_api.get_device_addresses(roles=self.roles))
+
+        client = self.ucrm_api.get_client(client_id)
+        services = self.ucrm_api.get_services(client_id=client_id) or []
+        client_addresses = join_client_addresses(
+            clients=[client] if client else [],
+            services=services,
+            devices=self.devices_by_site,
+            warn_missing_service=False,
+            fallback_allocator=self.fallback_allocator,
+            exclude_fallback=self.exclude_fallback,
+        )
+        if self.fallback_allocator is not None:
+            self.fallback_allocator.save()
+
+        # Each router only gets the services at the sites it serves
+        addresses_by_router = {name: [] for name in self.mikrotik_apis}
+        for address in client_addresses:
+            for name in site_routers(address.site_id, self.router_sites, self.site_parents):
+                addresses_by_router[name].append(address)
+        desired_by_router = {
+            name: index_desired_entries(
+                addresses,
+                {
+                    list_name: statuses
+                    for list_name, statuses in self.list_statuses.items()
+                    if list_name not in self.aggregate_lists[name]
+                },
+            )
+            for name, addresses in addresses_by_router.items()
+        }
+
+        # Look at the IPs the client had at the last sync as well as its current ones, on every router,
+        # so a service that moved site is removed from the router that no longer serves it
+        current_ips = {ip for desired in desired_by_router.values() for _list_name, ip in desired}
+        touched_ips = self.client_ips.get(client_id, set()) | current_ips
+        for name, mikrotik_api in self.mikrotik_apis.items():
+            try:
+                added, removed, moved = self.sync_router(
+                    mikrotik_api, desired_by_router[name], touched_ips, skip_lists=self.aggregate_lists[name]
+                )
+            except Exception as err:
+                logger.error(f"Incremental sync for client {client_id} on router '{name}' failed: {err}")
+                continue
+            logger.info(
+                f"Incremental sync for client {client_id} on router '{name}': "
+                f"{added} added, {removed} removed, {moved} moved"
+            )
+
+        self.client_ips[client_id] = current_ips
+
+    def sync_router(self, mikrotik_api, desired, touched_ips, skip_lists=()):
+        """Apply one client's desired entries to a router, leaving `skip_lists` alone.
+
+        Planned like a full sync, so a status change between move lists is one in-place move.
+        Returns:
+            tuple: The number of entries added, removed and moved.
+        """
+        list_names = [list_name for list_name in self.list_statuses if list_name not in skip_lists]
+        current = {}
+        for ip in touched_ips:
+            for entry in mikrotik_api.get_address_entries(address=ip) or []:
+                if entry.get("list") in list_names:
+                    current[(entry["list"], entry["address"])] = entry[".id"]
+
+        plan = plan_sync(desired, current, list_names, move_lists=self.move_lists)
+        for move in plan["moves"]:
+            mikrotik_api.move_address_to_list(move["entry_id"], move["list_name"], move["comment"])
+        added = 0
+        removed = 0
+        for changes in plan["lists"].values():
+            for addr_data in changes["remove"]:
+                mikrotik_api.remove_address_from_list(addr_data["entry_id"])
+                removed += 1
+            for addr_data in changes["add"]:
+                mikrotik_api.add_address_to_list(
+                    ip_address=addr_data["ip_address"], list_name=addr_data["list_name"], comment=addr_data["comment"]
+                )
+                added += 1
+        return added, removed, len(plan["moves"])
@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+"""
+Stand-in for UCRM that posts sample webhook events to the receiver.
+
+Use it to check a running receiver (`job.py` with `[WEBHOOK] enabled = True`)
+applies single-client changes without waiting for the next full sync.
+"""
+
+import argparse
+import json
+import uuid
+import requests
+
+SAMPLE_EVENTS = ["service.suspend", "service.suspend_cancel", "service.activate", "service.end", "client.edit"]
+
+
+def build_event(event_name, client_id, service_id):
+    """Build a payload shaped like the ones UCRM posts for `event_name`."""
+    entity, change_type = event_name.split(".", 1)
+    if entity == "client":
+        entity_id = client_id
+        entity_data = {"id": client_id}
+    else:
+        entity_id = service_id
+        entity_data = {"id": service_id, "clientId": client_id}
+    return {
+        "uuid": str(uuid.uuid4()),
+        "changeType": change_type,
+        "entity": entity,
+        "entityId": str(entity_id),
+        "eventName": event_name,
+        "extraData": {"entity": entity_data, "entityBeforeEdit": None},
+    }
+
+
+def parse_arguments():
+    """Parse command line arguments."""
+    parser = argparse.ArgumentParser(description="Post sample UCRM webhook events")
+    parser.add_argument("--url", default="http://127.0.0.1:8080/", help="Webhook receiver URL")
+    parser.add_argument("--token", default=None, help="Shared secret configured in [WEBHOOK] token")
+    parser.add_argument("--event", choices=SAMPLE_EVENTS, default="service.suspend", help="Event to send")
+    parser.add_argument("--client-id", type=int, required=True, help="UCRM client Id")
+    parser.add_argument("--service-id", type=int, default=0, help="UCRM service Id")
+    return parser.parse_args()
+
+
+def main():
+    """Post one sample event and print the receiver's answer."""
+    args = parse_arguments()
+    event = build_event(args.event, args.client_id, args.service_id)
+    params = {"token": args.token} if args.token else {}
+
+    print(f"Posting {json.dumps(event)}")
+    response = requests.post(args.url, params=params, json=event, timeout=10)
+    print(f"{response.status_code}: {response.text}")
+
+
+if __name__ == "__main__":
+    main()